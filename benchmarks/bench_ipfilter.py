@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Cost of ip-filter checks as the CIDR list grows, against a linear scan
+
+Usage: python benchmarks/bench_ipfilter.py [--sizes 10,1000,10000,50000]
+"""
+
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from middleware.ipfilter import IPFilter  # noqa: E402
+
+def threat_feed(size: int, rng: random.Random):
+    """Mostly /24 to /32 IPv4 networks with some IPv6 ones, as block lists tend to be"""
+    cidrs = []
+    for i in range(size):
+        if i % 10 == 9:
+            cidrs.append(str(ipaddress.ip_network((rng.getrandbits(128), rng.randint(32, 64)), strict=False)))
+        else:
+            cidrs.append(str(ipaddress.ip_network((rng.getrandbits(32), rng.randint(24, 32)), strict=False)))
+    return cidrs
+
+class LinearFilter:
+    """Every network checked in turn, the straightforward alternative"""
+    
+    def __init__(self, blocked):
+        self.blocked = [ipaddress.ip_network(cidr) for cidr in blocked]
+    
+    def is_allowed(self, ip: str) -> bool:
+        address = ipaddress.ip_address(ip)
+        return not any(address in network for network in self.blocked)
+
+def ns_per_call(ip_filter, addresses, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for address in addresses:
+            ip_filter.is_allowed(address)
+        best = min(best, time.perf_counter() - start)
+    return best / len(addresses) * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10,1000,10000,50000", help="comma-separated CIDR counts")
+    parser.add_argument("--linear-max", type=int, default=1000, help="largest size to time the linear scan at")
+    args = parser.parse_args()
+    
+    rng = random.Random(0)
+    addresses = [str(ipaddress.ip_address(rng.getrandbits(32))) for _ in range(2000)]
+    addresses += [str(ipaddress.ip_address(rng.getrandbits(128))) for _ in range(200)]
+    
+    print(f"{'cidrs':>7} {'build ms':>9} {'memory KB':>10} {'trie ns':>8} {'linear ns':>10}")
+    for size in (int(n) for n in args.sizes.split(",")):
+        blocked = threat_feed(size, rng)
+        start = time.perf_counter()
+        ip_filter = IPFilter(blocked=blocked)
+        build_ms = (time.perf_counter() - start) * 1000
+        # Built again under tracemalloc, which slows it down
+        tracemalloc.start()
+        traced = IPFilter(blocked=blocked)
+        memory_kb = tracemalloc.get_traced_memory()[0] / 1024
+        tracemalloc.stop()
+        del traced
+        trie = ns_per_call(ip_filter, addresses)
+        linear = "-"
+        if size <= args.linear_max:
+            linear = f"{ns_per_call(LinearFilter(blocked), addresses[:200], 1):.0f}"
+        print(f"{size:>7} {build_ms:>9.1f} {memory_kb:>10.0f} {trie:>8.0f} {linear:>10}")
+
+if __name__ == "__main__":
+    main()
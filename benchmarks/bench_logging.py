@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Requests per second through POST /events with logging off, written in the request as before, queued
+to the logging thread, and queued with sampling
+
+Requests are driven in process straight into the ASGI app, as in bench_middleware.py,
+and every request logs two info lines. Log lines go to a file, and again through a
+sink that blocks on every write, like stdout when the container log driver falls behind.
+
+Usage: python benchmarks/bench_logging.py [--requests 3000] [--write-latency-us 50] [--output /tmp/bench.log]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import structlog
+from starlette.middleware import Middleware
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Requests are sent with the built-in development API keys
+os.environ.setdefault("ENVIRONMENT", "development")
+
+import main  # noqa: E402
+from bench_middleware import NullSender, build_app, requests_per_second  # noqa: E402
+from middleware import logs  # noqa: E402
+from middleware.policy import RateLimitRule  # noqa: E402
+from middleware.security import SecurityASGIMiddleware, security_middleware  # noqa: E402
+
+class SlowSink:
+    """A stream whose writes block for a fixed time"""
+    
+    def __init__(self, stream, latency: float):
+        self.stream = stream
+        self.latency = latency
+    
+    def write(self, text: str):
+        time.sleep(self.latency)
+        self.stream.write(text)
+    
+    def flush(self):
+        self.stream.flush()
+
+def configure_before(stream):
+    """The previous setup: JSONRenderer in the structlog chain and a stdlib handler writing in the call"""
+    logs.shutdown()
+    logging._srcfile = os.path.normcase(logging.addLevelName.__code__.co_filename)
+    logging.logThreads = logging.logProcesses = logging.logMultiprocessing = True
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(logging.StreamHandler(stream))
+    root.setLevel(logging.INFO)
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            structlog.stdlib.add_logger_name,
+            structlog.stdlib.add_log_level,
+            structlog.stdlib.PositionalArgumentsFormatter(),
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.processors.StackInfoRenderer(),
+            structlog.processors.format_exc_info,
+            structlog.processors.UnicodeDecoder(),
+            structlog.processors.JSONRenderer()
+        ],
+        context_class=dict,
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=False,
+    )
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=3000, help="requests per measurement")
+    parser.add_argument("--write-latency-us", type=float, default=50, help="time each write blocks for in the slow sink")
+    parser.add_argument("--output", help="log file (default: a temporary file)")
+    args = parser.parse_args()
+    
+    main.service_bus_client = object()
+    main.service_bus_sender = NullSender()
+    key = next(key for key in security_middleware.api_key_validator.keys if key.key_id == "dev")
+    security_middleware.apply_api_keys([
+        key._replace(rate_limits={**key.rate_limits, "/events": RateLimitRule(10 ** 9, 60)})
+    ])
+    app = build_app(Middleware(SecurityASGIMiddleware), with_metrics=False)
+    body = b'{"event_type": "user_action", "data": {"user_id": "user-123"}}'
+    
+    if args.output:
+        output = open(args.output, "w")
+    else:
+        output = tempfile.NamedTemporaryFile("w", suffix=".log", delete=False)
+    sinks = {"file": output, "slow sink": SlowSink(output, args.write_latency_us / 1e6)}
+    candidates = {
+        "off": lambda stream: logs.configure(level="warning", stream=stream),
+        "in request (before)": configure_before,
+        "in request, orjson": lambda stream: logs.configure(queue_size=0, stream=stream),
+        "queued, orjson": lambda stream: logs.configure(stream=stream),
+        "queued, sampled 1%": lambda stream: logs.configure(stream=stream, sampler=logs.LogSampler(0.01)),
+    }
+    print(f"{'logging':<24}" + "".join(f"{name:>14}{'dropped':>10}" for name in sinks) + "   (requests/s)")
+    for name, configure in candidates.items():
+        row = f"{name:<24}"
+        for stream in sinks.values():
+            configure(stream)
+            rate = asyncio.run(requests_per_second(app, "POST", "/events", body, args.requests))
+            # Lines the thread couldn't keep up with; then let it finish before the next run
+            dropped = logs.stats()["dropped"]
+            logs.shutdown()
+            row += f"{rate:>14,.0f}{dropped:>10,}"
+        print(row)
+    output.close()
+    if not args.output:
+        os.unlink(output.name)
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Requests per second through the app with the ASGI security middleware versus the previous
+BaseHTTPMiddleware wrapping, and with the Prometheus metrics middleware added
+
+Requests are driven in process straight into the ASGI app, so the numbers are
+framework and middleware cost only, with Service Bus replaced by a no-op sender.
+
+Usage: python benchmarks/bench_middleware.py [--requests 3000]
+"""
+
+import argparse
+import asyncio
+import copy
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Requests are sent with the built-in development API keys
+os.environ.setdefault("ENVIRONMENT", "development")
+
+from fastapi import status  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from starlette.middleware import Middleware  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+import main  # noqa: E402
+from middleware.metrics import MetricsASGIMiddleware  # noqa: E402
+from middleware.policy import CompiledPolicy, RateLimitRule  # noqa: E402
+from middleware.security import (  # noqa: E402
+    REFUNDED_STATUS_CODES,
+    SecurityASGIMiddleware,
+    security_middleware,
+)
+
+async def security_check(request, call_next):
+    """The previous middleware: app.middleware("http") around the same checks"""
+    is_valid, error_message = await security_middleware.validate_request(request.scope)
+    if not is_valid:
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS if "rate limit" in error_message.lower()
+                       else status.HTTP_401_UNAUTHORIZED,
+            content={
+                "error": "Security validation failed",
+                "message": error_message,
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        )
+    response = await call_next(request)
+    if response.status_code in REFUNDED_STATUS_CODES:
+        await security_middleware.refund(request.scope)
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    response.headers["X-Frame-Options"] = "DENY"
+    response.headers["X-XSS-Protection"] = "1; mode=block"
+    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+    return response
+
+class NullSender:
+    async def send_messages(self, message, timeout=None):
+        pass
+
+def build_app(security: Middleware, with_metrics: bool = True):
+    main.app.user_middleware = [
+        m for m in main.app.user_middleware
+        if m.cls not in (SecurityASGIMiddleware, BaseHTTPMiddleware, MetricsASGIMiddleware)
+    ]
+    main.app.user_middleware.insert(0, security)
+    if with_metrics:
+        main.app.user_middleware.insert(0, Middleware(MetricsASGIMiddleware, routes=main.app.routes))
+    main.app.middleware_stack = None
+    return main.app.build_middleware_stack()
+
+def make_request(method: str, path: str, body: bytes = b""):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"testserver"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"x-api-key", b"dev-api-key-123"),
+        ],
+        "client": ("10.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    return scope, body
+
+async def requests_per_second(app, method: str, path: str, body: bytes, count: int) -> float:
+    async def call():
+        scope, payload = make_request(method, path, body)
+        messages = [{"type": "http.request", "body": payload, "more_body": False}]
+        
+        async def receive():
+            if messages:
+                return messages.pop()
+            # Like a client that stays connected until the response is done
+            await asyncio.Event().wait()
+        
+        async def send(message):
+            if message["type"] == "http.response.start" and message["status"] != 200:
+                raise RuntimeError(f"{path} returned {message['status']}")
+        
+        await app(scope, receive, send)
+    
+    for _ in range(min(200, count)):
+        await call()
+    start = time.perf_counter()
+    for _ in range(count):
+        await call()
+    return count / (time.perf_counter() - start)
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=3000, help="requests per measurement")
+    args = parser.parse_args()
+    
+    main.service_bus_client = object()
+    main.service_bus_sender = NullSender()
+    # Lift the limits so every request reaches the endpoint
+    key = next(key for key in security_middleware.api_key_validator.keys if key.key_id == "dev")
+    security_middleware.apply_api_keys([
+        key._replace(rate_limits={**key.rate_limits, "/events": RateLimitRule(10 ** 9, 60)})
+    ])
+    document = copy.deepcopy(security_middleware.policy.document)
+    for policy in document["policies"]:
+        if policy["type"] == "rate-limit":
+            for rule in policy["rules"]:
+                rule["limit"] = 10 ** 9
+    security_middleware.policy = CompiledPolicy(document)
+    
+    candidates = {
+        "BaseHTTPMiddleware (before)": (Middleware(BaseHTTPMiddleware, dispatch=security_check), False),
+        "ASGI": (Middleware(SecurityASGIMiddleware), False),
+        "ASGI + metrics": (Middleware(SecurityASGIMiddleware), True),
+    }
+    endpoints = {
+        "GET /health": ("GET", "/health", b""),
+        "POST /events": ("POST", "/events", b'{"event_type": "user_action", "data": {"user_id": "user-123"}}'),
+    }
+    print(f"{'middleware':<28}" + "".join(f"{name:>16}" for name in endpoints) + "   (requests/s)")
+    for name, (middleware, with_metrics) in candidates.items():
+        app = build_app(middleware, with_metrics)
+        rates = [
+            asyncio.run(requests_per_second(app, method, path, body, args.requests))
+            for method, path, body in endpoints.values()
+        ]
+        print(f"{name:<28}" + "".join(f"{rate:>16,.0f}" for rate in rates))
+
+if __name__ == "__main__":
+    main_()
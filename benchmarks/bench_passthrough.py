@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark of /events body handling: full parse and re-encode versus raw `data` passthrough
+
+Usage: python benchmarks/bench_passthrough.py [--seconds 0.5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import EventPayload, build_service_bus_message  # noqa: E402
+from messaging import passthrough  # noqa: E402
+
+def request_body(readings: int) -> bytes:
+    return json.dumps({
+        "event_type": "sensor_batch",
+        "data": {
+            "device": "edge-17",
+            "readings": [
+                {"sensor": f"s-{i}", "value": i * 0.125, "unit": "celsius", "ok": True, "note": None}
+                for i in range(readings)
+            ]
+        },
+        "source": "edge",
+        "correlation_id": "req-7f1c2a9e"
+    }).encode('utf-8')
+
+BODIES = {"50KB": request_body(700), "200KB": request_body(2800), "500KB": request_body(7000)}
+
+def parsed(body: bytes):
+    """The default route: FastAPI decodes the body and validates it into EventPayload"""
+    return build_service_bus_message(EventPayload.model_validate(json.loads(body)))
+
+def raw(body: bytes):
+    return build_service_bus_message(passthrough.parse_event(body))
+
+def bench(func, body: bytes, seconds: float) -> float:
+    timer = timeit.Timer(lambda: func(body))
+    number, _ = timer.autorange()
+    runs = max(1, int(number * seconds / 0.2))
+    best = min(timer.repeat(repeat=3, number=runs))
+    return runs / best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=0.5, help="approximate time per measurement")
+    args = parser.parse_args()
+    if not passthrough.AVAILABLE:
+        sys.exit("msgspec is not installed")
+    
+    candidates = {"parse + encode": parsed, "passthrough": raw}
+    print(f"{'body':<8} {'bytes':>8}" + "".join(f"{name:>16}" for name in candidates) + "   (ops/s)")
+    for name, body in BODIES.items():
+        rates = [bench(func, body, args.seconds) for func in candidates.values()]
+        print(f"{name:<8} {len(body):>8}" + "".join(f"{rate:>16,.0f}" for rate in rates))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the JSON serializer backends on representative event bodies
+
+Usage: python benchmarks/bench_serializers.py [--seconds 0.5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from messaging.serialization import BACKENDS  # noqa: E402
+
+def event_body(data):
+    return {
+        "event_type": "user_action",
+        "data": data,
+        "source": "web_app",
+        "correlation_id": "req-7f1c2a9e",
+        "timestamp": datetime.utcnow(),
+        "message_id": "evt_20240101_000000_000000_1a2b3c4d"
+    }
+
+PAYLOADS = {
+    "small": event_body({"user_id": "user-123", "action": "login"}),
+    "medium": event_body({
+        "order_id": "order-456",
+        "customer": {"id": 42, "name": "Ada Lovelace", "tier": "gold", "tags": ["b2b", "emea"]},
+        "lines": [
+            {"sku": f"SKU-{i:05d}", "qty": i % 7 + 1, "price": 19.99 + i, "discounted": i % 2 == 0}
+            for i in range(20)
+        ],
+        "currency": "USD"
+    }),
+    "large": event_body({
+        "readings": [
+            {"sensor": f"s-{i}", "value": i * 0.125, "unit": "celsius", "ok": True, "note": None}
+            for i in range(800)
+        ]
+    })
+}
+
+def baseline_dumps(value):
+    """What build_service_bus_message did before: isoformat by hand, str, then encode"""
+    value = dict(value, timestamp=value["timestamp"].isoformat())
+    return json.dumps(value).encode('utf-8')
+
+def bench(func, payload, seconds: float) -> float:
+    timer = timeit.Timer(lambda: func(payload))
+    number, _ = timer.autorange()
+    runs = max(1, int(number * seconds / 0.2))
+    best = min(timer.repeat(repeat=3, number=runs))
+    return runs / best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=0.5, help="approximate time per measurement")
+    args = parser.parse_args()
+    
+    candidates = {"json (before)": baseline_dumps, **BACKENDS}
+    print(f"{'payload':<8} {'bytes':>7}" + "".join(f"{name:>16}" for name in candidates) + "   (ops/s)")
+    for name, payload in PAYLOADS.items():
+        size = len(baseline_dumps(payload))
+        rates = [bench(func, payload, args.seconds) for func in candidates.values()]
+        print(f"{name:<8} {size:>7}" + "".join(f"{rate:>16,.0f}" for rate in rates))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Shared test doubles for the Service Bus publishing components
+"""
+
+import asyncio
+import os
+from typing import List, Optional
+
+import pytest
+from azure.servicebus import ServiceBusMessage, ServiceBusMessageBatch
+
+# The app is imported by tests with the built-in development API keys
+os.environ.setdefault("ENVIRONMENT", "development")
+
+STANDARD_TIER_MAX_BYTES = 256 * 1024
+
+class FakeServiceBusSender:
+    """In-memory stand-in for azure.servicebus.aio.ServiceBusSender"""
+    
+    def __init__(self, max_size_in_bytes: int = STANDARD_TIER_MAX_BYTES, send_delay: float = 0):
+        self.max_size_in_bytes = max_size_in_bytes
+        self.send_delay = send_delay
+        self.sent_batches: List[List[ServiceBusMessage]] = []
+        self.fail_with: Optional[Exception] = None
+        self.closed = False
+    
+    async def create_message_batch(self, max_size_in_bytes: Optional[int] = None) -> ServiceBusMessageBatch:
+        return ServiceBusMessageBatch(max_size_in_bytes=max_size_in_bytes or self.max_size_in_bytes)
+    
+    async def send_messages(self, message, timeout: Optional[float] = None):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        if self.fail_with:
+            raise self.fail_with
+        if isinstance(message, ServiceBusMessageBatch):
+            self.sent_batches.append(list(message._messages))
+        elif isinstance(message, list):
+            self.sent_batches.append(list(message))
+        else:
+            self.sent_batches.append([message])
+    
+    async def close(self):
+        self.closed = True
+    
+    @property
+    def sent_messages(self) -> List[ServiceBusMessage]:
+        return [message for batch in self.sent_batches for message in batch]
+
+@pytest.fixture
+def fake_sender() -> FakeServiceBusSender:
+    return FakeServiceBusSender()
@@ -8,7 +8,10 @@ param(
     [string]$ContainerAppEnvironment = "service-bus-event-generator-env",
     [string]$ContainerRegistry = "your-registry.azurecr.io",
     [string]$ImageName = "service-bus-event-generator",
-    [string]$ImageTag = "latest"
+    [string]$ImageTag = "latest",
+    # API keys file (YAML of salted key hashes) and the salt they were hashed with
+    [string]$ApiKeysPath = "api-keys.yaml",
+    [string]$ApiKeySalt = $env:API_KEY_SALT
 )
 
 # Error handling
@@ -110,6 +113,11 @@ function New-ResourceGroup {
 function Deploy-Infrastructure {
     Write-Info "Deploying infrastructure using Bicep template..."
     
+    if (-not (Test-Path $ApiKeysPath) -or -not $ApiKeySalt) {
+        throw "Set -ApiKeysPath to the API keys file and -ApiKeySalt to its salt"
+    }
+    $apiKeys = Get-Content $ApiKeysPath -Raw
+    
     az deployment group create `
         --resource-group $ResourceGroup `
         --template-file deploy-aca.bicep `
@@ -118,6 +126,8 @@ function Deploy-Infrastructure {
             containerAppEnvironmentName=$ContainerAppEnvironment `
             containerImage="${ContainerRegistry}/${ImageName}:${ImageTag}" `
             location=$Location `
+            apiKeys=$apiKeys `
+            apiKeySalt=$ApiKeySalt `
         --output table
     
     if ($LASTEXITCODE -ne 0) {
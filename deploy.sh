@@ -13,6 +13,9 @@ CONTAINER_APP_ENVIRONMENT="${CONTAINER_APP_ENVIRONMENT:-service-bus-event-genera
 CONTAINER_REGISTRY="${CONTAINER_REGISTRY:-your-registry.azurecr.io}"
 IMAGE_NAME="${IMAGE_NAME:-service-bus-event-generator}"
 IMAGE_TAG="${IMAGE_TAG:-latest}"
+# API keys file (YAML of salted key hashes) and the salt they were hashed with
+API_KEYS_PATH="${API_KEYS_PATH:-api-keys.yaml}"
+API_KEY_SALT="${API_KEY_SALT:-}"
 
 # Colors for output
 RED='\033[0;31m'
@@ -93,6 +96,11 @@ create_resource_group() {
 deploy_infrastructure() {
     log_info "Deploying infrastructure using Bicep template..."
     
+    if [ ! -f "${API_KEYS_PATH}" ] || [ -z "${API_KEY_SALT}" ]; then
+        log_error "Set API_KEYS_PATH to the API keys file and API_KEY_SALT to its salt"
+        exit 1
+    fi
+    
     az deployment group create \
         --resource-group ${RESOURCE_GROUP} \
         --template-file deploy-aca.bicep \
@@ -101,6 +109,8 @@ deploy_infrastructure() {
             containerAppEnvironmentName=${CONTAINER_APP_ENVIRONMENT} \
             containerImage=${CONTAINER_REGISTRY}/${IMAGE_NAME}:${IMAGE_TAG} \
             location=${LOCATION} \
+            apiKeys="$(cat "${API_KEYS_PATH}")" \
+            apiKeySalt="${API_KEY_SALT}" \
         --output table
     
     log_info "Infrastructure deployed successfully"
@@ -5,49 +5,75 @@ Designed to run on Azure Container Apps (ACA) with DPAR support.
 """
 
 import asyncio
-import json
 import logging
+import math
 import os
+import uuid
+from contextlib import AsyncExitStack
 from datetime import datetime
 from typing import Any, Dict, Optional
 
 import structlog
-from azure.identity import DefaultAzureCredential
-from azure.servicebus import ServiceBusClient, ServiceBusMessage
-from fastapi import FastAPI, HTTPException, Request, status
+from azure.identity.aio import DefaultAzureCredential
+from azure.servicebus import ServiceBusMessage
+from azure.servicebus.aio import ServiceBusClient, ServiceBusSender
+from fastapi import FastAPI, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
-from middleware.security import security_check
-
-# Configure structured logging
-structlog.configure(
-    processors=[
-        structlog.stdlib.filter_by_level,
-        structlog.stdlib.add_logger_name,
-        structlog.stdlib.add_log_level,
-        structlog.stdlib.PositionalArgumentsFormatter(),
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.StackInfoRenderer(),
-        structlog.processors.format_exc_info,
-        structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
-    ],
-    context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
-    cache_logger_on_first_use=True,
+from messaging import passthrough, serialization
+from messaging.batching import send_packed
+from messaging.breaker import CircuitBreaker, CircuitOpenError
+from messaging.coalescer import EventCoalescer
+from messaging.ingest import IngestQueue
+from messaging.outbox import EventOutbox, OutboxFullError
+from messaging.pool import SenderPool
+from messaging.retry import RetryBudget, RetryPolicy
+from middleware import logs, metrics, tracing
+from middleware.metrics import InstrumentedSender, MetricsASGIMiddleware, StatsCollector
+from middleware.overload import LoadSheddingASGIMiddleware, SaturationMonitor
+from middleware.tracing import TracingASGIMiddleware
+from middleware.security import SecurityASGIMiddleware, security_middleware
+
+# Structured JSON logging, rendered and written off the event loop
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+# Records held for the logging thread (0 writes in the logging call); when full, drop or block
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_QUEUE_OVERFLOW = os.getenv("LOG_QUEUE_OVERFLOW", "drop").lower()
+# Debug and info lines: the first LOG_SAMPLE_BURST per message each second are kept, then
+# LOG_SAMPLE_RATE of them (1.0 keeps everything), with a rollup of what was dropped per interval
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "10"))
+LOG_ROLLUP_INTERVAL_S = float(os.getenv("LOG_ROLLUP_INTERVAL_S", "10"))
+LOG_ROLLUP_FIELDS = [f.strip() for f in os.getenv("LOG_ROLLUP_FIELDS", "event_type").split(",") if f.strip()]
+logs.configure(
+    level=LOG_LEVEL,
+    queue_size=LOG_QUEUE_SIZE,
+    overflow=LOG_QUEUE_OVERFLOW,
+    sampler=logs.LogSampler(
+        LOG_SAMPLE_RATE,
+        burst=LOG_SAMPLE_BURST,
+        rollup_interval=LOG_ROLLUP_INTERVAL_S,
+        rollup_fields=LOG_ROLLUP_FIELDS
+    ) if LOG_SAMPLE_RATE < 1 else None
 )
 
 logger = structlog.get_logger()
 
+class EventJSONResponse(JSONResponse):
+    """JSON response rendered with the configured serializer backend"""
+    
+    def render(self, content: Any) -> bytes:
+        return serialization.dumps(content)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Azure Service Bus Event Generator",
     description="API to receive payloads and generate events in Azure Service Bus",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=EventJSONResponse
 )
 
 # Add CORS middleware
@@ -60,7 +86,51 @@ app.add_middleware(
 )
 
 # Add security middleware
-app.middleware("http")(security_check)
+app.add_middleware(SecurityASGIMiddleware)
+
+# Event loop lag sampling, and load shedding for /events and /events/batch in front of the security
+# checks: 503 while the loop lags by more than LOAD_SHED_LAG_MS or LOAD_SHED_MAX_IN_FLIGHT requests
+# are already in flight (0 disables either)
+LOOP_MONITOR_INTERVAL_MS = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100"))
+LOAD_SHED_LAG_MS = float(os.getenv("LOAD_SHED_LAG_MS", "250"))
+LOAD_SHED_MAX_IN_FLIGHT = int(os.getenv("LOAD_SHED_MAX_IN_FLIGHT", "0"))
+LOAD_SHED_RETRY_AFTER_SECONDS = int(os.getenv("LOAD_SHED_RETRY_AFTER_SECONDS", "1"))
+saturation_monitor = SaturationMonitor(
+    interval_ms=LOOP_MONITOR_INTERVAL_MS,
+    max_lag_ms=LOAD_SHED_LAG_MS,
+    max_in_flight=LOAD_SHED_MAX_IN_FLIGHT
+)
+app.add_middleware(
+    LoadSheddingASGIMiddleware,
+    monitor=saturation_monitor,
+    paths=("/events", "/events/batch"),
+    retry_after_seconds=LOAD_SHED_RETRY_AFTER_SECONDS
+)
+
+# Outside the security checks, so requests they turn away are counted and traced too
+app.add_middleware(MetricsASGIMiddleware, routes=app.routes)
+app.add_middleware(TracingASGIMiddleware)
+metrics.registry.register(StatsCollector(
+    "rate_limiter",
+    "Rate limiter state",
+    security_middleware.rate_limiter.stats,
+    counters={"rejections": "Requests rejected by the rate limiter"}
+))
+metrics.registry.register(StatsCollector(
+    "log_queue",
+    "Log records waiting for the logging thread",
+    logs.stats,
+    counters={
+        "dropped": "Log records dropped because the queue was full",
+        "sampled_out": "Log lines dropped by sampling"
+    }
+))
+metrics.registry.register(StatsCollector(
+    "event_loop",
+    "Event loop lag and requests in flight",
+    saturation_monitor.stats,
+    counters={"shed": "Event requests shed with 503 while the event loop was overloaded"}
+))
 
 # Pydantic models
 class EventPayload(BaseModel):
@@ -83,10 +153,19 @@ class HealthResponse(BaseModel):
     status: str
     timestamp: datetime
     service_bus_connected: bool
+    circuit_breaker: Dict[str, Any]
+    send_retries: Dict[str, float]
+    rate_limiter: Dict[str, int]
 
 # Global variables for Azure Service Bus
 service_bus_client: Optional[ServiceBusClient] = None
-service_bus_sender = None
+service_bus_sender: Optional[ServiceBusSender] = None
+service_bus_pool: Optional[SenderPool] = None
+# Owns the credential, clients and senders so they are closed together on shutdown
+service_bus_resources: Optional[AsyncExitStack] = None
+event_coalescer: Optional[EventCoalescer] = None
+ingest_queue: Optional[IngestQueue] = None
+event_outbox: Optional[EventOutbox] = None
 
 # Configuration
 SERVICE_BUS_CONNECTION_STRING = os.getenv("SERVICE_BUS_CONNECTION_STRING")
@@ -94,81 +173,277 @@ SERVICE_BUS_QUEUE_NAME = os.getenv("SERVICE_BUS_QUEUE_NAME", "events")
 SERVICE_BUS_TOPIC_NAME = os.getenv("SERVICE_BUS_TOPIC_NAME")
 USE_MANAGED_IDENTITY = os.getenv("USE_MANAGED_IDENTITY", "false").lower() == "true"
 SERVICE_BUS_NAMESPACE = os.getenv("SERVICE_BUS_NAMESPACE")
+# SDK-level retries; the application retry policy below is preferred so retries stay within budget
+SERVICE_BUS_RETRY_TOTAL = int(os.getenv("SERVICE_BUS_RETRY_TOTAL", "0"))
+# Application retry policy for sends: exponential backoff with full jitter and a retry budget
+SEND_RETRY_MAX_ATTEMPTS = int(os.getenv("SEND_RETRY_MAX_ATTEMPTS", "3"))
+SEND_RETRY_BASE_DELAY_MS = float(os.getenv("SEND_RETRY_BASE_DELAY_MS", "100"))
+SEND_RETRY_MAX_DELAY_MS = float(os.getenv("SEND_RETRY_MAX_DELAY_MS", "5000"))
+SEND_RETRY_BUDGET_RATIO = float(os.getenv("SEND_RETRY_BUDGET_RATIO", "0.1"))
+SEND_RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("SEND_RETRY_BUDGET_MIN_PER_SECOND", "10"))
+# Circuit breaker around sends; FALLBACK=outbox diverts /events to the local outbox while open
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv("CIRCUIT_BREAKER_FAILURE_RATE", "0.5"))
+CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv("CIRCUIT_BREAKER_MIN_CALLS", "20"))
+CIRCUIT_BREAKER_WINDOW_SECONDS = int(os.getenv("CIRCUIT_BREAKER_WINDOW_SECONDS", "10"))
+CIRCUIT_BREAKER_OPEN_SECONDS = float(os.getenv("CIRCUIT_BREAKER_OPEN_SECONDS", "15"))
+CIRCUIT_BREAKER_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_BREAKER_HALF_OPEN_PROBES", "3"))
+CIRCUIT_BREAKER_FALLBACK = os.getenv("CIRCUIT_BREAKER_FALLBACK", "none").lower()
+# Parallel sends for /events/batch: senders spread over connections, in-flight cap (0 = one per sender)
+SERVICE_BUS_CONNECTION_COUNT = int(os.getenv("SERVICE_BUS_CONNECTION_COUNT", "1"))
+SERVICE_BUS_SENDER_POOL_SIZE = int(os.getenv("SERVICE_BUS_SENDER_POOL_SIZE", "1"))
+SERVICE_BUS_MAX_IN_FLIGHT_SENDS = int(os.getenv("SERVICE_BUS_MAX_IN_FLIGHT_SENDS", "0"))
+# Micro-batching of /events sends (a linger of 0 disables coalescing)
+EVENT_COALESCE_LINGER_MS = float(os.getenv("EVENT_COALESCE_LINGER_MS", "0"))
+EVENT_COALESCE_MAX_BYTES = int(os.getenv("EVENT_COALESCE_MAX_BYTES", "0")) or None
+# Parse only the envelope of /events bodies and pass `data` through unchanged (needs msgspec)
+EVENT_RAW_PASSTHROUGH = os.getenv("EVENT_RAW_PASSTHROUGH", "false").lower() == "true"
+# Accept mode for /events: "sync" waits for Service Bus, "async" returns 202 once
+# queued in memory, "durable" returns 202 once written to the local outbox
+EVENT_ACCEPT_MODE = os.getenv("EVENT_ACCEPT_MODE", "sync").lower()
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_PUBLISHERS = int(os.getenv("INGEST_PUBLISHERS", "2"))
+INGEST_RETRY_AFTER_SECONDS = int(os.getenv("INGEST_RETRY_AFTER_SECONDS", "1"))
+# Durable outbox (write-ahead log) used by the "durable" accept mode
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", "/var/lib/event-outbox")
+OUTBOX_SEGMENT_BYTES = int(os.getenv("OUTBOX_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+OUTBOX_FSYNC = os.getenv("OUTBOX_FSYNC", "always").lower()
+OUTBOX_FSYNC_INTERVAL_MS = float(os.getenv("OUTBOX_FSYNC_INTERVAL_MS", "100"))
+OUTBOX_GROUP_COMMIT_MS = float(os.getenv("OUTBOX_GROUP_COMMIT_MS", "0"))
+OUTBOX_MAX_BACKLOG_BYTES = int(os.getenv("OUTBOX_MAX_BACKLOG_BYTES", str(1024 * 1024 * 1024)))
+# OpenTelemetry spans (needs opentelemetry-sdk); new traces are sampled at SAMPLE_RATIO,
+# requests arriving with a traceparent follow the caller's decision
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "otlp").lower()
+
+if TRACING_ENABLED and not tracing.configure(TRACING_SAMPLE_RATIO, TRACING_EXPORTER):
+    logger.warning(
+        "TRACING_ENABLED requires opentelemetry-sdk (and the OTLP exporter for TRACING_EXPORTER=otlp), "
+        "tracing is disabled"
+    )
+
+send_circuit_breaker: Optional[CircuitBreaker] = None
+if CIRCUIT_BREAKER_ENABLED:
+    send_circuit_breaker = CircuitBreaker(
+        failure_rate_threshold=CIRCUIT_BREAKER_FAILURE_RATE,
+        min_calls=CIRCUIT_BREAKER_MIN_CALLS,
+        window_seconds=CIRCUIT_BREAKER_WINDOW_SECONDS,
+        open_seconds=CIRCUIT_BREAKER_OPEN_SECONDS,
+        half_open_probes=CIRCUIT_BREAKER_HALF_OPEN_PROBES
+    )
+
+# Shared by every send path so the retry budget and breaker are process-wide
+send_retry_policy = RetryPolicy(
+    max_attempts=SEND_RETRY_MAX_ATTEMPTS,
+    base_delay_ms=SEND_RETRY_BASE_DELAY_MS,
+    max_delay_ms=SEND_RETRY_MAX_DELAY_MS,
+    budget=RetryBudget(ratio=SEND_RETRY_BUDGET_RATIO, min_per_second=SEND_RETRY_BUDGET_MIN_PER_SECOND),
+    breaker=send_circuit_breaker
+)
+
+metrics.registry.register(StatsCollector(
+    "servicebus_retry",
+    "Service Bus send retry budget",
+    send_retry_policy.stats,
+    counters={
+        "calls": "Sends attempted through the retry policy",
+        "retries": "Send retries",
+        "retry_seconds": "Time spent waiting between send retries",
+        "exhausted": "Sends that failed after their last attempt",
+        "budget_rejections": "Send retries refused by the retry budget"
+    }
+))
+if send_circuit_breaker:
+    # Breaker state as a number: 0 closed, 1 half open, 2 open
+    BREAKER_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+    
+    def breaker_metrics() -> Dict[str, Any]:
+        stats = send_circuit_breaker.stats()
+        return {**stats, "state": BREAKER_STATE_VALUES[stats["state"]]}
+    
+    metrics.registry.register(StatsCollector(
+        "servicebus_circuit_breaker",
+        "Service Bus circuit breaker state (0 closed, 1 half open, 2 open) and window",
+        breaker_metrics,
+        counters={
+            "trips": "Times the circuit breaker opened",
+            "rejected": "Sends rejected while the circuit breaker was open"
+        }
+    ))
+
+def circuit_open_exception(error: CircuitOpenError) -> HTTPException:
+    """503 telling the client when the breaker will next let traffic through"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Service Bus is unavailable, circuit breaker is open",
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+    )
+
+def check_circuit_breaker():
+    """Fail fast while the breaker is open, before any work is done for the request"""
+    if send_circuit_breaker and send_circuit_breaker.state == CircuitBreaker.OPEN:
+        raise CircuitOpenError(send_circuit_breaker.retry_after)
+
+def create_service_bus_client(credential: Optional[DefaultAzureCredential]) -> ServiceBusClient:
+    """Create a Service Bus client (one AMQP connection)"""
+    if credential:
+        return ServiceBusClient(
+            fully_qualified_namespace=f"{SERVICE_BUS_NAMESPACE}.servicebus.windows.net",
+            credential=credential,
+            retry_total=SERVICE_BUS_RETRY_TOTAL
+        )
+    return ServiceBusClient.from_connection_string(
+        SERVICE_BUS_CONNECTION_STRING,
+        retry_total=SERVICE_BUS_RETRY_TOTAL
+    )
 
 async def initialize_service_bus():
-    """Initialize Azure Service Bus connection"""
-    global service_bus_client, service_bus_sender
+    """
+    Initialize Azure Service Bus connection
+
+    A pool of async senders, spread over one or more client connections, is
+    opened here and kept open for the life of the process. If an AMQP link is
+    detached by the broker the SDK re-attaches it transparently on the next
+    send, so the senders are only closed on shutdown.
+    """
+    global service_bus_client, service_bus_sender, service_bus_pool, service_bus_resources
+    global event_coalescer, ingest_queue
     
+    service_bus_resources = resources = AsyncExitStack()
     try:
+        credential = None
         if USE_MANAGED_IDENTITY and SERVICE_BUS_NAMESPACE:
             # Use managed identity for authentication (recommended for ACA)
-            credential = DefaultAzureCredential()
-            service_bus_client = ServiceBusClient(
-                fully_qualified_namespace=f"{SERVICE_BUS_NAMESPACE}.servicebus.windows.net",
-                credential=credential
-            )
+            credential = await resources.enter_async_context(DefaultAzureCredential())
             logger.info("Service Bus client initialized with managed identity", namespace=SERVICE_BUS_NAMESPACE)
         elif SERVICE_BUS_CONNECTION_STRING:
             # Use connection string
-            service_bus_client = ServiceBusClient.from_connection_string(SERVICE_BUS_CONNECTION_STRING)
             logger.info("Service Bus client initialized with connection string")
         else:
             logger.error("No Service Bus configuration found")
             return False
         
-        # Initialize sender based on configuration
+        clients = []
+        for _ in range(max(1, SERVICE_BUS_CONNECTION_COUNT)):
+            clients.append(await resources.enter_async_context(create_service_bus_client(credential)))
+        service_bus_client = clients[0]
+        
+        # Initialize senders based on configuration, round-robin over the connections
+        senders = []
+        for i in range(max(1, SERVICE_BUS_SENDER_POOL_SIZE)):
+            client = clients[i % len(clients)]
+            if SERVICE_BUS_TOPIC_NAME:
+                sender = client.get_topic_sender(topic_name=SERVICE_BUS_TOPIC_NAME)
+            else:
+                sender = client.get_queue_sender(queue_name=SERVICE_BUS_QUEUE_NAME)
+            # Open the sender link now so the first request does not pay the attach cost
+            senders.append(InstrumentedSender(await resources.enter_async_context(sender)))
+        
         if SERVICE_BUS_TOPIC_NAME:
-            service_bus_sender = service_bus_client.get_topic_sender(topic_name=SERVICE_BUS_TOPIC_NAME)
-            logger.info("Service Bus topic sender initialized", topic=SERVICE_BUS_TOPIC_NAME)
+            logger.info("Service Bus topic senders initialized", topic=SERVICE_BUS_TOPIC_NAME, senders=len(senders))
         else:
-            service_bus_sender = service_bus_client.get_queue_sender(queue_name=SERVICE_BUS_QUEUE_NAME)
-            logger.info("Service Bus queue sender initialized", queue=SERVICE_BUS_QUEUE_NAME)
+            logger.info("Service Bus queue senders initialized", queue=SERVICE_BUS_QUEUE_NAME, senders=len(senders))
+        
+        service_bus_pool = SenderPool(
+            senders,
+            max_in_flight=SERVICE_BUS_MAX_IN_FLIGHT_SENDS,
+            retry_policy=send_retry_policy
+        )
+        service_bus_sender = service_bus_pool.primary
+        logger.info(
+            "Service Bus sender links opened",
+            connections=len(clients),
+            senders=len(senders),
+            max_in_flight=service_bus_pool.max_in_flight
+        )
+        
+        if EVENT_COALESCE_LINGER_MS > 0:
+            event_coalescer = EventCoalescer(
+                service_bus_sender,
+                linger_ms=EVENT_COALESCE_LINGER_MS,
+                max_batch_bytes=EVENT_COALESCE_MAX_BYTES,
+                retry_policy=send_retry_policy
+            )
+            await event_coalescer.start()
+            # Registered after the senders so pending batches are flushed before they close
+            resources.push_async_callback(event_coalescer.stop)
+        
+        if EVENT_ACCEPT_MODE == "async":
+            pool = service_bus_pool
+            ingest_queue = IngestQueue(
+                lambda messages: send_packed(pool, messages),
+                maxsize=INGEST_QUEUE_SIZE,
+                publishers=INGEST_PUBLISHERS
+            )
+            await ingest_queue.start()
+            # Registered after the senders so queued events are drained before they close
+            resources.push_async_callback(ingest_queue.stop)
         
         return True
     except Exception as e:
         logger.error("Failed to initialize Service Bus", error=str(e))
         return False
 
+def build_service_bus_message(payload: EventPayload) -> ServiceBusMessage:
+    """Build the Service Bus message for an event payload"""
+    timestamp = payload.timestamp or datetime.utcnow()
+    
+    # Create event message; the serializer writes the datetime as ISO 8601
+    event_data = {
+        "event_type": payload.event_type,
+        "data": payload.data,
+        "source": payload.source,
+        "correlation_id": payload.correlation_id,
+        "timestamp": timestamp,
+        # The random suffix keeps IDs unique when a batch is built within one microsecond
+        "message_id": f"evt_{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}"
+    }
+    
+    # Create Service Bus message; raw payloads have their data bytes spliced in as-is
+    encode = passthrough.encode_event if passthrough.is_raw(payload) else serialization.dumps
+    message = ServiceBusMessage(
+        body=encode(event_data),
+        content_type="application/json",
+        message_id=event_data["message_id"]
+    )
+    
+    # Add custom properties
+    message.application_properties = {
+        "event_type": payload.event_type,
+        "source": payload.source or "api",
+        "correlation_id": payload.correlation_id or event_data["message_id"],
+        # AMQP application properties carry plain strings for consumers
+        "timestamp": timestamp.isoformat()
+    }
+    # W3C traceparent, so consumers can continue the request's trace
+    tracing.inject(message.application_properties)
+    return message
+
 async def send_event_to_service_bus(payload: EventPayload) -> str:
     """Send event to Azure Service Bus"""
     try:
-        # Create event message
-        event_data = {
-            "event_type": payload.event_type,
-            "data": payload.data,
-            "source": payload.source,
-            "correlation_id": payload.correlation_id,
-            "timestamp": payload.timestamp.isoformat() if payload.timestamp else datetime.utcnow().isoformat(),
-            "message_id": f"evt_{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')}"
-        }
+        message = build_service_bus_message(payload)
         
-        # Create Service Bus message
-        message = ServiceBusMessage(
-            body=json.dumps(event_data).encode('utf-8'),
-            content_type="application/json"
-        )
-        
-        # Add custom properties
-        message.application_properties = {
-            "event_type": payload.event_type,
-            "source": payload.source or "api",
-            "correlation_id": payload.correlation_id or event_data["message_id"],
-            "timestamp": event_data["timestamp"]
-        }
-        
-        # Send message
-        async with service_bus_sender:
-            await service_bus_sender.send_messages(message)
+        # Send message over the long-lived sender link, coalesced with
+        # concurrent requests when micro-batching is enabled
+        with tracing.span("servicebus.send", {"messaging.message_id": message.message_id}):
+            if event_coalescer:
+                await event_coalescer.submit(message)
+            else:
+                await send_retry_policy.call(lambda: service_bus_sender.send_messages(message))
         
         logger.info(
             "Event sent to Service Bus successfully",
             event_type=payload.event_type,
             correlation_id=payload.correlation_id,
-            message_id=event_data["message_id"]
+            message_id=message.message_id
         )
         
-        return event_data["message_id"]
+        return message.message_id
         
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(
             "Failed to send event to Service Bus",
@@ -184,19 +459,57 @@ async def send_event_to_service_bus(payload: EventPayload) -> str:
 @app.on_event("startup")
 async def startup_event():
     """Initialize application on startup"""
+    global event_outbox
     logger.info("Starting Azure Service Bus Event Generator API")
     
+    # Pick up policy and API key changes from mounted files without a restart
+    await security_middleware.start_watchers()
+    await saturation_monitor.start()
+    
+    # Recover the outbox first so events accepted before a restart are replayed
+    if EVENT_ACCEPT_MODE == "durable" or CIRCUIT_BREAKER_FALLBACK == "outbox":
+        event_outbox = EventOutbox(
+            OUTBOX_DIR,
+            segment_max_bytes=OUTBOX_SEGMENT_BYTES,
+            fsync=OUTBOX_FSYNC,
+            fsync_interval_ms=OUTBOX_FSYNC_INTERVAL_MS,
+            group_commit_ms=OUTBOX_GROUP_COMMIT_MS,
+            max_backlog_bytes=OUTBOX_MAX_BACKLOG_BYTES
+        )
+        await event_outbox.open()
+    
     # Initialize Service Bus connection
     success = await initialize_service_bus()
     if not success:
         logger.warning("Service Bus initialization failed - API will start but events cannot be sent")
+    elif event_outbox:
+        await event_outbox.start_drainer(service_bus_sender)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on application shutdown"""
-    global service_bus_client
-    if service_bus_client:
+    global service_bus_client, service_bus_sender, service_bus_pool, service_bus_resources
+    global event_coalescer, ingest_queue, event_outbox
+    if event_outbox:
+        # Unsent records stay on disk and are replayed on the next start
+        await event_outbox.close()
+        event_outbox = None
+    if service_bus_resources:
+        # Drains the ingest queue and flushes the coalescer, then closes the senders, clients and credential
+        await service_bus_resources.aclose()
+    elif service_bus_client:
         await service_bus_client.close()
+    event_coalescer = None
+    ingest_queue = None
+    service_bus_resources = None
+    service_bus_sender = None
+    service_bus_pool = None
+    service_bus_client = None
+    await security_middleware.stop_watchers()
+    await saturation_monitor.stop()
+    await security_middleware.rate_limiter.close()
+    tracing.shutdown()
+    logs.shutdown()
     logger.info("Azure Service Bus Event Generator API shutdown complete")
 
 @app.get("/", response_model=Dict[str, str])
@@ -212,21 +525,82 @@ async def root():
 async def health_check():
     """Health check endpoint"""
     service_bus_connected = service_bus_client is not None and service_bus_sender is not None
+    breaker_stats = send_circuit_breaker.stats() if send_circuit_breaker else {"state": "disabled"}
+    healthy = service_bus_connected and breaker_stats["state"] in (CircuitBreaker.CLOSED, "disabled")
     
     return HealthResponse(
-        status="healthy" if service_bus_connected else "degraded",
+        status="healthy" if healthy else "degraded",
         timestamp=datetime.utcnow(),
-        service_bus_connected=service_bus_connected
+        service_bus_connected=service_bus_connected,
+        circuit_breaker=breaker_stats,
+        send_retries=send_retry_policy.stats(),
+        rate_limiter=security_middleware.rate_limiter.stats()
+    )
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics; needs an API key with the metrics:read permission"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+async def accept_event(payload: EventPayload, response: Response, durable: bool) -> EventResponse:
+    """Hand an event to the outbox (durable) or ingest queue and acknowledge it with 202"""
+    message = build_service_bus_message(payload)
+    if durable:
+        try:
+            with tracing.span("outbox.append", {"messaging.message_id": message.message_id}):
+                await event_outbox.append(message)
+            accepted = True
+        except OutboxFullError:
+            logger.warning("Event outbox backlog full, rejecting event", backlog_bytes=event_outbox.backlog_bytes)
+            accepted = False
+    else:
+        accepted = ingest_queue.offer(message)
+        if not accepted:
+            logger.warning("Ingest queue full, rejecting event", queue_size=ingest_queue.qsize())
+    
+    if not accepted:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Event ingest queue is full",
+            headers={"Retry-After": str(INGEST_RETRY_AFTER_SECONDS)}
+        )
+    
+    response.status_code = status.HTTP_202_ACCEPTED
+    return EventResponse(
+        success=True,
+        message="Event accepted for delivery to Service Bus",
+        event_id=message.message_id,
+        correlation_id=payload.correlation_id
     )
 
-@app.post("/events", response_model=EventResponse)
-async def create_event(payload: EventPayload, request: Request):
+async def create_event(payload: EventPayload, request: Request, response: Response):
     """
     Create and send an event to Azure Service Bus
     
     This endpoint receives a payload and generates an event in Azure Service Bus.
     The event will be sent to either a queue or topic based on configuration.
+    In async and durable accept modes the event is queued (in memory or in the
+    local outbox) and acknowledged with 202 Accepted before it reaches Service Bus.
+    """
+    return await process_event(payload, request, response)
+
+async def create_event_raw(request: Request, response: Response):
+    """
+    Create and send an event to Azure Service Bus (raw-body passthrough)
+    
+    Same contract as the standard endpoint, but only the envelope fields are
+    decoded; the `data` object is copied byte for byte into the message body.
     """
+    try:
+        payload = passthrough.parse_event(await request.body())
+    except passthrough.PayloadError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    return await process_event(payload, request, response)
+
+async def process_event(payload: EventPayload, request: Request, response: Response) -> EventResponse:
+    """Send or accept a single validated event"""
+    # Reading and validating the body happened between the security checks and here
+    tracing.span_since_mark(request.scope, "validate_payload")
     try:
         # Log incoming request
         logger.info(
@@ -244,8 +618,24 @@ async def create_event(payload: EventPayload, request: Request):
                 detail="Service Bus connection not available"
             )
         
-        # Send event to Service Bus
-        event_id = await send_event_to_service_bus(payload)
+        try:
+            check_circuit_breaker()
+            if EVENT_ACCEPT_MODE == "durable":
+                return await accept_event(payload, response, durable=True)
+            if ingest_queue:
+                return await accept_event(payload, response, durable=False)
+            
+            # Send event to Service Bus
+            event_id = await send_event_to_service_bus(payload)
+        except CircuitOpenError as e:
+            if not event_outbox:
+                raise circuit_open_exception(e)
+            logger.warning(
+                "Circuit breaker open, diverting event to outbox",
+                event_type=payload.event_type,
+                correlation_id=payload.correlation_id
+            )
+            return await accept_event(payload, response, durable=True)
         
         return EventResponse(
             success=True,
@@ -268,6 +658,21 @@ async def create_event(payload: EventPayload, request: Request):
             detail="Internal server error while creating event"
         )
 
+# The passthrough handler replaces the standard one when enabled and msgspec is installed
+if EVENT_RAW_PASSTHROUGH and passthrough.AVAILABLE:
+    app.post(
+        "/events",
+        response_model=EventResponse,
+        openapi_extra={"requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": EventPayload.model_json_schema()}}
+        }}
+    )(create_event_raw)
+else:
+    if EVENT_RAW_PASSTHROUGH:
+        logger.warning("EVENT_RAW_PASSTHROUGH requires msgspec, using the standard /events handler")
+    app.post("/events", response_model=EventResponse)(create_event)
+
 @app.post("/events/batch", response_model=Dict[str, Any])
 async def create_events_batch(payloads: list[EventPayload], request: Request):
     """
@@ -275,6 +680,7 @@ async def create_events_batch(payloads: list[EventPayload], request: Request):
     
     This endpoint receives multiple payloads and generates events in Azure Service Bus.
     """
+    tracing.span_since_mark(request.scope, "validate_payload", {"events.count": len(payloads)})
     try:
         # Log incoming request
         logger.info(
@@ -283,6 +689,13 @@ async def create_events_batch(payloads: list[EventPayload], request: Request):
             client_ip=request.client.host
         )
         
+        # Charge the rate limit for the number of events, not just the request
+        if not await security_middleware.charge_events(request, len(payloads)):
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded"
+            )
+        
         # Validate Service Bus connection
         if not service_bus_client or not service_bus_sender:
             raise HTTPException(
@@ -290,26 +703,34 @@ async def create_events_batch(payloads: list[EventPayload], request: Request):
                 detail="Service Bus connection not available"
             )
         
-        # Process events
+        try:
+            check_circuit_breaker()
+        except CircuitOpenError as e:
+            raise circuit_open_exception(e)
+        
+        # Pack events into as few size-limited batches as possible
         results = []
         successful_count = 0
         failed_count = 0
         
-        for i, payload in enumerate(payloads):
-            try:
-                event_id = await send_event_to_service_bus(payload)
+        messages = [build_service_bus_message(payload) for payload in payloads]
+        with tracing.span("servicebus.send_batch", {"messaging.batch.message_count": len(messages)}):
+            outcomes = await send_packed(service_bus_pool, messages)
+        
+        for i, (payload, message, error) in enumerate(zip(payloads, messages, outcomes)):
+            if error is None:
                 results.append({
                     "index": i,
                     "success": True,
-                    "event_id": event_id,
+                    "event_id": message.message_id,
                     "correlation_id": payload.correlation_id
                 })
                 successful_count += 1
-            except Exception as e:
+            else:
                 results.append({
                     "index": i,
                     "success": False,
-                    "error": str(e),
+                    "error": f"Failed to send event to Service Bus: {str(error)}",
                     "correlation_id": payload.correlation_id
                 })
                 failed_count += 1
@@ -338,12 +759,11 @@ if __name__ == "__main__":
     # Get configuration from environment
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "8000"))
-    log_level = os.getenv("LOG_LEVEL", "info")
     
     uvicorn.run(
         "main:app",
         host=host,
         port=port,
-        log_level=log_level,
+        log_level=LOG_LEVEL,
         reload=os.getenv("ENVIRONMENT", "production") == "development"
     )
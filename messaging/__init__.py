@@ -0,0 +1 @@
+# Messaging package for Service Bus publishing components
@@ -0,0 +1,90 @@
+"""
+Size-aware batch packing for Service Bus sends
+Packs a list of messages into as few ServiceBusMessageBatch objects as the broker size limit allows.
+"""
+
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+from azure.servicebus import ServiceBusMessage, ServiceBusMessageBatch
+from azure.servicebus.aio import ServiceBusSender
+from azure.servicebus.exceptions import MessageSizeExceededError
+
+from messaging.pool import SenderPool
+
+logger = structlog.get_logger()
+
+# A packed batch together with the positions of its messages in the input list
+PackedBatch = Tuple[ServiceBusMessageBatch, List[int]]
+
+async def pack_messages(
+    sender: ServiceBusSender,
+    messages: List[ServiceBusMessage],
+    max_batch_bytes: Optional[int] = None
+) -> Tuple[List[PackedBatch], Dict[int, Exception]]:
+    """
+    Fill batches in order until ``add_message`` overflows, then start a new one.
+
+    Returns the packed batches and the errors of messages that do not fit
+    even in an empty batch, keyed by their index in ``messages``.
+    """
+    batches: List[PackedBatch] = []
+    errors: Dict[int, Exception] = {}
+    
+    batch = await sender.create_message_batch(max_batch_bytes)
+    indices: List[int] = []
+    for index, message in enumerate(messages):
+        try:
+            batch.add_message(message)
+        except MessageSizeExceededError:
+            next_batch = await sender.create_message_batch(max_batch_bytes)
+            try:
+                next_batch.add_message(message)
+            except MessageSizeExceededError as e:
+                # Too large for any batch; keep filling the current one
+                errors[index] = e
+                continue
+            if indices:
+                batches.append((batch, indices))
+            batch, indices = next_batch, []
+        indices.append(index)
+    
+    if indices:
+        batches.append((batch, indices))
+    return batches, errors
+
+async def send_packed(
+    pool: SenderPool,
+    messages: List[ServiceBusMessage],
+    max_batch_bytes: Optional[int] = None
+) -> List[Optional[Exception]]:
+    """
+    Send messages in as few round trips as possible, fanning the batches out
+    across the sender pool.
+
+    Returns one entry per input message: ``None`` when it was sent, otherwise
+    the exception that prevented it from being sent.
+    """
+    outcomes: List[Optional[Exception]] = [None] * len(messages)
+    batches, errors = await pack_messages(pool.primary, messages, max_batch_bytes)
+    for index, error in errors.items():
+        outcomes[index] = error
+    
+    async def send_one(batch: ServiceBusMessageBatch, indices: List[int]):
+        try:
+            await pool.send(batch)
+        except Exception as e:
+            logger.error("Failed to send message batch", error=str(e), batch_size=len(indices))
+            for index in indices:
+                outcomes[index] = e
+    
+    await asyncio.gather(*(send_one(batch, indices) for batch, indices in batches))
+    
+    logger.info(
+        "Message batches sent",
+        message_count=len(messages),
+        batch_count=len(batches),
+        failed_count=sum(1 for outcome in outcomes if outcome is not None)
+    )
+    return outcomes
@@ -0,0 +1,181 @@
+"""
+Circuit breaker for Service Bus sends
+Trips on a high error rate so requests fail fast instead of waiting out SDK timeouts.
+"""
+
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, TypeVar
+
+import structlog
+
+logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending while the circuit is open"""
+    
+    def __init__(self, retry_after: float):
+        super().__init__("Service Bus circuit breaker is open")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker driven by the error rate over a rolling window.
+    
+    While closed, outcomes are counted in one-second buckets. Once at least
+    ``min_calls`` calls in the window have an error rate of
+    ``failure_rate_threshold`` or more, the breaker opens and rejects calls
+    for ``open_seconds``. It then goes half-open and lets up to
+    ``half_open_probes`` calls through: if they all succeed the breaker
+    closes, and any failure opens it again.
+    
+    Client errors (``ValueError``, which includes ``MessageSizeExceededError``)
+    say nothing about broker health and are not counted as failures.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(
+        self,
+        failure_rate_threshold: float = 0.5,
+        min_calls: int = 20,
+        window_seconds: int = 10,
+        open_seconds: float = 15,
+        half_open_probes: int = 3
+    ):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.window_seconds = max(1, window_seconds)
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        # Per-second buckets: the second each one covers, its successes and failures
+        self._bucket_second: List[int] = [0] * self.window_seconds
+        self._bucket_successes: List[int] = [0] * self.window_seconds
+        self._bucket_failures: List[int] = [0] * self.window_seconds
+        
+        # Metrics
+        self.trips = 0
+        self.rejected = 0
+    
+    @property
+    def state(self) -> str:
+        """Current state, moving from open to half-open once the open period has passed"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+            logger.info("Circuit breaker half-open, probing Service Bus")
+        return self._state
+    
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the breaker will let probe traffic through"""
+        if self._state != self.OPEN:
+            return 0
+        return max(0, self.open_seconds - (time.monotonic() - self._opened_at))
+    
+    def allow(self) -> bool:
+        """Whether a call may go ahead; counts it as a probe when half-open"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+            self._probes_in_flight += 1
+            return True
+        self.rejected += 1
+        return False
+    
+    def record_success(self):
+        if self._state == self.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self._close()
+        elif self._state == self.CLOSED:
+            self._bucket_successes[self._current_bucket()] += 1
+    
+    def record_failure(self):
+        if self._state == self.HALF_OPEN:
+            self._trip("probe failed")
+        elif self._state == self.CLOSED:
+            self._bucket_failures[self._current_bucket()] += 1
+            successes, failures = self._window_totals()
+            calls = successes + failures
+            if calls >= self.min_calls and failures / calls >= self.failure_rate_threshold:
+                self._trip("error rate threshold reached")
+    
+    async def call(self, operation: Callable[[], Awaitable[T]]) -> T:
+        """Run operation through the breaker, raising CircuitOpenError when it is open"""
+        if not self.allow():
+            raise CircuitOpenError(self.retry_after)
+        try:
+            result = await operation()
+        except ValueError:
+            # Client error: release the probe slot without judging broker health
+            self._release_probe()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            # Cancelled (client disconnect, shutdown) before an outcome; the slot must not leak
+            self._release_probe()
+            raise
+        self.record_success()
+        return result
+    
+    def stats(self) -> Dict[str, Any]:
+        """Breaker metrics for the health and metrics endpoints"""
+        successes, failures = self._window_totals()
+        return {
+            "state": self.state,
+            "window_calls": successes + failures,
+            "window_failures": failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "retry_after": math.ceil(self.retry_after)
+        }
+    
+    def _current_bucket(self) -> int:
+        second = int(time.monotonic())
+        index = second % self.window_seconds
+        if self._bucket_second[index] != second:
+            self._bucket_second[index] = second
+            self._bucket_successes[index] = 0
+            self._bucket_failures[index] = 0
+        return index
+    
+    def _window_totals(self) -> Tuple[int, int]:
+        oldest = int(time.monotonic()) - self.window_seconds
+        successes = failures = 0
+        for i in range(self.window_seconds):
+            if self._bucket_second[i] > oldest:
+                successes += self._bucket_successes[i]
+                failures += self._bucket_failures[i]
+        return successes, failures
+    
+    def _release_probe(self):
+        if self._state == self.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+    
+    def _trip(self, reason: str):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.trips += 1
+        logger.warning("Circuit breaker opened", reason=reason, open_seconds=self.open_seconds)
+    
+    def _close(self):
+        self._state = self.CLOSED
+        for i in range(self.window_seconds):
+            self._bucket_successes[i] = 0
+            self._bucket_failures[i] = 0
+        logger.info("Circuit breaker closed, Service Bus recovered")
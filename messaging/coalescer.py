@@ -0,0 +1,146 @@
+"""
+Micro-batching for Service Bus sends
+Coalesces messages from concurrent requests into one ServiceBusMessageBatch per round trip.
+"""
+
+import asyncio
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+import structlog
+from azure.servicebus import ServiceBusMessage, ServiceBusMessageBatch
+from azure.servicebus.aio import ServiceBusSender
+from azure.servicebus.exceptions import MessageSizeExceededError
+
+from messaging.retry import RetryPolicy
+
+logger = structlog.get_logger()
+
+PendingMessage = Tuple[ServiceBusMessage, asyncio.Future]
+
+class EventCoalescer:
+    """
+    Collects messages for up to ``linger_ms`` or until a batch of
+    ``max_batch_bytes`` is full, then sends them with a single ``send_messages``.
+
+    Each caller of ``submit`` gets back its own message ID, or the exception
+    raised while sending the batch its message was packed into.
+    """
+    
+    def __init__(
+        self,
+        sender: ServiceBusSender,
+        linger_ms: float = 5,
+        max_batch_bytes: Optional[int] = None,
+        retry_policy: Optional[RetryPolicy] = None
+    ):
+        self.sender = sender
+        self.retry_policy = retry_policy
+        self.linger_seconds = linger_ms / 1000
+        self.max_batch_bytes = max_batch_bytes
+        self._pending: Deque[PendingMessage] = deque()
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self._worker: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Start the background flush task"""
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            "Event coalescer started",
+            linger_ms=self.linger_seconds * 1000,
+            max_batch_bytes=self.max_batch_bytes
+        )
+    
+    async def stop(self):
+        """Flush everything still pending, then stop the background task"""
+        self._closed = True
+        self._wakeup.set()
+        if self._worker:
+            await self._worker
+            self._worker = None
+        logger.info("Event coalescer stopped")
+    
+    async def submit(self, message: ServiceBusMessage) -> str:
+        """Queue a message for the next batch and wait until it has been sent"""
+        if self._closed:
+            raise RuntimeError("Event coalescer is stopped")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((message, future))
+        self._wakeup.set()
+        await future
+        return message.message_id
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._pending or not self._closed:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            
+            try:
+                batch = await self.sender.create_message_batch(self.max_batch_bytes)
+            except Exception as e:
+                self._fail_pending(e)
+                continue
+            
+            waiters: List[PendingMessage] = []
+            deadline = loop.time() + self.linger_seconds
+            while True:
+                batch_full = self._fill(batch, waiters)
+                remaining = deadline - loop.time()
+                if batch_full or remaining <= 0 or self._closed:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            
+            if waiters:
+                await self._send(batch, waiters)
+    
+    def _fill(self, batch: ServiceBusMessageBatch, waiters: List[PendingMessage]) -> bool:
+        """Move pending messages into the batch, returning True once it is full"""
+        while self._pending:
+            message, future = self._pending[0]
+            if future.done():
+                # Caller went away (request cancelled) before the message was packed
+                self._pending.popleft()
+                continue
+            try:
+                batch.add_message(message)
+            except MessageSizeExceededError as e:
+                if len(batch) == 0:
+                    # Does not fit even in an empty batch, so it can never be sent
+                    self._pending.popleft()
+                    future.set_exception(e)
+                    continue
+                return True
+            self._pending.popleft()
+            waiters.append((message, future))
+        return False
+    
+    async def _send(self, batch: ServiceBusMessageBatch, waiters: List[PendingMessage]):
+        try:
+            if self.retry_policy:
+                await self.retry_policy.call(lambda: self.sender.send_messages(batch))
+            else:
+                await self.sender.send_messages(batch)
+        except Exception as e:
+            logger.error("Failed to send coalesced batch", error=str(e), batch_size=len(waiters))
+            for _, future in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for message, future in waiters:
+            if not future.done():
+                future.set_result(message.message_id)
+    
+    def _fail_pending(self, error: Exception):
+        while self._pending:
+            _, future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(error)
@@ -0,0 +1,77 @@
+"""
+In-memory ingest queue for accept-then-send mode
+Events are acknowledged once queued; background publisher tasks send them to Service Bus.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, List, Optional
+
+import structlog
+from azure.servicebus import ServiceBusMessage
+
+logger = structlog.get_logger()
+
+Publisher = Callable[[List[ServiceBusMessage]], Awaitable[List[Optional[Exception]]]]
+
+class IngestQueue:
+    """
+    Bounded queue drained by background publisher tasks.
+
+    Each publisher takes whatever is queued (up to ``max_drain`` messages) and
+    hands it to ``publish`` in one call, so a backlog is sent in batches.
+    Messages the publisher reports as failed are logged and dropped.
+    """
+    
+    def __init__(self, publish: Publisher, maxsize: int = 10000, publishers: int = 2, max_drain: int = 500):
+        self.publish = publish
+        self.maxsize = maxsize
+        self.publisher_count = max(1, publishers)
+        self.max_drain = max_drain
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._workers: List[asyncio.Task] = []
+    
+    def qsize(self) -> int:
+        """Number of events accepted but not yet handed to a publisher"""
+        return self._queue.qsize()
+    
+    def offer(self, message: ServiceBusMessage) -> bool:
+        """Queue a message without waiting; returns False when the queue is full"""
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            return False
+        return True
+    
+    async def start(self):
+        """Start the background publisher tasks"""
+        self._workers = [asyncio.create_task(self._run()) for _ in range(self.publisher_count)]
+        logger.info("Ingest queue started", maxsize=self.maxsize, publishers=self.publisher_count)
+    
+    async def stop(self, drain_timeout: float = 30):
+        """Give publishers up to drain_timeout seconds to empty the queue, then stop them"""
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.error("Ingest queue not drained before shutdown", dropped=self._queue.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Ingest queue stopped")
+    
+    async def _run(self):
+        while True:
+            messages = [await self._queue.get()]
+            while len(messages) < self.max_drain and not self._queue.empty():
+                messages.append(self._queue.get_nowait())
+            
+            try:
+                outcomes = await self.publish(messages)
+                for message, error in zip(messages, outcomes):
+                    if error is not None:
+                        logger.error("Failed to publish accepted event", error=str(error), message_id=message.message_id)
+            except Exception as e:
+                logger.error("Failed to publish accepted events", error=str(e), count=len(messages))
+            finally:
+                for _ in messages:
+                    self._queue.task_done()
@@ -0,0 +1,386 @@
+"""
+Durable local outbox for accepted-but-unsent events
+An append-only, segment-rotated write-ahead log that /events writes to before acknowledging,
+replayed to Service Bus in order by a background drainer.
+"""
+
+import asyncio
+import json
+import os
+import struct
+import time
+import zlib
+from typing import List, Optional, Tuple
+
+import structlog
+from azure.servicebus import ServiceBusMessage
+from azure.servicebus.aio import ServiceBusSender
+from azure.servicebus.exceptions import MessageSizeExceededError
+
+from messaging import serialization
+
+logger = structlog.get_logger()
+
+# Record frame: header length, body length, CRC32 of header + body
+FRAME_HEADER = struct.Struct("<III")
+SEGMENT_SUFFIX = ".wal"
+CURSOR_FILE = "cursor"
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+# Position in the log: (segment sequence number, byte offset within the segment)
+LogPosition = Tuple[int, int]
+
+def encode_record(message: ServiceBusMessage) -> bytes:
+    """Serialize a message into a checksummed WAL frame"""
+    header = serialization.dumps({
+        "message_id": message.message_id,
+        "content_type": message.content_type,
+        "application_properties": message.application_properties or {}
+    })
+    body = b"".join(message.body)
+    crc = zlib.crc32(body, zlib.crc32(header))
+    return FRAME_HEADER.pack(len(header), len(body), crc) + header + body
+
+def decode_record(header: bytes, body: bytes) -> ServiceBusMessage:
+    """Rebuild the Service Bus message stored in a WAL frame"""
+    fields = serialization.loads(header)
+    return ServiceBusMessage(
+        body=body,
+        content_type=fields["content_type"],
+        message_id=fields["message_id"],
+        application_properties=fields["application_properties"]
+    )
+
+class OutboxFullError(Exception):
+    """Raised when the unsent backlog exceeds the configured limit"""
+
+class EventOutbox:
+    """
+    Write-ahead log of events that have been acknowledged to the caller but not
+    yet confirmed by Service Bus.
+
+    Appends from concurrent requests are group-committed: everything queued
+    while the previous write was in progress goes to disk in one write (and one
+    fsync under the ``always`` policy). The drainer reads records in log order,
+    sends them in size-limited batches, persists its cursor after every
+    acknowledged batch and deletes segments it has fully consumed. On restart,
+    everything after the persisted cursor is replayed; a torn record at the end
+    of a segment is treated as the end of that segment.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_max_bytes: int = 64 * 1024 * 1024,
+        fsync: str = "always",
+        fsync_interval_ms: float = 100,
+        group_commit_ms: float = 0,
+        max_backlog_bytes: int = 0,
+        drain_batch_records: int = 500
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self.fsync_interval_seconds = fsync_interval_ms / 1000
+        self.group_commit_seconds = group_commit_ms / 1000
+        self.max_backlog_bytes = max_backlog_bytes
+        self.drain_batch_records = drain_batch_records
+
+        self._segments: List[int] = []
+        self._active_file = None
+        self._active_seq = 0
+        self._active_size = 0
+        self._last_fsync = 0.0
+        # Written but not yet fsynced under the interval policy
+        self._unsynced = False
+        self._cursor: LogPosition = (0, 0)
+        self._backlog_bytes = 0
+
+        self._pending: List[Tuple[bytes, asyncio.Future]] = []
+        self._pending_event = asyncio.Event()
+        self._committed_event = asyncio.Event()
+        self._committer: Optional[asyncio.Task] = None
+        self._drainer: Optional[asyncio.Task] = None
+        self._cursor_write: Optional[asyncio.Future] = None
+        self._closed = True
+
+    @property
+    def backlog_bytes(self) -> int:
+        """Bytes written to the log but not yet acknowledged by Service Bus"""
+        return self._backlog_bytes
+
+    async def open(self):
+        """Recover the log state from disk and start accepting appends"""
+        await asyncio.to_thread(self._recover)
+        self._closed = False
+        self._committer = asyncio.create_task(self._run_committer())
+        logger.info(
+            "Event outbox opened",
+            directory=self.directory,
+            segments=len(self._segments),
+            backlog_bytes=self._backlog_bytes,
+            fsync=self.fsync
+        )
+
+    async def close(self):
+        """Stop draining, commit pending appends and close the active segment"""
+        await self.stop_drainer()
+        self._closed = True
+        self._pending_event.set()
+        if self._committer:
+            await self._committer
+            self._committer = None
+        await asyncio.to_thread(self._close_active, True)
+        logger.info("Event outbox closed", backlog_bytes=self._backlog_bytes)
+
+    async def append(self, message: ServiceBusMessage):
+        """Durably record a message; returns once it is committed per the fsync policy"""
+        if self._closed:
+            raise RuntimeError("Event outbox is closed")
+        if self.max_backlog_bytes and self._backlog_bytes >= self.max_backlog_bytes:
+            raise OutboxFullError(f"Outbox backlog exceeds {self.max_backlog_bytes} bytes")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((encode_record(message), future))
+        self._pending_event.set()
+        await future
+
+    async def start_drainer(self, sender: ServiceBusSender, max_batch_bytes: Optional[int] = None):
+        """Start replaying the log to Service Bus in order"""
+        self._drainer = asyncio.create_task(self._run_drainer(sender, max_batch_bytes))
+
+    async def stop_drainer(self):
+        """Stop the drainer; unsent records stay in the log for the next start"""
+        if self._drainer:
+            self._drainer.cancel()
+            await asyncio.gather(self._drainer, return_exceptions=True)
+            self._drainer = None
+        if self._cursor_write:
+            # A batch Service Bus acknowledged must not be replayed; let its cursor reach disk
+            await asyncio.gather(self._cursor_write, return_exceptions=True)
+            self._cursor_write = None
+
+    # Writer side
+
+    async def _run_committer(self):
+        while self._pending or not self._closed:
+            if not self._pending:
+                self._pending_event.clear()
+                if not self._unsynced:
+                    await self._pending_event.wait()
+                    continue
+                # Sync what the interval policy left unsynced if no write comes to do it in time
+                remaining = self._last_fsync + self.fsync_interval_seconds - time.monotonic()
+                try:
+                    await asyncio.wait_for(self._pending_event.wait(), max(0, remaining))
+                except asyncio.TimeoutError:
+                    await asyncio.to_thread(self._sync)
+                continue
+            if self.group_commit_seconds and not self._closed:
+                await asyncio.sleep(self.group_commit_seconds)
+
+            group, self._pending = self._pending, []
+            group = [(frame, future) for frame, future in group if not future.cancelled()]
+            try:
+                await asyncio.to_thread(self._write, b"".join(frame for frame, _ in group))
+            except Exception as e:
+                logger.error("Failed to write to event outbox", error=str(e), records=len(group))
+                for _, future in group:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self._backlog_bytes += sum(len(frame) for frame, _ in group)
+            for _, future in group:
+                if not future.done():
+                    future.set_result(None)
+            self._committed_event.set()
+
+    def _write(self, data: bytes):
+        if not data:
+            return
+        if self._active_file is None or self._active_size >= self.segment_max_bytes:
+            self._rotate()
+        self._active_file.write(data)
+        self._active_file.flush()
+        self._active_size += len(data)
+
+        if self.fsync == "always" or (
+            self.fsync == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval_seconds
+        ):
+            self._sync()
+        elif self.fsync == "interval":
+            self._unsynced = True
+
+    def _sync(self):
+        if self._active_file is not None:
+            os.fsync(self._active_file.fileno())
+        self._last_fsync = time.monotonic()
+        self._unsynced = False
+
+    def _rotate(self):
+        self._close_active(self.fsync != "never")
+        self._active_seq = (self._segments[-1] + 1) if self._segments else 1
+        self._active_file = open(self._segment_path(self._active_seq), "ab")
+        self._active_size = 0
+        self._segments.append(self._active_seq)
+        if self.fsync != "never":
+            self._fsync_directory()
+
+    def _close_active(self, sync: bool):
+        if self._active_file is None:
+            return
+        self._active_file.flush()
+        if sync:
+            os.fsync(self._active_file.fileno())
+            self._unsynced = False
+        self._active_file.close()
+        self._active_file = None
+
+    # Reader side
+
+    async def _run_drainer(self, sender: ServiceBusSender, max_batch_bytes: Optional[int]):
+        backoff = 0.1
+        # Records read but not yet sent, in log order; only read again once they run out
+        records: List[Tuple[ServiceBusMessage, LogPosition]] = []
+        while True:
+            if not records:
+                # Cleared before reading, so a commit that lands during the read still wakes the wait below
+                self._committed_event.clear()
+                records = await asyncio.to_thread(self._read_records, self.drain_batch_records)
+                if not records:
+                    await self._committed_event.wait()
+                    continue
+
+            try:
+                batch = await sender.create_message_batch(max_batch_bytes)
+                end = self._cursor
+                taken = 0
+                for message, position in records:
+                    try:
+                        batch.add_message(message)
+                    except MessageSizeExceededError:
+                        if len(batch) > 0:
+                            break
+                        # Can never be sent; skip it rather than block the log
+                        logger.error("Dropping oversized event from outbox", message_id=message.message_id)
+                    end = position
+                    taken += 1
+                if len(batch) > 0:
+                    await sender.send_messages(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Outbox replay failed, will retry", error=str(e), retry_in=backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+
+            backoff = 0.1
+            # Shielded: once the batch is sent, stopping the drainer must not lose its cursor
+            self._cursor_write = asyncio.ensure_future(asyncio.to_thread(self._advance_cursor, end))
+            self._cursor_write.add_done_callback(self._release_backlog)
+            await asyncio.shield(self._cursor_write)
+            self._cursor_write = None
+            records = records[taken:]
+
+    def _release_backlog(self, cursor_write: asyncio.Future):
+        # Runs on the loop, the only place the backlog count is updated
+        if not cursor_write.cancelled() and cursor_write.exception() is None:
+            self._backlog_bytes = max(0, self._backlog_bytes - cursor_write.result())
+
+    def _read_records(self, limit: int) -> List[Tuple[ServiceBusMessage, LogPosition]]:
+        """Read up to limit records after the cursor, each with the position just past it"""
+        records: List[Tuple[ServiceBusMessage, LogPosition]] = []
+        seq, offset = self._cursor
+        for segment in self._segments:
+            if segment < seq:
+                continue
+            if segment > seq:
+                offset = 0
+            # Never read past what the writer has committed in the active segment
+            end = self._active_size if segment == self._active_seq and self._active_file else None
+            with open(self._segment_path(segment), "rb") as f:
+                f.seek(offset)
+                while len(records) < limit and (end is None or offset < end):
+                    frame = f.read(FRAME_HEADER.size)
+                    if len(frame) < FRAME_HEADER.size:
+                        break
+                    header_len, body_len, crc = FRAME_HEADER.unpack(frame)
+                    header = f.read(header_len)
+                    body = f.read(body_len)
+                    if len(header) < header_len or len(body) < body_len or \
+                            zlib.crc32(body, zlib.crc32(header)) != crc:
+                        logger.warning("Torn record at end of outbox segment", segment=segment, offset=offset)
+                        break
+                    offset += FRAME_HEADER.size + header_len + body_len
+                    records.append((decode_record(header, body), (segment, offset)))
+            if len(records) >= limit:
+                break
+        return records
+
+    def _advance_cursor(self, position: LogPosition) -> int:
+        """Persist the cursor at position and drop consumed segments; returns the bytes consumed"""
+        old_seq, old_offset = self._cursor
+        seq, offset = position
+        consumed = 0
+        for segment in self._segments:
+            if segment < old_seq or segment > seq:
+                continue
+            start = old_offset if segment == old_seq else 0
+            stop = offset if segment == seq else os.path.getsize(self._segment_path(segment))
+            consumed += stop - start
+        self._cursor = position
+
+        cursor_path = os.path.join(self.directory, CURSOR_FILE)
+        with open(cursor_path + ".tmp", "w") as f:
+            json.dump({"segment": seq, "offset": offset}, f)
+            f.flush()
+            if self.fsync != "never":
+                os.fsync(f.fileno())
+        os.replace(cursor_path + ".tmp", cursor_path)
+
+        # Truncate: drop segments the drainer has moved past
+        for segment in [s for s in self._segments if s < seq and s != self._active_seq]:
+            os.remove(self._segment_path(segment))
+            self._segments.remove(segment)
+        return consumed
+
+    # Recovery
+
+    def _recover(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+        cursor_path = os.path.join(self.directory, CURSOR_FILE)
+        if os.path.exists(cursor_path):
+            with open(cursor_path) as f:
+                saved = json.load(f)
+            self._cursor = (saved["segment"], saved["offset"])
+        elif self._segments:
+            self._cursor = (self._segments[0], 0)
+
+        seq, offset = self._cursor
+        self._backlog_bytes = sum(
+            os.path.getsize(self._segment_path(segment)) - (offset if segment == seq else 0)
+            for segment in self._segments
+            if segment >= seq
+        )
+        # Always append to a fresh segment so a torn tail is never written after
+        self._rotate()
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:020d}{SEGMENT_SUFFIX}")
+
+    def _fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
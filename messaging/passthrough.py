@@ -0,0 +1,55 @@
+"""
+Raw-body passthrough for /events
+Extracts the envelope fields from the request body and splices the original `data`
+bytes into the outgoing message body without decoding or re-encoding them.
+Requires msgspec; AVAILABLE is False when it is not installed.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+try:
+    import msgspec
+    AVAILABLE = True
+except ImportError:
+    msgspec = None
+    AVAILABLE = False
+
+class PayloadError(ValueError):
+    """Raised when a raw request body is not a valid event payload"""
+
+if AVAILABLE:
+    class RawEventPayload(msgspec.Struct):
+        """
+        Envelope of an event payload with ``data`` kept as the raw JSON span.
+
+        Exposes the same attributes as ``EventPayload`` so it can be handled by
+        the same request code; ``data`` is a ``msgspec.Raw`` view into the
+        request body.
+        """
+        event_type: str
+        data: msgspec.Raw
+        source: Optional[str] = None
+        correlation_id: Optional[str] = None
+        timestamp: Optional[datetime] = None
+
+    _decoder = msgspec.json.Decoder(RawEventPayload)
+    _encoder = msgspec.json.Encoder()
+
+def is_raw(payload: Any) -> bool:
+    """Whether a payload came from parse_event and carries raw data bytes"""
+    return AVAILABLE and isinstance(payload, RawEventPayload)
+
+def parse_event(body: bytes) -> "RawEventPayload":
+    """Decode the envelope fields; the data value is validated as JSON but not decoded"""
+    try:
+        payload = _decoder.decode(body)
+    except msgspec.DecodeError as e:
+        raise PayloadError(str(e)) from e
+    if len(payload.data) == 0 or memoryview(payload.data)[0] != ord("{"):
+        raise PayloadError("Expected `object` - at `$.data`")
+    return payload
+
+def encode_event(event_data: Dict[str, Any]) -> bytes:
+    """Encode an event body, copying raw ``data`` bytes through verbatim"""
+    return _encoder.encode(event_data)
@@ -0,0 +1,56 @@
+"""
+Sender pool for parallel Service Bus sends
+Spreads batches over several AMQP links with a cap on sends in flight.
+"""
+
+import asyncio
+from typing import List, Optional
+
+import structlog
+from azure.servicebus import ServiceBusMessageBatch
+from azure.servicebus.aio import ServiceBusSender
+
+from messaging.retry import RetryPolicy
+
+logger = structlog.get_logger()
+
+class SenderPool:
+    """Round-robin pool of long-lived senders with bounded send concurrency"""
+    
+    def __init__(
+        self,
+        senders: List[ServiceBusSender],
+        max_in_flight: int = 0,
+        retry_policy: Optional[RetryPolicy] = None
+    ):
+        if not senders:
+            raise ValueError("Sender pool needs at least one sender")
+        self.senders = senders
+        self.retry_policy = retry_policy
+        # Default to one send in flight per link
+        self.max_in_flight = max_in_flight or len(senders)
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._next = 0
+    
+    @property
+    def primary(self) -> ServiceBusSender:
+        """Sender used for single-event sends and batch sizing"""
+        return self.senders[0]
+    
+    def next_sender(self) -> ServiceBusSender:
+        """Pick the next sender in round-robin order"""
+        sender = self.senders[self._next]
+        self._next = (self._next + 1) % len(self.senders)
+        return sender
+    
+    async def send(self, batch: ServiceBusMessageBatch):
+        """Send a batch on the next link once an in-flight slot is free"""
+        if self.retry_policy:
+            # Each attempt moves on to the next link and frees its slot while backing off
+            await self.retry_policy.call(lambda: self._send_once(batch))
+        else:
+            await self._send_once(batch)
+    
+    async def _send_once(self, batch: ServiceBusMessageBatch):
+        async with self._semaphore:
+            await self.next_sender().send_messages(batch)
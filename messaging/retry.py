@@ -0,0 +1,156 @@
+"""
+Retry policy for Service Bus sends
+Exponential backoff with full jitter, capped by a process-wide retry budget.
+"""
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+import structlog
+from azure.servicebus.exceptions import (
+    OperationTimeoutError,
+    ServiceBusCommunicationError,
+    ServiceBusConnectionError,
+    ServiceBusServerBusyError,
+)
+
+from messaging.breaker import CircuitBreaker
+
+logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+# Errors worth retrying: the broker or the network may recover within seconds
+TRANSIENT_ERRORS: Tuple[Type[BaseException], ...] = (
+    ServiceBusConnectionError,
+    ServiceBusCommunicationError,
+    ServiceBusServerBusyError,
+    OperationTimeoutError,
+    ConnectionError,
+    asyncio.TimeoutError,
+)
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a fraction of first attempts.
+    
+    Every first attempt deposits ``ratio`` tokens and every retry withdraws
+    one, so during a broker brownout retries add at most ``ratio`` extra load.
+    ``min_per_second`` tokens are added over time so low-traffic processes can
+    still retry.
+    """
+    
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 10, max_tokens: float = 100):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+    
+    def deposit(self):
+        """Record a first attempt"""
+        self._refill()
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+    
+    def try_withdraw(self) -> bool:
+        """Take a token for a retry; False when the budget is exhausted"""
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+    
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+class RetryPolicy:
+    """
+    Retries transient failures with exponential backoff and full jitter.
+    
+    With a circuit breaker, each call (including its retries) counts as one
+    outcome for the breaker, calls fail fast with ``CircuitOpenError`` while it
+    is open, and pending retries are abandoned as soon as it opens.
+    """
+    
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay_ms: float = 100,
+        max_delay_ms: float = 5000,
+        budget: Optional[RetryBudget] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay_ms / 1000
+        self.max_delay = max_delay_ms / 1000
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker
+        
+        # Metrics
+        self.calls = 0
+        self.retries = 0
+        self.retry_seconds = 0.0
+        self.exhausted = 0
+        self.budget_rejections = 0
+    
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform between 0 and the capped exponential delay"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+    
+    async def call(self, operation: Callable[[], Awaitable[T]]) -> T:
+        """Run operation, retrying transient errors while attempts and budget allow"""
+        if self.breaker:
+            return await self.breaker.call(lambda: self._call_with_retries(operation))
+        return await self._call_with_retries(operation)
+    
+    async def _call_with_retries(self, operation: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        self.budget.deposit()
+        attempt = 0
+        first_failure = None
+        try:
+            while True:
+                try:
+                    return await operation()
+                except TRANSIENT_ERRORS as e:
+                    if first_failure is None:
+                        first_failure = time.monotonic()
+                    attempt += 1
+                    if attempt >= self.max_attempts:
+                        self.exhausted += 1
+                        raise
+                    if self.breaker and self.breaker.state == CircuitBreaker.OPEN:
+                        raise
+                    if not self.budget.try_withdraw():
+                        self.budget_rejections += 1
+                        logger.warning("Retry budget exhausted, not retrying", error=str(e))
+                        raise
+                    
+                    delay = self.backoff(attempt - 1)
+                    logger.warning("Transient send failure, retrying", error=str(e), attempt=attempt, delay=delay)
+                    self.retries += 1
+                    await asyncio.sleep(delay)
+        finally:
+            # Time from the first failure until success or giving up
+            if first_failure is not None:
+                self.retry_seconds += time.monotonic() - first_failure
+    
+    def stats(self) -> Dict[str, float]:
+        """Retry metrics for the health and metrics endpoints"""
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "retry_seconds": round(self.retry_seconds, 3),
+            "exhausted": self.exhausted,
+            "budget_rejections": self.budget_rejections,
+            "budget_tokens": round(self.budget.tokens, 2)
+        }
@@ -0,0 +1,76 @@
+"""
+JSON serialization for message bodies and HTTP responses
+Uses orjson or msgspec when installed and falls back to the standard library.
+"""
+
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Callable, Dict
+
+import structlog
+
+logger = structlog.get_logger()
+
+def _stdlib_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _stdlib_dumps(value: Any) -> bytes:
+    return json.dumps(value, default=_stdlib_default, separators=(",", ":")).encode('utf-8')
+
+def _load_backends() -> Dict[str, Callable[[Any], bytes]]:
+    """Encoders for every backend importable in this environment, fastest first"""
+    backends: Dict[str, Callable[[Any], bytes]] = {}
+    try:
+        import orjson
+
+        def orjson_dumps(value: Any) -> bytes:
+            try:
+                return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+            except orjson.JSONEncodeError:
+                # Values orjson can't represent, such as integers beyond 64 bits, that json can
+                return _stdlib_dumps(value)
+        backends["orjson"] = orjson_dumps
+    except ImportError:
+        pass
+    try:
+        import msgspec
+
+        encode = msgspec.json.Encoder().encode
+
+        def msgspec_dumps(value: Any) -> bytes:
+            try:
+                return encode(value)
+            except (msgspec.EncodeError, TypeError, OverflowError):
+                return _stdlib_dumps(value)
+        backends["msgspec"] = msgspec_dumps
+    except ImportError:
+        pass
+    backends["json"] = _stdlib_dumps
+    return backends
+
+def _load_loads(backend: str) -> Callable[[bytes], Any]:
+    if backend == "orjson":
+        import orjson
+        return orjson.loads
+    if backend == "msgspec":
+        import msgspec
+        return msgspec.json.Decoder().decode
+    return json.loads
+
+BACKENDS = _load_backends()
+
+SERIALIZER_BACKEND = os.getenv("SERIALIZER_BACKEND", "auto").lower()
+if SERIALIZER_BACKEND == "auto":
+    BACKEND = next(iter(BACKENDS))
+elif SERIALIZER_BACKEND in BACKENDS:
+    BACKEND = SERIALIZER_BACKEND
+else:
+    logger.warning("Serializer backend not available, using fallback", requested=SERIALIZER_BACKEND)
+    BACKEND = next(iter(BACKENDS))
+
+# Encode straight to UTF-8 bytes; datetimes are written in ISO 8601
+dumps: Callable[[Any], bytes] = BACKENDS[BACKEND]
+loads: Callable[[bytes], Any] = _load_loads(BACKEND)
@@ -0,0 +1,95 @@
+"""
+API key store
+Keeps only keyed hashes of API keys and verifies presented keys against them.
+"""
+
+import hashlib
+import hmac
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+import yaml
+
+from middleware.policy import RateLimitRule, parse_duration
+
+class APIKey(NamedTuple):
+    """A known API key, identified by key_id; the key itself is never stored"""
+    key_id: str
+    digest: bytes
+    permissions: FrozenSet[str] = frozenset()
+    rate_limits: Mapping[str, RateLimitRule] = MappingProxyType({})
+
+def hash_api_key(api_key: str, salt: bytes) -> bytes:
+    """Keyed BLAKE2b digest of an API key, as stored in the keys file (hex encoded)"""
+    return hashlib.blake2b(api_key.encode(), key=salt[:64], digest_size=32).digest()
+
+def load_api_keys(path: str) -> List[APIKey]:
+    """
+    Read API keys from a YAML file of the form::
+
+        keys:
+          - id: "tenant-a"
+            hash: "<hex of hash_api_key(key, API_KEY_SALT)>"
+            permissions: ["events:create"]
+            rate_limits:
+              - endpoint: "/events"
+                limit: 100
+                window: "1m"
+    """
+    with open(path) as f:
+        document = yaml.safe_load(f) or {}
+    if not isinstance(document.get("keys"), list):
+        raise ValueError(f"No keys found in {path}")
+    return [_api_key(entry) for entry in document["keys"]]
+
+def _api_key(entry: Dict[str, Any]) -> APIKey:
+    return APIKey(
+        key_id=str(entry["id"]),
+        digest=bytes.fromhex(entry["hash"]),
+        permissions=frozenset(entry.get("permissions", ())),
+        rate_limits={
+            limit["endpoint"]: RateLimitRule(
+                int(limit["limit"]), parse_duration(limit["window"]), limit.get("burst")
+            )
+            for limit in entry.get("rate_limits", ())
+        }
+    )
+
+class APIKeyValidator:
+    """
+    Verifies presented API keys against their stored digests.
+    
+    A presented key is hashed with the store's salt, found by digest and
+    confirmed with a constant-time compare. Digests verified recently are
+    kept in a small LRU with their records; unknown keys are never cached,
+    so they can't push valid ones out.
+    """
+    
+    def __init__(self, keys: Iterable[APIKey], salt: bytes, cache_size: int = 1024):
+        self.salt = salt
+        self.cache_size = max(1, cache_size)
+        self._by_digest: Dict[bytes, APIKey] = {key.digest: key for key in keys}
+        self._verified: "OrderedDict[bytes, APIKey]" = OrderedDict()
+    
+    @property
+    def keys(self) -> List[APIKey]:
+        return list(self._by_digest.values())
+    
+    def validate_key(self, api_key: str) -> Tuple[bool, Optional[APIKey]]:
+        """Validate API key and return its record"""
+        digest = hash_api_key(api_key, self.salt)
+        key = self._verified.get(digest)
+        if key is not None:
+            self._verified.move_to_end(digest)
+        else:
+            key = self._by_digest.get(digest)
+            if key is None:
+                return False, None
+            if len(self._verified) >= self.cache_size:
+                self._verified.popitem(last=False)
+            self._verified[digest] = key
+        
+        if not hmac.compare_digest(key.digest, digest):
+            return False, None
+        return True, key
@@ -0,0 +1,154 @@
+"""
+CIDR allow and deny lists for the ip-filter policy
+Matches client addresses against IPv4 and IPv6 networks with a path-compressed binary trie.
+"""
+
+import socket
+from typing import Iterable, List, Optional, Tuple
+
+class _Node:
+    __slots__ = ("bits", "length", "value", "children")
+    
+    def __init__(self, bits: int, length: int, value: Optional[bool] = None):
+        # The first length bits of the address, as an integer
+        self.bits = bits
+        self.length = length
+        self.value = value
+        self.children: List[Optional["_Node"]] = [None, None]
+
+class PrefixTrie:
+    """
+    Longest-prefix match over the addresses of one family.
+    
+    Chains of single-child nodes are collapsed into one node, so the trie
+    holds fewer than two nodes per network however long the prefixes are,
+    and a lookup visits at most one node per differing bit.
+    """
+    
+    def __init__(self, width: int):
+        self.width = width
+        self.root = _Node(0, 0)
+        self.size = 0
+    
+    def insert(self, bits: int, length: int, value: bool):
+        """Store value for the network whose first length bits are bits"""
+        node = self.root
+        while True:
+            if node.length == length:
+                if node.value is None:
+                    self.size += 1
+                # Deny wins when a network is listed both ways
+                node.value = value if node.value is None else node.value and value
+                return
+            branch = (bits >> (length - node.length - 1)) & 1
+            child = node.children[branch]
+            if child is None:
+                node.children[branch] = _Node(bits, length, value)
+                self.size += 1
+                return
+            
+            # Bits the child's prefix shares with the new one
+            common = min(child.length, length)
+            common -= ((child.bits >> (child.length - common)) ^ (bits >> (length - common))).bit_length()
+            if common == child.length:
+                node = child
+                continue
+            
+            # Split the child's edge where the prefixes diverge
+            middle = _Node(bits >> (length - common), common)
+            middle.children[(child.bits >> (child.length - common - 1)) & 1] = child
+            node.children[branch] = middle
+            if common == length:
+                middle.value = value
+            else:
+                middle.children[(bits >> (length - common - 1)) & 1] = _Node(bits, length, value)
+            self.size += 1
+            return
+    
+    def lookup(self, address: int) -> Optional[bool]:
+        """Value of the longest stored prefix of address, or None if none matches"""
+        width = self.width
+        node = self.root
+        best = node.value
+        while node.length < width:
+            node = node.children[(address >> (width - node.length - 1)) & 1]
+            if node is None or address >> (width - node.length) != node.bits:
+                break
+            if node.value is not None:
+                best = node.value
+        return best
+
+def parse_address(ip: str) -> Optional[Tuple[int, int]]:
+    """(family width, integer value) of an address, IPv4-mapped IPv6 as IPv4; None if invalid"""
+    # inet_pton is several times faster than ipaddress.ip_address
+    try:
+        return 32, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except OSError:
+        pass
+    try:
+        value = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip.split("%", 1)[0]), "big")
+    except OSError:
+        return None
+    if value >> 32 == 0xFFFF:
+        return 32, value & 0xFFFFFFFF
+    return 128, value
+
+def _networks(cidrs: Iterable[str]) -> Iterable[Tuple[int, int, int]]:
+    """(family width, prefix bits, prefix length) of each CIDR or bare address; host bits are ignored"""
+    for cidr in cidrs:
+        address, _, length = str(cidr).strip().partition("/")
+        parsed = parse_address(address)
+        if parsed is None or (length and not length.isdigit()):
+            raise ValueError(f"Invalid network: {cidr!r}")
+        width, value = parsed
+        prefix = int(length) if length else width
+        if ":" in address and width == 32 and length:
+            # An IPv4-mapped network, counted in IPv6 bits
+            prefix -= 96
+        if not 0 <= prefix <= width:
+            raise ValueError(f"Invalid network: {cidr!r}")
+        yield width, value >> (width - prefix), prefix
+
+class IPFilter:
+    """
+    Allow and deny lists of networks.
+    
+    The most specific listed network containing an address decides whether
+    it is allowed, so a narrow deny can carve out of a wide allow and vice
+    versa. An address in no listed network, of either family, or one that
+    can't be parsed is allowed only if there is no allow list at all.
+    """
+    
+    def __init__(self, allowed: Iterable[str] = (), blocked: Iterable[str] = ()):
+        self._tries = {32: PrefixTrie(32), 128: PrefixTrie(128)}
+        for width, bits, length in _networks(allowed):
+            self._tries[width].insert(bits, length, True)
+        # Unlisted addresses are allowed unless there is an allow list
+        self._default = all(trie.size == 0 for trie in self._tries.values())
+        for width, bits, length in _networks(blocked):
+            self._tries[width].insert(bits, length, False)
+        self.size = sum(trie.size for trie in self._tries.values())
+    
+    def __repr__(self) -> str:
+        return f"IPFilter(networks={self.size})"
+    
+    def is_allowed(self, ip: str) -> bool:
+        address = parse_address(ip)
+        if address is None:
+            return self._default
+        width, value = address
+        matched = self._tries[width].lookup(value)
+        return self._default if matched is None else matched
+
+def forwarded_client(peer: str, forwarded_for: Optional[str], trusted_proxies: int) -> str:
+    """
+    Client address of a request that passed through trusted_proxies proxies.
+    
+    Each proxy appends the address it received the request from to
+    X-Forwarded-For, so the entry trusted_proxies from the right was written
+    by the outermost trusted proxy; anything left of it is client-supplied.
+    """
+    if trusted_proxies <= 0 or not forwarded_for:
+        return peer
+    hops = [hop.strip() for hop in forwarded_for.split(",")]
+    return hops[-trusted_proxies] if len(hops) >= trusted_proxies else hops[0]
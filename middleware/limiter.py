@@ -0,0 +1,274 @@
+"""
+Rate limiter backends
+GCRA buckets kept in process, or in Redis so the limit is shared by every replica.
+"""
+
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional
+
+import structlog
+
+from middleware.store import ExpiringLRU
+
+logger = structlog.get_logger()
+
+# Atomic GCRA on a Redis key holding the theoretical arrival time in microseconds
+# of the server clock. Grants between ARGV[4] and ARGV[3] permits, or none, and
+# returns how many. A full bucket always grants the minimum, going into debt if
+# it exceeds the burst, so oversized requests are slowed rather than refused forever.
+GCRA_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local minimum = tonumber(ARGV[4])
+
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+
+local granted = math.floor((tolerance - (tat - now)) / interval) + 1
+if granted > wanted then
+    granted = wanted
+end
+if granted < minimum then
+    if tat > now then
+        return 0
+    end
+    granted = minimum
+end
+
+tat = tat + granted * interval
+redis.call('SET', KEYS[1], string.format('%.0f', tat), 'PX', math.ceil((tat - now) / 1000))
+return granted
+"""
+
+class RateLimitBackend(ABC):
+    """
+    Interface for rate limiter state: one GCRA bucket per key.
+    
+    ``cost`` is the number of permits a request takes. A request costing more
+    than the burst is allowed when the bucket is full and leaves it in debt,
+    so it is paid for by the requests after it.
+    """
+    
+    @abstractmethod
+    async def acquire(
+        self,
+        key: str,
+        limit: int,
+        window_seconds: float,
+        burst: Optional[int] = None,
+        cost: int = 1
+    ) -> bool:
+        """Take cost permits from key's bucket; False when the limit is exceeded"""
+    
+    @abstractmethod
+    async def release(self, key: str, limit: int, window_seconds: float, cost: int = 1):
+        """Return permits taken for a request that was rejected before doing any work"""
+    
+    def forget(self, predicate: Callable[[str], bool]) -> int:
+        """Drop the process-local state of every key matching predicate; returns how many"""
+        return 0
+    
+    def stats(self) -> Dict[str, int]:
+        return {}
+    
+    async def close(self):
+        pass
+
+class LocalRateLimitBackend(RateLimitBackend):
+    """
+    GCRA buckets in process memory.
+    
+    Equivalent to a token bucket refilled at ``limit / window_seconds`` per
+    second with room for ``burst`` requests (``limit`` when no burst is
+    configured), but each key stores only its theoretical arrival time: one
+    float, however high the limit.
+    """
+    
+    def __init__(self, max_keys: int = 100000):
+        # Per-key theoretical arrival times; a key expires once its time has passed,
+        # since an absent key behaves exactly like one that has fully refilled
+        self.requests = ExpiringLRU(max_keys)
+    
+    async def acquire(
+        self,
+        key: str,
+        limit: int,
+        window_seconds: float,
+        burst: Optional[int] = None,
+        cost: int = 1
+    ) -> bool:
+        return self.try_acquire(key, limit, window_seconds, burst, cost)
+    
+    def try_acquire(
+        self,
+        key: str,
+        limit: int,
+        window_seconds: float,
+        burst: Optional[int] = None,
+        cost: int = 1
+    ) -> bool:
+        """Synchronous acquire, for callers outside the event loop"""
+        now = time.monotonic()
+        
+        # Each permit advances the key's theoretical arrival time by one emission
+        # interval; the request fits if its last permit stays within the burst tolerance
+        interval = window_seconds / limit
+        tat = self.requests.get(key, now, now)
+        
+        # Check if limit exceeded (with a nanosecond of slack for float rounding)
+        if tat - now > interval * ((burst or limit) - cost) + 1e-9 and tat > now:
+            return False
+        
+        # Record current request
+        tat += interval * cost
+        self.requests.set(key, tat, tat)
+        return True
+    
+    async def release(self, key: str, limit: int, window_seconds: float, cost: int = 1):
+        now = time.monotonic()
+        tat = self.requests.get(key, now)
+        if tat is not None:
+            tat = max(now, tat - window_seconds / limit * cost)
+            self.requests.set(key, tat, tat)
+    
+    def forget(self, predicate: Callable[[str], bool]) -> int:
+        return self.requests.discard_matching(predicate)
+    
+    def stats(self) -> Dict[str, int]:
+        requests = self.requests.stats()
+        return {
+            "keys": requests["live_keys"],
+            "key_evictions": requests["evictions"],
+            "key_expirations": requests["expirations"]
+        }
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """
+    GCRA buckets in Redis, shared by every replica.
+    
+    Each round trip runs GCRA_SCRIPT, which takes up to ``lease_size``
+    permits at once; they are then handed out locally until used or until
+    ``lease_ms`` has passed. Leasing keeps most checks off the network at the
+    cost of accuracy: a replica can strand up to ``lease_size - 1`` permits
+    per key for one lease period. Concurrent checks for the same key share
+    one round trip. If Redis is unreachable, checks fall back to the
+    in-process limiter.
+    """
+    
+    def __init__(
+        self,
+        client,
+        lease_size: int = 10,
+        lease_ms: float = 500,
+        key_prefix: str = "ratelimit:",
+        max_keys: int = 100000
+    ):
+        self.client = client
+        self.lease_size = max(1, lease_size)
+        self.lease_seconds = lease_ms / 1000
+        self.key_prefix = key_prefix
+        self.fallback = LocalRateLimitBackend(max_keys)
+        self._script = client.register_script(GCRA_SCRIPT)
+        # Unused leased permits per key, expiring with the lease
+        self._leases = ExpiringLRU(max_keys)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        
+        # Metrics
+        self.round_trips = 0
+        self.errors = 0
+    
+    async def acquire(
+        self,
+        key: str,
+        limit: int,
+        window_seconds: float,
+        burst: Optional[int] = None,
+        cost: int = 1
+    ) -> bool:
+        while True:
+            lease = self._leases.get(key, time.monotonic())
+            held = lease[0] if lease is not None else 0
+            if held >= cost:
+                lease[0] -= cost
+                return True
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                if await asyncio.shield(in_flight) == 0:
+                    return False
+                continue
+            
+            future = asyncio.get_running_loop().create_future()
+            self._in_flight[key] = future
+            granted = 0
+            try:
+                granted = await self._lease(key, limit, window_seconds, burst, cost - held)
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Rate limit backend unavailable, limiting locally", error=str(e))
+                granted = int(self.fallback.try_acquire(key, limit, window_seconds, burst, cost))
+                return bool(granted)
+            finally:
+                del self._in_flight[key]
+                future.set_result(granted)
+            
+            if granted == 0:
+                return False
+            # Other checks may have spent the lease during the round trip; add to what is left
+            # of it now and take the cost on the next pass, going back to Redis if it fell short
+            now = time.monotonic()
+            lease = self._leases.get(key, now)
+            self._leases.set(key, [(lease[0] if lease is not None else 0) + granted], now + self.lease_seconds)
+    
+    async def release(self, key: str, limit: int, window_seconds: float, cost: int = 1):
+        # Refunded permits are kept in the local lease rather than returned to Redis
+        now = time.monotonic()
+        lease = self._leases.get(key, now)
+        self._leases.set(key, [(lease[0] if lease is not None else 0) + cost], now + self.lease_seconds)
+    
+    def forget(self, predicate: Callable[[str], bool]) -> int:
+        # The buckets in Redis are shared with replicas that may not have reloaded
+        # yet, so only the local leases are dropped
+        return self._leases.discard_matching(predicate) + self.fallback.forget(predicate)
+    
+    async def _lease(self, key: str, limit: int, window_seconds: float, burst: Optional[int], needed: int) -> int:
+        capacity = burst or limit
+        interval_us = window_seconds * 1000000 / limit
+        self.round_trips += 1
+        return int(await self._script(
+            keys=[self.key_prefix + key],
+            args=[interval_us, interval_us * (capacity - 1), max(needed, min(self.lease_size, capacity)), needed]
+        ))
+    
+    def stats(self) -> Dict[str, int]:
+        leases = self._leases.stats()
+        return {
+            "leased_keys": leases["live_keys"],
+            "round_trips": self.round_trips,
+            "backend_errors": self.errors,
+            **self.fallback.stats()
+        }
+    
+    async def close(self):
+        await self.client.aclose()
+
+def create_backend(
+    kind: str,
+    max_keys: int = 100000,
+    redis_url: Optional[str] = None,
+    lease_size: int = 10,
+    lease_ms: float = 500
+) -> RateLimitBackend:
+    """Build the configured backend; redis needs the redis package"""
+    if kind == "redis":
+        import redis.asyncio as redis
+        
+        client = redis.from_url(redis_url, socket_timeout=0.1, socket_connect_timeout=0.5)
+        return RedisRateLimitBackend(client, lease_size, lease_ms, max_keys=max_keys)
+    return LocalRateLimitBackend(max_keys)
@@ -0,0 +1,337 @@
+"""
+Structured logging off the event loop
+structlog records are queued as they are logged and rendered to JSON and written by a background thread.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Dict, Iterable, List, Optional, TextIO
+
+import structlog
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+OVERFLOW_POLICIES = ("drop", "block")
+
+class OrjsonRenderer:
+    """
+    Renders the event dict as one line of JSON, with orjson when installed;
+    values it can't encode are written as their repr.
+    """
+    
+    def __call__(self, logger: Any, name: str, event_dict: Dict[str, Any]) -> str:
+        if ORJSON_AVAILABLE:
+            try:
+                return orjson.dumps(event_dict, default=repr, option=orjson.OPT_NON_STR_KEYS).decode()
+            except orjson.JSONEncodeError:
+                # e.g. integers wider than 64 bits, which json writes as they are
+                pass
+        return json.dumps(event_dict, default=repr)
+
+class _Stdout:
+    """sys.stdout as it is at write time, so redirecting it (pytest, uvicorn reload) is followed"""
+    
+    def write(self, text: str):
+        sys.stdout.write(text)
+    
+    def flush(self):
+        sys.stdout.flush()
+
+class LogQueueHandler(QueueHandler):
+    """
+    Puts records on a bounded queue for the listener thread.
+    
+    When the queue is full a record is dropped and counted, or with
+    ``block=True`` the logging call waits for room. Records from structlog
+    are queued as their event dict, unrendered; stdlib records have their
+    message formatted here, since their arguments may change once queued.
+    """
+    
+    def __init__(self, log_queue: queue.Queue, block: bool = False):
+        super().__init__(log_queue)
+        self.block = block
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if not isinstance(record.msg, dict) and record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class _LogQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room rather than fail when the queue is full at shutdown
+        self.queue.put(self._sentinel)
+
+def _record_timestamp(logger: Any, name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    # Stdlib records are rendered on the logging thread; stamp them with when they were logged
+    event_dict["timestamp"] = datetime.utcfromtimestamp(event_dict["_record"].created).isoformat() + "Z"
+    return event_dict
+
+ROLLUP_EVENT = "Log rollup"
+# Distinct values counted per rollup field before the rest are counted as "other"
+ROLLUP_MAX_VALUES = 50
+# Levels that are sampled; warnings and errors are always kept
+SAMPLED_LEVELS = frozenset({"debug", "info"})
+
+class _Rollup:
+    __slots__ = ("count", "dropped", "by_field")
+    
+    def __init__(self, fields: Iterable[str]):
+        self.count = 0
+        self.dropped = 0
+        self.by_field: Dict[str, Dict[Any, int]] = {field: {} for field in fields}
+
+class LogSampler:
+    """
+    structlog processor that thins out repetitive debug and info lines.
+    
+    Lines are keyed by their message. The first ``burst`` lines of a key in
+    each second are kept, and the rest with probability ``rate``. Every
+    ``rollup_interval`` seconds, each key that had lines dropped is summed
+    up in one "Log rollup" line: how many were logged in all, how many were
+    dropped, and the counts by each of ``rollup_fields``. Rollups are logged
+    by a background thread once ``start`` is called (``configure`` does),
+    so they come out on time even when no more lines are logged.
+    """
+    
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 10,
+        rollup_interval: float = 10.0,
+        rollup_fields: Iterable[str] = ("event_type",),
+        clock: Callable[[], float] = time.monotonic,
+        rng: Callable[[], float] = random.random
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.rollup_interval = rollup_interval
+        self.rollup_fields = tuple(rollup_fields)
+        self.clock = clock
+        self.rng = rng
+        self.dropped = 0
+        self._lock = threading.Lock()
+        # key -> [second, lines kept in it before sampling]
+        self._windows: Dict[str, List[int]] = {}
+        self._rollups: Dict[str, _Rollup] = {}
+        self._rollup_start = clock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def __call__(self, logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+        if method_name not in SAMPLED_LEVELS:
+            return event_dict
+        key = event_dict.get("event")
+        if not isinstance(key, str) or key == ROLLUP_EVENT:
+            return event_dict
+        
+        now = self.clock()
+        with self._lock:
+            rollup = self._rollups.get(key)
+            if rollup is None:
+                rollup = self._rollups[key] = _Rollup(self.rollup_fields)
+            rollup.count += 1
+            for field, counts in rollup.by_field.items():
+                value = event_dict.get(field)
+                if value is not None:
+                    if not isinstance(value, (str, int, float)):
+                        # Lists and dicts can't be counted by value, and only strings and numbers render as keys
+                        value = repr(value)
+                    if value not in counts and len(counts) >= ROLLUP_MAX_VALUES:
+                        value = "other"
+                    counts[value] = counts.get(value, 0) + 1
+            
+            second = int(now)
+            window = self._windows.get(key)
+            if window is None or window[0] != second:
+                window = self._windows[key] = [second, 0]
+            keep = window[1] < self.burst or self.rng() < self.rate
+            window[1] += 1
+            if not keep:
+                rollup.dropped += 1
+                self.dropped += 1
+        
+        if not keep:
+            raise structlog.DropEvent
+        return event_dict
+    
+    def rollups(self) -> List[Dict[str, Any]]:
+        """Summaries of the keys sampled since the last call, starting a new interval"""
+        with self._lock:
+            now = self.clock()
+            seconds = round(now - self._rollup_start, 3)
+            rollups, self._rollups = self._rollups, {}
+            self._rollup_start = now
+        return [
+            {
+                "key": key,
+                "count": rollup.count,
+                "dropped": rollup.dropped,
+                "seconds": seconds,
+                **{f"by_{field}": counts for field, counts in rollup.by_field.items() if counts},
+            }
+            for key, rollup in rollups.items()
+            if rollup.dropped
+        ]
+    
+    def flush(self):
+        """Log the rollups of the interval so far"""
+        log = structlog.get_logger(__name__)
+        for rollup in self.rollups():
+            log.info(ROLLUP_EVENT, **rollup)
+    
+    def start(self):
+        """Log the rollups every ``rollup_interval`` seconds from a background thread"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="log-rollups", daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+    
+    def _run(self):
+        while not self._stop.wait(self.rollup_interval):
+            self.flush()
+
+# Processors run by the caller; rendering and the write are left to the handler
+_PRE_CHAIN = [
+    structlog.stdlib.add_logger_name,
+    structlog.stdlib.add_log_level,
+    structlog.processors.TimeStamper(fmt="iso"),
+]
+
+# Loggers cached on first use keep this list, so reconfiguring updates it in place
+_PROCESSORS: List[Any] = []
+
+_handler: Optional[LogQueueHandler] = None
+_output: Optional[logging.Handler] = None
+_listener: Optional[_LogQueueListener] = None
+_sampler: Optional[LogSampler] = None
+
+def configure(
+    level: str = "info",
+    queue_size: int = 10000,
+    overflow: str = "drop",
+    stream: Optional[TextIO] = None,
+    sampler: Optional[LogSampler] = None
+):
+    """
+    Route structlog and stdlib logging through one JSON handler on the root
+    logger, writing to stream (stdout by default).
+    
+    With queue_size > 0 records are handed to a bounded queue and rendered
+    and written by a background thread, and ``overflow`` decides what
+    happens when it is full; 0 renders and writes in the logging call.
+    A sampler, when given, runs before any other work on the line, and its
+    rollups are logged on its own thread.
+    """
+    global _handler, _output, _listener, _sampler
+    if overflow not in OVERFLOW_POLICIES:
+        raise ValueError(f"Unknown log queue overflow policy: {overflow!r}")
+    shutdown()
+    
+    _output = output = logging.StreamHandler(stream if stream is not None else _Stdout())
+    output.setFormatter(structlog.stdlib.ProcessorFormatter(
+        processors=[
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            OrjsonRenderer(),
+        ],
+        foreign_pre_chain=[*_PRE_CHAIN[:2], _record_timestamp],
+    ))
+    if queue_size > 0:
+        _handler = LogQueueHandler(queue.Queue(queue_size), block=overflow == "block")
+        _listener = _LogQueueListener(_handler.queue, output)
+        _listener.start()
+        handler: logging.Handler = _handler
+    else:
+        _handler = None
+        handler = output
+    
+    # Caller, thread and process details are never rendered; skip collecting them for every record
+    # (https://docs.python.org/3/howto/logging.html#optimization)
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    
+    _sampler = sampler
+    if sampler is not None:
+        sampler.start()
+    _PROCESSORS[:] = [
+        structlog.stdlib.filter_by_level,
+        *([sampler] if sampler is not None else []),
+        *_PRE_CHAIN,
+        structlog.stdlib.PositionalArgumentsFormatter(),
+        structlog.processors.StackInfoRenderer(),
+        structlog.processors.format_exc_info,
+        structlog.processors.UnicodeDecoder(),
+        structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
+    ]
+    structlog.configure(
+        processors=_PROCESSORS,
+        context_class=dict,
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+
+def shutdown():
+    """
+    Stop the rollup thread and log the pending sampling rollups, write out
+    queued records and stop the listener thread; records logged afterwards
+    are written in the logging call.
+    """
+    global _listener
+    if _sampler is not None:
+        _sampler.stop()
+        _sampler.flush()
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    root = logging.getLogger()
+    root.removeHandler(_handler)
+    root.addHandler(_output)
+
+def stats() -> Dict[str, int]:
+    """Queue depth, records dropped because the queue was full and lines dropped by sampling"""
+    return {
+        "queued": _handler.queue.qsize() if _handler is not None else 0,
+        "dropped": _handler.dropped if _handler is not None else 0,
+        "sampled_out": _sampler.dropped if _sampler is not None else 0,
+    }
+
+# Records still queued at exit are written rather than lost
+atexit.register(shutdown)
@@ -0,0 +1,231 @@
+"""
+Prometheus metrics for the API and the Service Bus send path
+Request counts and latencies per route, send latency, batch sizes, bytes sent and errors by type.
+"""
+
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from azure.servicebus import ServiceBusMessageBatch
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import GCCollector, PlatformCollector, ProcessCollector
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Own registry, so importing the module twice (tests, reloads) can't register metrics twice
+registry = CollectorRegistry(auto_describe=True)
+ProcessCollector(registry=registry)
+PlatformCollector(registry=registry)
+GCCollector(registry=registry)
+
+# Label for requests to paths the app has no route for, so clients can't create series
+OTHER_ROUTE = "other"
+STANDARD_METHODS = frozenset({"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"})
+
+http_requests = Counter(
+    "http_requests", "HTTP requests handled", ["route", "method", "status"], registry=registry
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle an HTTP request, including the security checks",
+    ["route", "method"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    registry=registry
+)
+http_request_errors = Counter(
+    "http_request_errors", "Unhandled exceptions raised while handling a request", ["error"], registry=registry
+)
+servicebus_send_duration = Histogram(
+    "servicebus_send_duration_seconds",
+    "Service Bus send_messages round-trip time",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    registry=registry
+)
+servicebus_batch_size = Histogram(
+    "servicebus_batch_messages",
+    "Messages per Service Bus send",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+    registry=registry
+)
+servicebus_sent_bytes = Counter(
+    "servicebus_sent_bytes", "Message bytes sent to Service Bus", registry=registry
+)
+servicebus_send_errors = Counter(
+    "servicebus_send_errors", "Failed Service Bus sends", ["error"], registry=registry
+)
+servicebus_sends_in_flight = Gauge(
+    "servicebus_sends_in_flight", "Service Bus sends awaiting a reply", registry=registry
+)
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop woke a sleeping task, sampled periodically",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+    registry=registry
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def render() -> bytes:
+    """The registry in the Prometheus text format"""
+    return generate_latest(registry)
+
+class _ErrorCounter:
+    """Children of an error counter, one per exception class, created on first use"""
+    
+    def __init__(self, counter: Counter):
+        self.counter = counter
+        self.children: Dict[type, Any] = {}
+    
+    def inc(self, error: BaseException):
+        child = self.children.get(type(error))
+        if child is None:
+            child = self.children[type(error)] = self.counter.labels(type(error).__name__)
+        child.inc()
+
+_send_errors = _ErrorCounter(servicebus_send_errors)
+_request_errors = _ErrorCounter(http_request_errors)
+
+class _RouteMetrics:
+    __slots__ = ("duration", "requests", "statuses", "route", "method")
+    
+    def __init__(self, route: str, method: str):
+        self.route = route
+        self.method = method
+        self.duration = http_request_duration.labels(route, method)
+        self.requests = http_requests.labels
+        # status code -> counter child
+        self.statuses: Dict[int, Any] = {}
+    
+    def count(self, status: int):
+        child = self.statuses.get(status)
+        if child is None:
+            child = self.statuses[status] = self.requests(self.route, self.method, str(status))
+        child.inc()
+
+class MetricsASGIMiddleware:
+    """
+    Counts and times every request by route, method and status.
+    
+    ``routes`` is the app's route list; it is read on the first request, once
+    every route has been declared, and a child of each metric is created up
+    front for every route and method so requests only look them up.
+    """
+    
+    def __init__(self, app: ASGIApp, routes: Iterable[Any] = ()):
+        self.app = app
+        self.routes = routes
+        # path -> method -> metrics; built on the first request
+        self._by_path: Optional[Dict[str, Dict[str, _RouteMetrics]]] = None
+        self._other: Dict[str, _RouteMetrics] = {}
+    
+    def _prepare(self):
+        by_path: Dict[str, Dict[str, _RouteMetrics]] = {}
+        for route in self.routes:
+            path = getattr(route, "path", None)
+            methods = getattr(route, "methods", None)
+            if path is None or not methods:
+                continue
+            by_path.setdefault(path, {}).update(
+                (method, _RouteMetrics(path, method)) for method in methods
+            )
+        self._by_path = by_path
+    
+    def _metrics(self, path: str, method: str) -> _RouteMetrics:
+        if self._by_path is None:
+            self._prepare()
+        metrics = self._by_path.get(path, self._other).get(method)
+        if metrics is None:
+            metrics = self._other.get(method)
+            if metrics is None:
+                # Methods are client-controlled too; anything unusual shares one series
+                method = method if method in STANDARD_METHODS else "OTHER"
+                metrics = self._other.setdefault(method, _RouteMetrics(OTHER_ROUTE, method))
+        return metrics
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        metrics = self._metrics(scope["path"], scope["method"])
+        status_code = 500
+        
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception as e:
+            _request_errors.inc(e)
+            raise
+        finally:
+            metrics.duration.observe(time.perf_counter() - start)
+            metrics.count(status_code)
+
+def _message_count_and_bytes(message: Any) -> Tuple[int, int]:
+    """Messages in a send and their size: encoded for a batch, body bytes otherwise"""
+    if isinstance(message, ServiceBusMessageBatch):
+        return len(message), message.size_in_bytes
+    if isinstance(message, list):
+        return len(message), sum(len(section) for item in message for section in item.body)
+    return 1, sum(len(section) for section in message.body)
+
+class InstrumentedSender:
+    """
+    Wraps a ServiceBusSender to record the latency, size and outcome of
+    every send; everything else is passed through to the sender.
+    """
+    
+    def __init__(self, sender: Any):
+        self.sender = sender
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.sender, name)
+    
+    async def send_messages(self, message: Any, **kwargs):
+        servicebus_sends_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.sender.send_messages(message, **kwargs)
+        except Exception as e:
+            _send_errors.inc(e)
+            raise
+        finally:
+            servicebus_send_duration.observe(time.perf_counter() - start)
+            servicebus_sends_in_flight.dec()
+        count, size = _message_count_and_bytes(message)
+        servicebus_batch_size.observe(count)
+        servicebus_sent_bytes.inc(size)
+
+class StatsCollector:
+    """
+    Exposes a component's ``stats()`` dict at scrape time, so its counters
+    cost nothing on the request path. Keys named in ``counters`` become
+    counters of their own; the rest are gauges labelled by ``stat``.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        stats: Callable[[], Dict[str, Any]],
+        counters: Dict[str, str]
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.stats = stats
+        self.counters = counters
+    
+    def collect(self):
+        stats = self.stats()
+        gauge = GaugeMetricFamily(self.name, self.documentation, labels=["stat"])
+        for key, value in stats.items():
+            if key in self.counters:
+                yield CounterMetricFamily(f"{self.name}_{key}", self.counters[key], value=value)
+            elif isinstance(value, (int, float)):
+                gauge.add_metric([key], value)
+        yield gauge
@@ -0,0 +1,158 @@
+"""
+Event loop saturation monitor and load shedding
+Measures how late the event loop runs scheduled work and turns new events away with 503 while it is behind.
+"""
+
+import asyncio
+import math
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+import structlog
+from fastapi import status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from middleware import metrics
+
+logger = structlog.get_logger()
+
+class SaturationMonitor:
+    """
+    Tracks event loop lag and requests in flight, and decides when to shed load.
+    
+    A background task sleeps for ``interval_ms`` at a time and records how
+    much later than asked it was woken: time the loop spent on other work.
+    The lag is smoothed over samples, and while the loop is so busy that the
+    next wake-up is already overdue, the overdue time counts too, so a
+    stall shows up before the task gets to run again.
+    
+    The loop is overloaded while the lag exceeds ``max_lag_ms``, or
+    ``max_in_flight`` requests are already in flight; 0 turns either check off.
+    """
+    
+    def __init__(
+        self,
+        interval_ms: float = 100,
+        max_lag_ms: float = 0,
+        max_in_flight: int = 0,
+        smoothing: float = 0.3
+    ):
+        self.interval_seconds = interval_ms / 1000
+        self.max_lag_seconds = max_lag_ms / 1000
+        self.max_in_flight = max_in_flight
+        self.smoothing = smoothing
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Loop time the monitor task is next due to wake up
+        self._due: Optional[float] = None
+        
+        # Metrics
+        self.lag_seconds = 0.0
+        self.smoothed_lag_seconds = 0.0
+        self.max_lag_seen_seconds = 0.0
+        self.in_flight = 0
+        self.shed = 0
+        self._was_overloaded = False
+    
+    async def start(self):
+        """Start sampling; does nothing when the interval is 0"""
+        if self.interval_seconds > 0 and self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._due = None
+    
+    def sample(self, lag: float):
+        """Record one lag measurement, in seconds"""
+        self.lag_seconds = lag
+        self.smoothed_lag_seconds += self.smoothing * (lag - self.smoothed_lag_seconds)
+        self.max_lag_seen_seconds = max(self.max_lag_seen_seconds, lag)
+        metrics.event_loop_lag.observe(lag)
+    
+    async def _run(self):
+        loop = self._loop
+        while True:
+            self._due = loop.time() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            self.sample(max(0.0, loop.time() - self._due))
+    
+    def lag(self) -> float:
+        """Current lag estimate in seconds: the smoothed lag, or how overdue the next sample is"""
+        if self._due is None:
+            return self.smoothed_lag_seconds
+        return max(self.smoothed_lag_seconds, self._loop.time() - self._due)
+    
+    def overloaded(self) -> bool:
+        overloaded = (
+            (self.max_lag_seconds > 0 and self.lag() > self.max_lag_seconds)
+            or (self.max_in_flight > 0 and self.in_flight >= self.max_in_flight)
+        )
+        if overloaded != self._was_overloaded:
+            self._was_overloaded = overloaded
+            log = logger.warning if overloaded else logger.info
+            log(
+                "Event loop overloaded, shedding events" if overloaded else "Event loop recovered, accepting events",
+                lag_seconds=round(self.lag(), 3),
+                in_flight=self.in_flight
+            )
+        return overloaded
+    
+    def stats(self) -> Dict[str, float]:
+        return {
+            "lag_seconds": self.lag_seconds,
+            "smoothed_lag_seconds": self.smoothed_lag_seconds,
+            "max_lag_seconds": self.max_lag_seen_seconds,
+            "in_flight_requests": self.in_flight,
+            "shed": self.shed
+        }
+
+class LoadSheddingASGIMiddleware:
+    """
+    Counts requests in flight and answers POSTs to ``paths`` with 503 and
+    Retry-After while the monitor reports overload, before any other work
+    is done for them. Other requests, such as health checks, are never shed.
+    """
+    
+    def __init__(
+        self,
+        app: ASGIApp,
+        monitor: SaturationMonitor,
+        paths: Iterable[str] = (),
+        retry_after_seconds: float = 1
+    ):
+        self.app = app
+        self.monitor = monitor
+        self.paths = frozenset(paths)
+        self.retry_after = str(max(1, math.ceil(retry_after_seconds)))
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        monitor = self.monitor
+        if scope["method"] == "POST" and scope["path"] in self.paths and monitor.overloaded():
+            monitor.shed += 1
+            response = JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={
+                    "error": "Service overloaded",
+                    "message": "Server is too busy to accept events, retry later",
+                    "timestamp": datetime.utcnow().isoformat()
+                },
+                headers={"Retry-After": self.retry_after}
+            )
+            await response(scope, receive, send)
+            return
+        
+        monitor.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            monitor.in_flight -= 1
@@ -0,0 +1,282 @@
+"""
+Compiled security policies
+Turns the DPAR policy document into an immutable per-route decision table looked up through a path trie.
+"""
+
+import asyncio
+import os
+import re
+from typing import Any, Callable, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+import structlog
+import yaml
+
+from middleware.ipfilter import IPFilter
+
+logger = structlog.get_logger()
+
+POLICY_DOCUMENT_KEY = "security-policies.yaml"
+
+# Largest number of distinct (method, path) lookups memoized per compiled policy
+DECISION_CACHE_SIZE = 4096
+
+class RateLimitRule(NamedTuple):
+    limit: int
+    window: float
+    burst: Optional[int] = None
+
+class RequestCost(NamedTuple):
+    """Rate-limit units are charged per this many events or bytes, whichever is more"""
+    events_per_unit: int
+    bytes_per_unit: int
+
+class RouteDecision(NamedTuple):
+    """Everything the security checks need to know about one method and path"""
+    rate_limit: Optional[RateLimitRule] = None
+    request_cost: Optional[RequestCost] = None
+    auth_required: bool = False
+    permission: Optional[str] = None
+    max_payload_size: Optional[int] = None
+    required_headers: FrozenSet[str] = frozenset()
+    allowed_content_types: FrozenSet[str] = frozenset()
+    ip_filter: Optional[IPFilter] = None
+
+NO_POLICY = RouteDecision()
+
+_UNITS = {"": 1, "b": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3}
+_DURATIONS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+_QUANTITY = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*$")
+
+def parse_size(value: Any) -> int:
+    """Bytes in a size such as 1048576, "256KB" or "1MB\""""
+    number, unit = _parse_quantity(value, _UNITS)
+    return int(number * unit)
+
+def parse_duration(value: Any) -> float:
+    """Seconds in a duration such as 60, "30s" or "1m\""""
+    number, unit = _parse_quantity(value, _DURATIONS)
+    return number * unit
+
+def _parse_quantity(value: Any, units: Dict[str, float]) -> Tuple[float, float]:
+    if isinstance(value, (int, float)):
+        return value, 1
+    match = _QUANTITY.match(str(value))
+    if not match or match.group(2).lower() not in units:
+        raise ValueError(f"Invalid quantity: {value!r}")
+    return float(match.group(1)), units[match.group(2).lower()]
+
+def load_policy_document(path: str) -> Dict[str, Any]:
+    """
+    Read policies from a YAML file: either the DPAR ConfigMap itself or its
+    security-policies.yaml entry mounted as a file.
+    """
+    with open(path) as f:
+        document = yaml.safe_load(f) or {}
+    if document.get("kind") == "ConfigMap":
+        document = yaml.safe_load(document.get("data", {}).get(POLICY_DOCUMENT_KEY, "")) or {}
+    if not isinstance(document.get("policies"), list):
+        raise ValueError(f"No policies found in {path}")
+    return document
+
+def _rule_fields(policy_type: str, rule: Dict[str, Any]) -> Dict[str, Any]:
+    """The RouteDecision fields a single rule sets"""
+    if policy_type == "rate-limit":
+        # A rule without a cost is unweighted, whatever a prefix rule above it charges
+        fields: Dict[str, Any] = {
+            "rate_limit": RateLimitRule(int(rule["limit"]), parse_duration(rule["window"]), rule.get("burst")),
+            "request_cost": None
+        }
+        if "cost" in rule:
+            fields["request_cost"] = RequestCost(
+                int(rule["cost"]["events_per_unit"]), parse_size(rule["cost"]["bytes_per_unit"])
+            )
+        return fields
+    if policy_type == "auth":
+        return {"auth_required": bool(rule.get("required", False)), "permission": rule.get("permission")}
+    if policy_type == "validation":
+        fields = {}
+        if "max_payload_size" in rule:
+            fields["max_payload_size"] = parse_size(rule["max_payload_size"])
+        if "required_headers" in rule:
+            fields["required_headers"] = frozenset(h.lower() for h in rule["required_headers"])
+        if "allowed_content_types" in rule:
+            fields["allowed_content_types"] = frozenset(t.lower() for t in rule["allowed_content_types"])
+        return fields
+    if policy_type == "ip-filter":
+        return {"ip_filter": IPFilter(rule.get("allowed_ips") or (), rule.get("blocked_ips") or ())}
+    return {}
+
+class _Node:
+    __slots__ = ("children", "exact", "prefix", "exact_decision", "prefix_decision")
+    
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # Fields set by rules ending here, exactly or as a "*" prefix
+        self.exact: Dict[str, Any] = {}
+        self.prefix: Dict[str, Any] = {}
+        self.exact_decision: Optional[RouteDecision] = None
+        self.prefix_decision: Optional[RouteDecision] = None
+
+class CompiledPolicy:
+    """
+    Immutable route decisions compiled from a policy document.
+    
+    Rules are placed in a character trie per HTTP method; a path ending in
+    ``*`` matches every path starting with what precedes it. For each policy
+    type the most specific matching rule wins: an exact path over a prefix,
+    a longer prefix over a shorter one, and a rule for the method over one
+    for any method. Decisions are merged at compile time, so a lookup is a
+    single walk down the trie, and its result is memoized.
+    """
+    
+    def __init__(self, document: Dict[str, Any]):
+        self.document = document
+        rules: List[Tuple[str, str, bool, Dict[str, Any]]] = []
+        for policy in document.get("policies", []):
+            policy_type = policy.get("type")
+            for rule in policy.get("rules", []):
+                fields = _rule_fields(policy_type, rule)
+                if not fields or "path" not in rule:
+                    continue
+                path = rule["path"]
+                is_prefix = path.endswith("*")
+                rules.append((rule.get("method", "*").upper(), path.rstrip("*"), is_prefix, fields))
+        
+        methods = {method for method, _, _, _ in rules} | {"*"}
+        self._roots: Dict[str, _Node] = {}
+        # Any-method rules first so method-specific ones override them
+        rules.sort(key=lambda rule: rule[0] != "*")
+        for method in methods:
+            root = _Node()
+            for rule_method, path, is_prefix, fields in rules:
+                if rule_method in ("*", method):
+                    node = root
+                    for char in path:
+                        node = node.children.setdefault(char, _Node())
+                    (node.prefix if is_prefix else node.exact).update(fields)
+            self._resolve(root)
+            self._roots[method] = root
+        self.methods: FrozenSet[str] = frozenset(self._roots)
+        # Header names, as lowercase ASGI bytes, that some route requires
+        self.header_names: FrozenSet[bytes] = frozenset(
+            name.encode() for _, _, _, fields in rules for name in fields.get("required_headers", ())
+        )
+        self._cache: Dict[Tuple[str, str], RouteDecision] = {}
+    
+    @classmethod
+    def from_file(cls, path: str) -> "CompiledPolicy":
+        return cls(load_policy_document(path))
+    
+    def lookup(self, method: str, path: str) -> RouteDecision:
+        """Decision for a request"""
+        key = (method, path)
+        decision = self._cache.get(key)
+        if decision is None:
+            decision = self._walk(method, path)
+            if len(self._cache) >= DECISION_CACHE_SIZE:
+                # Paths are client-controlled; start over rather than grow
+                self._cache.clear()
+            self._cache[key] = decision
+        return decision
+    
+    def _walk(self, method: str, path: str) -> RouteDecision:
+        node = self._roots.get(method) or self._roots["*"]
+        best = node.prefix_decision
+        for char in path:
+            node = node.children.get(char)
+            if node is None:
+                return best or NO_POLICY
+            if node.prefix_decision is not None:
+                best = node.prefix_decision
+        return node.exact_decision or best or NO_POLICY
+    
+    @staticmethod
+    def _resolve(root: _Node):
+        """Precompute the merged decision of every node, inheriting from prefix rules above it"""
+        stack = [(root, {})]
+        while stack:
+            node, inherited = stack.pop()
+            if node.prefix:
+                inherited = {**inherited, **node.prefix}
+                node.prefix_decision = RouteDecision(**inherited)
+            if node.exact:
+                node.exact_decision = RouteDecision(**{**inherited, **node.exact})
+            stack.extend((child, inherited) for child in node.children.values())
+
+def _file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """What changes when a file is rewritten or, as with ConfigMap mounts, swapped via a symlink"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+class PolicyWatcher:
+    """
+    Recompiles a policy file when it changes.
+    
+    The file is polled every ``interval_ms``; a changed file is compiled by
+    ``loader`` (CompiledPolicy.from_file unless given) in a worker thread and
+    the result handed to ``on_change`` on the event loop. A file that fails
+    to compile is logged and skipped until it changes again, so the policy
+    in force stays the last good one.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        on_change: Callable[[Any], None],
+        interval_ms: float = 5000,
+        loader: Callable[[str], Any] = CompiledPolicy.from_file
+    ):
+        self.path = path
+        self.on_change = on_change
+        self.loader = loader
+        self.interval_seconds = interval_ms / 1000
+        # Taken before the initial load, so a change made during it is picked up
+        self._signature = _file_signature(path)
+        self._task: Optional[asyncio.Task] = None
+        
+        # Metrics
+        self.reloads = 0
+        self.failures = 0
+    
+    async def start(self):
+        """Start polling; does nothing when the interval is 0"""
+        if self.interval_seconds > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    async def check(self) -> bool:
+        """Reload the file if it has changed since the last check; True if a new policy was applied"""
+        signature = _file_signature(self.path)
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        if signature is None:
+            logger.warning("Policy file removed, keeping current policies", path=self.path)
+            return False
+        try:
+            policy = await asyncio.to_thread(self.loader, self.path)
+        except Exception as e:
+            self.failures += 1
+            logger.error("Failed to reload policy file, keeping current policies", path=self.path, error=str(e))
+            return False
+        self.on_change(policy)
+        self.reloads += 1
+        return True
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Policy reload failed", path=self.path, error=str(e))
@@ -4,181 +4,420 @@ This module implements security policies and access control for the API.
 """
 
 import time
-from collections import defaultdict, deque
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
 from datetime import datetime, timedelta
 import hashlib
 import hmac
 import base64
+import math
+import os
 from fastapi import Request, HTTPException, status
 from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import structlog
 
+from middleware.apikeys import APIKey, APIKeyValidator, hash_api_key, load_api_keys
+from middleware.ipfilter import forwarded_client
+from middleware.limiter import LocalRateLimitBackend, RateLimitBackend, create_backend
+from middleware.policy import CompiledPolicy, PolicyWatcher, RateLimitRule, RequestCost
+from middleware.store import ExpiringLRU
+from middleware import tracing
+
 logger = structlog.get_logger()
 
+# Caps on per-client limiter state; least recently seen clients are evicted first
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_MAX_BLOCKED_IPS = int(os.getenv("RATE_LIMIT_MAX_BLOCKED_IPS", "10000"))
+
+# Where bucket state lives: local (per process) or redis (shared by all replicas)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local").lower()
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_LEASE_SIZE = int(os.getenv("RATE_LIMIT_LEASE_SIZE", "10"))
+RATE_LIMIT_LEASE_MS = float(os.getenv("RATE_LIMIT_LEASE_MS", "500"))
+
+# Policy source: the DPAR ConfigMap, or its security-policies.yaml entry mounted as a file
+DPAR_CONFIG_PATH = os.getenv(
+    "DPAR_CONFIG_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dpar-config.yaml")
+)
+# Proxies in front of the app that append to X-Forwarded-For (1 behind ACA ingress);
+# 0 ignores the header and uses the connection's peer address
+TRUSTED_PROXY_DEPTH = int(os.getenv("TRUSTED_PROXY_DEPTH", "0"))
+
+# How often the policy and API key files are checked for changes (0 disables reloading)
+POLICY_RELOAD_INTERVAL_MS = float(os.getenv("POLICY_RELOAD_INTERVAL_MS", "5000"))
+
+# API keys: a YAML file of salted key hashes (see middleware/apikeys.py); only
+# with ENVIRONMENT=development may it be left unset, to use the keys below
+API_KEYS_FILE = os.getenv("API_KEYS_FILE", "")
+API_KEY_SALT = os.getenv("API_KEY_SALT", "").encode()
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", "1024"))
+ENVIRONMENT = os.getenv("ENVIRONMENT", "production").lower()
+
+# Development keys by the variable holding the key, with the key used when it is unset
+DEV_API_KEYS = {
+    "API_KEY_DEV": {
+        "default": "dev-api-key-123",
+        "id": "dev",
+        "permissions": ["events:create", "events:batch"],
+        "rate_limits": {
+            "/events": RateLimitRule(100, 60),
+            "/events/batch": RateLimitRule(10, 60)
+        }
+    },
+    "API_KEY_MONITORING": {
+        "default": "monitoring-key-456",
+        "id": "monitoring",
+        "permissions": ["health:read", "metrics:read"],
+        "rate_limits": {
+            "/health": RateLimitRule(1000, 60)
+        }
+    }
+}
+
+# Used when no policy file is present
+DEFAULT_POLICY_DOCUMENT = {
+    "policies": [
+        {"name": "rate-limiting", "type": "rate-limit", "rules": [
+            {"path": "/events", "method": "POST", "limit": 100, "window": "1m", "burst": 20},
+            {"path": "/events/batch", "method": "POST", "limit": 10, "window": "1m", "burst": 5,
+             "cost": {"events_per_unit": 100, "bytes_per_unit": "256KB"}},
+            {"path": "/health", "method": "GET", "limit": 1000, "window": "1m"}
+        ]},
+        {"name": "authentication", "type": "auth", "rules": [
+            {"path": "/events*", "method": "POST", "required": True},
+            {"path": "/events", "method": "POST", "required": True, "permission": "events:create"},
+            {"path": "/events/batch", "method": "POST", "required": True, "permission": "events:batch"},
+            {"path": "/metrics", "method": "GET", "required": True, "permission": "metrics:read"}
+        ]},
+        {"name": "request-validation", "type": "validation", "rules": [
+            {"path": "/events", "method": "POST", "max_payload_size": "1MB"},
+            {"path": "/events/batch", "method": "POST", "max_payload_size": "10MB"}
+        ]}
+    ]
+}
+
+# Request headers the security checks read, as lowercase ASGI header names
+SECURITY_REQUEST_HEADERS = frozenset({
+    b"x-api-key", b"authorization", b"content-length", b"content-type", b"x-forwarded-for"
+})
+
+def _security_headers(scope: Scope, extra: FrozenSet[bytes] = frozenset()) -> Dict[bytes, str]:
+    """The request headers the security checks need, read straight from the scope"""
+    return {
+        name: value.decode("latin-1")
+        for name, value in scope["headers"]
+        if name in SECURITY_REQUEST_HEADERS or name in extra
+    }
+
+def _cost(weights: Optional[RequestCost], event_count: int = 0, bytes_count: int = 0) -> int:
+    """Rate-limit units a request costs; 1 unless its route is weighted"""
+    if not weights:
+        return 1
+    return max(
+        1,
+        math.ceil(event_count / weights.events_per_unit),
+        math.ceil(bytes_count / weights.bytes_per_unit)
+    )
+
 class RateLimiter:
-    """Rate limiting implementation"""
+    """
+    Per-client rate limits and temporary IP blocks.
     
-    def __init__(self):
-        self.requests: Dict[str, deque] = defaultdict(deque)
-        self.blocked_ips: set = set()
-    
-    def is_allowed(self, client_ip: str, endpoint: str, limit: int, window_seconds: int) -> bool:
-        """Check if request is allowed based on rate limits"""
-        key = f"{client_ip}:{endpoint}"
-        now = time.time()
-        
-        # Clean old requests
-        while self.requests[key] and self.requests[key][0] < now - window_seconds:
-            self.requests[key].popleft()
-        
-        # Check if limit exceeded
-        if len(self.requests[key]) >= limit:
-            logger.warning(
-                "Rate limit exceeded",
-                client_ip=client_ip,
-                endpoint=endpoint,
-                limit=limit,
-                window=window_seconds
-            )
-            return False
+    Bucket state lives in a pluggable backend: in process by default, or in
+    Redis so the limit holds across replicas. Blocks are kept per process.
+    """
+    
+    def __init__(
+        self,
+        max_keys: int = 100000,
+        max_blocked_ips: int = 10000,
+        backend: Optional[RateLimitBackend] = None
+    ):
+        self.backend = backend or LocalRateLimitBackend(max_keys)
+        self.blocked_ips = ExpiringLRU(max_blocked_ips)
         
-        # Add current request
-        self.requests[key].append(now)
-        return True
+        # Metrics
+        self.rejections = 0
+    
+    async def is_allowed(
+        self,
+        client: str,
+        endpoint: str,
+        limit: int,
+        window_seconds: int,
+        burst: Optional[int] = None,
+        cost: int = 1
+    ) -> bool:
+        """Check if a request from client (an IP or ``key:<id>``) is within its limit"""
+        if await self.backend.acquire(f"{client}:{endpoint}", limit, window_seconds, burst, cost):
+            return True
+        self.rejections += 1
+        logger.warning(
+            "Rate limit exceeded",
+            client=client,
+            endpoint=endpoint,
+            limit=limit,
+            window=window_seconds,
+            burst=burst,
+            cost=cost
+        )
+        return False
+    
+    async def refund(self, client: str, endpoint: str, limit: int, window_seconds: int, cost: int = 1):
+        """Give back the cost of a request that was rejected before it was processed"""
+        await self.backend.release(f"{client}:{endpoint}", limit, window_seconds, cost)
+    
+    def reset(self, matches: Callable[[str, str], bool]) -> int:
+        """Drop the buckets whose client and endpoint match; returns how many"""
+        def key_matches(key: str) -> bool:
+            # Endpoints are request paths, so the first ":/" ends the client, even an IPv6 one
+            split = key.index(":/")
+            return matches(key[:split], key[split + 1:])
+        return self.backend.forget(key_matches)
     
     def block_ip(self, ip: str, duration_minutes: int = 60):
         """Block an IP address temporarily"""
-        self.blocked_ips.add(ip)
+        self.blocked_ips.set(ip, True, time.monotonic() + duration_minutes * 60)
         logger.warning("IP blocked", ip=ip, duration_minutes=duration_minutes)
     
     def is_ip_blocked(self, ip: str) -> bool:
         """Check if IP is blocked"""
-        return ip in self.blocked_ips
-
-class APIKeyValidator:
-    """API key validation"""
+        return self.blocked_ips.get(ip, time.monotonic(), False)
     
-    def __init__(self, valid_keys: Dict[str, Dict]):
-        self.valid_keys = valid_keys
-    
-    def validate_key(self, api_key: str) -> Tuple[bool, Optional[Dict]]:
-        """Validate API key and return permissions"""
-        if api_key in self.valid_keys:
-            return True, self.valid_keys[api_key]
-        return False, None
+    def stats(self) -> Dict[str, int]:
+        """Limiter state metrics for the health and metrics endpoints"""
+        blocks = self.blocked_ips.stats()
+        return {
+            **self.backend.stats(),
+            "rejections": self.rejections,
+            "blocked_ips": blocks["live_keys"],
+            "block_evictions": blocks["evictions"],
+            "block_expirations": blocks["expirations"]
+        }
     
-    def has_permission(self, api_key: str, permission: str) -> bool:
-        """Check if API key has specific permission"""
-        is_valid, key_info = self.validate_key(api_key)
-        if not is_valid or not key_info:
-            return False
-        
-        permissions = key_info.get('permissions', [])
-        return permission in permissions
+    async def close(self):
+        await self.backend.close()
 
 class SecurityMiddleware:
     """Main security middleware class"""
     
     def __init__(self):
-        self.rate_limiter = RateLimiter()
-        self.api_key_validator = APIKeyValidator(self._load_api_keys())
-        self.policies = self._load_policies()
+        self.rate_limiter = RateLimiter(
+            max_blocked_ips=RATE_LIMIT_MAX_BLOCKED_IPS,
+            backend=create_backend(
+                RATE_LIMIT_BACKEND,
+                RATE_LIMIT_MAX_KEYS,
+                RATE_LIMIT_REDIS_URL,
+                RATE_LIMIT_LEASE_SIZE,
+                RATE_LIMIT_LEASE_MS
+            )
+        )
+        self.policy_watcher = PolicyWatcher(DPAR_CONFIG_PATH, self.apply_policy, POLICY_RELOAD_INTERVAL_MS)
+        self.policy = self._load_policies()
+        self.key_watcher = PolicyWatcher(
+            API_KEYS_FILE, self.apply_api_keys, POLICY_RELOAD_INTERVAL_MS, loader=load_api_keys
+        ) if API_KEYS_FILE else None
+        self.api_key_validator = APIKeyValidator(self._load_api_keys(), API_KEY_SALT, API_KEY_CACHE_SIZE)
     
-    def _load_api_keys(self) -> Dict[str, Dict]:
-        """Load API keys from environment or configuration"""
-        # In production, load from Azure Key Vault or secure storage
-        return {
-            "dev-api-key-123": {
-                "permissions": ["events:create", "events:batch"],
-                "rate_limits": {
-                    "/events": {"limit": 100, "window": 60},
-                    "/events/batch": {"limit": 10, "window": 60}
-                }
-            },
-            "monitoring-key-456": {
-                "permissions": ["health:read", "metrics:read"],
-                "rate_limits": {
-                    "/health": {"limit": 1000, "window": 60}
-                }
-            }
-        }
+    def _load_api_keys(self) -> List[APIKey]:
+        """Load API key hashes from API_KEYS_FILE, or hash the development keys when ENVIRONMENT=development"""
+        # In production, mount the keys file from Azure Key Vault or secure storage
+        if API_KEYS_FILE:
+            keys = load_api_keys(API_KEYS_FILE)
+            if not API_KEY_SALT:
+                logger.warning("API_KEY_SALT is not set; API key hashes are unsalted")
+            logger.info("API keys loaded", path=API_KEYS_FILE, keys=len(keys))
+            return keys
+        if ENVIRONMENT != "development":
+            raise RuntimeError(
+                f"API_KEYS_FILE must be set when ENVIRONMENT is {ENVIRONMENT!r}; "
+                "the development API keys are only used with ENVIRONMENT=development"
+            )
+        logger.warning("API_KEYS_FILE is not set, using development API keys")
+        return [
+            APIKey(
+                info["id"],
+                hash_api_key(os.getenv(variable) or info["default"], API_KEY_SALT),
+                frozenset(info["permissions"]),
+                dict(info["rate_limits"])
+            )
+            for variable, info in DEV_API_KEYS.items()
+        ]
     
-    def _load_policies(self) -> Dict:
-        """Load security policies"""
-        return {
-            "rate_limits": {
-                "/events": {"limit": 100, "window": 60, "burst": 20},
-                "/events/batch": {"limit": 10, "window": 60, "burst": 5},
-                "/health": {"limit": 1000, "window": 60}
-            },
-            "auth_required": {
-                "/events": True,
-                "/events/batch": True,
-                "/health": False
-            },
-            "max_payload_size": {
-                "/events": 1024 * 1024,  # 1MB
-                "/events/batch": 10 * 1024 * 1024  # 10MB
-            }
-        }
+    def _load_policies(self) -> CompiledPolicy:
+        """Load and compile security policies from DPAR_CONFIG_PATH, falling back to the built-in defaults"""
+        try:
+            policy = CompiledPolicy.from_file(DPAR_CONFIG_PATH)
+            logger.info("Security policies loaded", path=DPAR_CONFIG_PATH)
+            return policy
+        except FileNotFoundError:
+            logger.warning("Policy file not found, using default security policies", path=DPAR_CONFIG_PATH)
+            return CompiledPolicy(DEFAULT_POLICY_DOCUMENT)
+    
+    def apply_policy(self, policy: CompiledPolicy):
+        """
+        Put a newly compiled policy in force.
+        
+        Requests read ``self.policy`` once, so swapping the reference is
+        atomic for them and needs no lock. Limiter state is kept except for
+        IP buckets whose endpoint now has a different rate limit; buckets of
+        API keys with their own limits don't depend on the policy.
+        """
+        current = self.policy
+        methods = current.methods | policy.methods
+        changed: Dict[str, bool] = {}
+        
+        def limit_changed(client: str, endpoint: str) -> bool:
+            if client.startswith("key:"):
+                return False
+            if endpoint not in changed:
+                changed[endpoint] = any(
+                    current.lookup(method, endpoint).rate_limit != policy.lookup(method, endpoint).rate_limit
+                    for method in methods
+                )
+            return changed[endpoint]
+        
+        reset = self.rate_limiter.reset(limit_changed)
+        self.policy = policy
+        logger.info("Security policies reloaded", path=DPAR_CONFIG_PATH, reset_buckets=reset)
+    
+    def apply_api_keys(self, keys: List[APIKey]):
+        """Put a reloaded set of API keys in force, keeping buckets whose key and limit are unchanged"""
+        current = {key.key_id: key.rate_limits for key in self.api_key_validator.keys}
+        reloaded = {key.key_id: key.rate_limits for key in keys}
+        
+        def limit_changed(client: str, endpoint: str) -> bool:
+            if not client.startswith("key:"):
+                return False
+            key_id = client[4:]
+            return current.get(key_id, {}).get(endpoint) != reloaded.get(key_id, {}).get(endpoint)
+        
+        reset = self.rate_limiter.reset(limit_changed)
+        self.api_key_validator = APIKeyValidator(keys, API_KEY_SALT, API_KEY_CACHE_SIZE)
+        logger.info("API keys reloaded", path=API_KEYS_FILE, keys=len(keys), reset_buckets=reset)
+    
+    async def start_watchers(self):
+        """Start reloading the policy and API key files when they change"""
+        await self.policy_watcher.start()
+        if self.key_watcher:
+            await self.key_watcher.start()
     
-    async def validate_request(self, request: Request) -> Tuple[bool, Optional[str]]:
-        """Validate incoming request against security policies"""
-        client_ip = request.client.host
-        path = request.url.path
-        method = request.method
+    async def stop_watchers(self):
+        await self.policy_watcher.stop()
+        if self.key_watcher:
+            await self.key_watcher.stop()
+    
+    async def validate_request(self, scope: Scope) -> Tuple[bool, Optional[str]]:
+        """Validate an incoming HTTP request, given its ASGI scope, against security policies"""
+        client = scope.get("client")
+        path = scope["path"]
+        policy = self.policy
+        decision = policy.lookup(scope["method"], path)
+        headers = _security_headers(scope, policy.header_names)
+        client_ip = forwarded_client(
+            client[0] if client else "unknown", headers.get(b"x-forwarded-for"), TRUSTED_PROXY_DEPTH
+        )
+        
+        # Check the route's allow and deny lists
+        if decision.ip_filter and not decision.ip_filter.is_allowed(client_ip):
+            logger.warning("Request from filtered IP", ip=client_ip, path=path)
+            return False, "IP address not allowed"
         
         # Check if IP is blocked
         if self.rate_limiter.is_ip_blocked(client_ip):
             logger.warning("Request from blocked IP", ip=client_ip, path=path)
             return False, "IP address is blocked"
         
-        # Check rate limits
-        rate_limit_config = self.policies["rate_limits"].get(path)
-        if rate_limit_config:
-            if not self.rate_limiter.is_allowed(
-                client_ip, path, 
-                rate_limit_config["limit"], 
-                rate_limit_config["window"]
-            ):
-                # Block IP if rate limit exceeded multiple times
-                self.rate_limiter.block_ip(client_ip, 60)
+        # Check payload size, required headers and content type before anything is charged
+        try:
+            content_length = int(headers.get(b"content-length") or 0)
+        except ValueError:
+            content_length = -1
+        if content_length < 0:
+            return False, "Invalid Content-Length header"
+        if decision.max_payload_size and content_length > decision.max_payload_size:
+            logger.warning("Payload too large", ip=client_ip, path=path, size=content_length)
+            return False, "Payload too large"
+        for name in decision.required_headers:
+            if name.encode() not in headers:
+                return False, f"Missing required header: {name}"
+        if decision.allowed_content_types:
+            content_type = headers.get(b"content-type", "").split(";")[0].strip().lower()
+            if content_type not in decision.allowed_content_types:
+                return False, "Unsupported content type"
+        
+        # Identify the caller
+        api_key = headers.get(b"x-api-key") or headers.get(b"authorization")
+        # Remove "Bearer " prefix if present
+        if api_key and api_key.startswith("Bearer "):
+            api_key = api_key[7:]
+        is_valid, key = self.api_key_validator.validate_key(api_key) if api_key else (False, None)
+        # Verified once per request; handlers read it as request.state.api_key
+        state = scope.setdefault("state", {})
+        state["api_key"] = key
+        
+        # Check rate limits: a valid key with its own limit for this endpoint gets
+        # its own bucket, so tenants sharing an egress IP don't share a budget
+        key_limit = key.rate_limits.get(path) if key else None
+        if key_limit:
+            client, rule = f"key:{key.key_id}", key_limit
+        else:
+            client, rule = client_ip, decision.rate_limit
+        if rule:
+            # Weighted endpoints are charged for their size up front; the event
+            # count is charged by the endpoint once the body has been parsed
+            cost = _cost(decision.request_cost, bytes_count=content_length)
+            if not await self.rate_limiter.is_allowed(client, path, rule.limit, rule.window, rule.burst, cost):
+                # Block IP if rate limit exceeded; a weighted bucket can be left in
+                # debt by one large request, which is no reason to block its sender
+                if not key_limit and decision.request_cost is None:
+                    self.rate_limiter.block_ip(client_ip, 60)
                 return False, "Rate limit exceeded"
+            # Request.state reads the same dict, so endpoints can see the charge
+            state["rate_limit"] = {
+                "client": client, "endpoint": path, "rule": rule, "cost": cost, "weights": decision.request_cost
+            }
         
         # Check authentication
-        auth_required = self.policies["auth_required"].get(path, False)
-        if auth_required:
-            api_key = request.headers.get("X-API-Key") or request.headers.get("Authorization")
+        if decision.auth_required:
             if not api_key:
                 logger.warning("Missing API key", ip=client_ip, path=path)
                 return False, "API key required"
             
-            # Remove "Bearer " prefix if present
-            if api_key.startswith("Bearer "):
-                api_key = api_key[7:]
-            
-            is_valid, key_info = self.api_key_validator.validate_key(api_key)
             if not is_valid:
                 logger.warning("Invalid API key", ip=client_ip, path=path)
                 return False, "Invalid API key"
             
             # Check endpoint-specific permissions
-            if path == "/events" and not self.api_key_validator.has_permission(api_key, "events:create"):
-                return False, "Insufficient permissions"
-            elif path == "/events/batch" and not self.api_key_validator.has_permission(api_key, "events:batch"):
+            if decision.permission and decision.permission not in key.permissions:
                 return False, "Insufficient permissions"
         
-        # Check payload size
-        content_length = request.headers.get("content-length")
-        if content_length:
-            max_size = self.policies["max_payload_size"].get(path)
-            if max_size and int(content_length) > max_size:
-                logger.warning("Payload too large", ip=client_ip, path=path, size=content_length)
-                return False, "Payload too large"
-        
         return True, None
     
+    async def charge_events(self, request: Request, event_count: int) -> bool:
+        """Charge a weighted request for its parsed event count, beyond what it already paid"""
+        charge = request.scope.get("state", {}).get("rate_limit")
+        if not charge:
+            return True
+        total = _cost(charge["weights"], event_count=event_count)
+        if total <= charge["cost"]:
+            return True
+        rule = charge["rule"]
+        if not await self.rate_limiter.is_allowed(
+            charge["client"], charge["endpoint"], rule.limit, rule.window, rule.burst, total - charge["cost"]
+        ):
+            return False
+        charge["cost"] = total
+        return True
+    
+    async def refund(self, scope: Scope):
+        """Return the rate-limit charge of a request that was rejected before being processed"""
+        charge = scope.get("state", {}).pop("rate_limit", None)
+        if charge:
+            rule = charge["rule"]
+            await self.rate_limiter.refund(charge["client"], charge["endpoint"], rule.limit, rule.window, charge["cost"])
+    
     def generate_api_key(self, permissions: List[str], expires_days: int = 365) -> str:
         """Generate a new API key"""
         timestamp = str(int(time.time()))
@@ -190,30 +429,77 @@ class SecurityMiddleware:
         ).hexdigest()
         return f"api-{timestamp}-{key[:16]}"
 
+# Responses to requests that were turned away before doing any work; their
+# rate-limit charge is refunded
+REFUNDED_STATUS_CODES = frozenset({413, 422, 429, 503})
+
 # Global security middleware instance
 security_middleware = SecurityMiddleware()
 
-async def security_check(request: Request, call_next):
-    """FastAPI middleware for security checks"""
-    is_valid, error_message = await security_middleware.validate_request(request)
-    
-    if not is_valid:
-        return JSONResponse(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS if "rate limit" in error_message.lower() 
-                       else status.HTTP_401_UNAUTHORIZED,
-            content={
-                "error": "Security validation failed",
-                "message": error_message,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-        )
+def _rejection_status(error_message: str) -> int:
+    if "rate limit" in error_message.lower():
+        return status.HTTP_429_TOO_MANY_REQUESTS
+    if error_message == "Payload too large":
+        return status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    if error_message == "Unsupported content type":
+        return status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    if error_message.startswith("Missing required header") or error_message.startswith("Invalid Content-Length"):
+        return status.HTTP_400_BAD_REQUEST
+    if error_message == "IP address not allowed":
+        return status.HTTP_403_FORBIDDEN
+    return status.HTTP_401_UNAUTHORIZED
+
+# Added to every response that passes the security checks
+SECURITY_RESPONSE_HEADERS = [
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"x-xss-protection", b"1; mode=block"),
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+]
+
+class SecurityASGIMiddleware:
+    """
+    ASGI middleware applying security_middleware to every HTTP request.
     
-    response = await call_next(request)
+    Works on the raw scope and messages rather than through
+    BaseHTTPMiddleware, so there is no extra task or response stream per
+    request and streaming bodies pass through untouched.
+    """
     
-    # Add security headers
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["X-XSS-Protection"] = "1; mode=block"
-    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+    def __init__(self, app: ASGIApp, security: Optional[SecurityMiddleware] = None):
+        self.app = app
+        self.security = security or security_middleware
     
-    return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        with tracing.span("security_check"):
+            is_valid, error_message = await self.security.validate_request(scope)
+        tracing.mark(scope)
+        if not is_valid:
+            response = JSONResponse(
+                status_code=_rejection_status(error_message),
+                content={
+                    "error": "Security validation failed",
+                    "message": error_message,
+                    "timestamp": datetime.utcnow().isoformat()
+                }
+            )
+            await response(scope, receive, send)
+            return
+        
+        status_code = None
+        
+        async def send_with_headers(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Add security headers
+                message["headers"] = list(message.get("headers", ())) + SECURITY_RESPONSE_HEADERS
+            await send(message)
+        
+        await self.app(scope, receive, send_with_headers)
+        if status_code in REFUNDED_STATUS_CODES:
+            await self.security.refund(scope)
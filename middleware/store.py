@@ -0,0 +1,92 @@
+"""
+Bounded, expiring key-value store for per-client security state
+Caps memory with LRU eviction and drops expired entries with a timing wheel.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+class ExpiringLRU:
+    """
+    LRU map whose entries each carry an absolute expiry time.
+    
+    Holds at most ``max_keys`` entries, evicting the least recently used one
+    when full. Expired entries are never returned, and are removed by a
+    timing wheel of ``wheel_slots`` one-``resolution_seconds`` slots that is
+    swept as time advances, so keys that are never read again still free
+    their memory. Entries due beyond the wheel's horizon are rechecked once
+    per revolution.
+    
+    Callers pass the current ``time.monotonic()`` value so one clock reading
+    can serve several operations.
+    """
+    
+    def __init__(self, max_keys: int, resolution_seconds: float = 1.0, wheel_slots: int = 64):
+        self.max_keys = max(1, max_keys)
+        self.resolution_seconds = resolution_seconds
+        # key -> (value, expires_at, wheel slot)
+        self._entries: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._wheel: List[Set[str]] = [set() for _ in range(wheel_slots)]
+        self._tick: Optional[float] = None
+        
+        # Metrics
+        self.evictions = 0
+        self.expirations = 0
+    
+    @property
+    def live_keys(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: str, now: float, default: Any = None) -> Any:
+        """Value for key, or default if it is missing or expired"""
+        if now // self.resolution_seconds != self._tick:
+            self._advance(now)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= now:
+            # An expired entry is left for the wheel, or for set() to overwrite
+            return default
+        self._entries.move_to_end(key)
+        return entry[0]
+    
+    def set(self, key: str, value: Any, expires_at: float):
+        """Store value until expires_at, evicting the least recently used key if full"""
+        slot = int(expires_at / self.resolution_seconds) % len(self._wheel)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[2] != slot:
+                self._wheel[entry[2]].discard(key)
+                self._wheel[slot].add(key)
+            self._entries.move_to_end(key)
+        else:
+            if len(self._entries) >= self.max_keys:
+                oldest, (_, _, oldest_slot) = self._entries.popitem(last=False)
+                self._wheel[oldest_slot].discard(oldest)
+                self.evictions += 1
+            self._wheel[slot].add(key)
+        self._entries[key] = (value, expires_at, slot)
+    
+    def discard_matching(self, predicate: Callable[[str], bool]) -> int:
+        """Remove every entry whose key matches predicate; returns how many were removed"""
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            self._remove(key, self._entries[key][2])
+        return len(keys)
+    
+    def stats(self) -> Dict[str, int]:
+        return {"live_keys": len(self._entries), "evictions": self.evictions, "expirations": self.expirations}
+    
+    def _remove(self, key: str, slot: int):
+        del self._entries[key]
+        self._wheel[slot].discard(key)
+    
+    def _advance(self, now: float):
+        """Sweep the slots of every tick that has fully elapsed since the last call"""
+        tick = now // self.resolution_seconds
+        if self._tick is None:
+            self._tick = tick
+        for elapsed in range(int(max(self._tick, tick - len(self._wheel))), int(tick)):
+            slot = self._wheel[elapsed % len(self._wheel)]
+            for key in [key for key in slot if self._entries[key][1] <= now]:
+                self._remove(key, self._entries[key][2])
+                self.expirations += 1
+        self._tick = tick
@@ -0,0 +1,142 @@
+"""
+OpenTelemetry tracing for the ingest path
+Spans from the HTTP request through the security checks, payload validation and Service Bus send,
+with the W3C trace context carried to consumers in the message application properties.
+Requires opentelemetry-sdk; AVAILABLE is False when it is not installed, and every helper is a
+no-op until configure() is called.
+"""
+
+import time
+from contextlib import nullcontext
+from typing import Any, Dict, MutableMapping, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    from opentelemetry import propagate
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+    AVAILABLE = True
+except ImportError:
+    propagate = None
+    AVAILABLE = False
+
+TRACER_NAME = "event-generator"
+
+# Request headers carrying the W3C trace context
+TRACE_HEADERS = frozenset({b"traceparent", b"tracestate"})
+
+_provider = None
+tracer = None
+_NO_SPAN = nullcontext()
+
+def configure(sample_ratio: float = 1.0, exporter: str = "otlp", span_processor: Any = None) -> bool:
+    """
+    Start tracing, sampling new traces at sample_ratio and following the
+    caller's decision for requests that arrive with a trace context.
+    
+    Spans go to ``span_processor`` when given (tests pass one around an
+    in-memory exporter), otherwise to the OTLP or console exporter in
+    batches. Returns False when OpenTelemetry, or the OTLP exporter it
+    would need, is not installed.
+    """
+    global _provider, tracer
+    if not AVAILABLE:
+        return False
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    
+    if span_processor is None:
+        if exporter == "console":
+            span_exporter = ConsoleSpanExporter()
+        else:
+            try:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            except ImportError:
+                return False
+            # Endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+            span_exporter = OTLPSpanExporter()
+        span_processor = BatchSpanProcessor(span_exporter)
+    
+    _provider = TracerProvider(sampler=ParentBased(TraceIdRatioBased(sample_ratio)))
+    _provider.add_span_processor(span_processor)
+    tracer = _provider.get_tracer(TRACER_NAME)
+    return True
+
+def shutdown():
+    """Flush pending spans and stop tracing"""
+    global _provider, tracer
+    if _provider is not None:
+        _provider.shutdown()
+    _provider = tracer = None
+
+def span(name: str, attributes: Optional[Dict[str, Any]] = None):
+    """Context manager timing a stage as a child of the current span"""
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.start_as_current_span(name, attributes=attributes)
+
+def mark(scope: Scope):
+    """Note the end of a stage, for span_since_mark"""
+    if tracer is not None:
+        scope.setdefault("state", {})["trace_mark_ns"] = time.time_ns()
+
+def span_since_mark(scope: Scope, name: str, attributes: Optional[Dict[str, Any]] = None):
+    """
+    Record a span from the last mark() to now, for work the app can't wrap,
+    such as reading and validating the request body before the handler runs.
+    """
+    if tracer is None:
+        return
+    start = scope.get("state", {}).pop("trace_mark_ns", None)
+    if start is not None:
+        tracer.start_span(name, attributes=attributes, start_time=start).end()
+
+def inject(properties: MutableMapping[str, Any]):
+    """Add the current trace context (traceparent, tracestate) to message properties"""
+    if tracer is not None:
+        propagate.inject(properties)
+
+class TracingASGIMiddleware:
+    """
+    Opens a server span for every HTTP request, continuing the trace of an
+    incoming ``traceparent`` header. Passes requests straight through while
+    tracing is not configured.
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if tracer is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        carrier = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in scope["headers"]
+            if name in TRACE_HEADERS
+        }
+        method = scope["method"]
+        # Named by method until routing has matched a route template; raw paths would make names unbounded
+        with tracer.start_as_current_span(
+            method,
+            context=propagate.extract(carrier) if carrier else None,
+            kind=SpanKind.SERVER,
+            attributes={"http.method": method, "http.target": scope["path"]}
+        ) as server_span:
+            async def send_with_status(message: Message):
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    server_span.set_attribute("http.status_code", status_code)
+                    if status_code >= 500:
+                        server_span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+            
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = scope.get("route")
+                if route is not None and hasattr(route, "path"):
+                    server_span.update_name(f"{method} {route.path}")
+                    server_span.set_attribute("http.route", route.path)
@@ -0,0 +1,56 @@
+"""
+Tests for the hashed API key store
+"""
+
+import pytest
+
+from middleware.apikeys import APIKey, APIKeyValidator, hash_api_key, load_api_keys
+from middleware.policy import RateLimitRule
+
+SALT = b"test-salt"
+
+def test_keys_file_is_loaded_and_verified(tmp_path):
+    path = tmp_path / "keys.yaml"
+    path.write_text(
+        "keys:\n"
+        "  - id: tenant-a\n"
+        f"    hash: {hash_api_key('secret-a', SALT).hex()}\n"
+        "    permissions: [events:create]\n"
+        "    rate_limits:\n"
+        "      - {endpoint: /events, limit: 50, window: 1m, burst: 10}\n"
+    )
+    validator = APIKeyValidator(load_api_keys(str(path)), SALT)
+    
+    is_valid, key = validator.validate_key("secret-a")
+    assert is_valid and key.key_id == "tenant-a"
+    assert key.rate_limits == {"/events": RateLimitRule(50, 60, 10)}
+    assert key.permissions == {"events:create"}
+    assert validator.validate_key("secret-b") == (False, None)
+
+def test_salt_changes_the_digest():
+    validator = APIKeyValidator([APIKey("a", hash_api_key("secret", SALT))], b"other-salt")
+    
+    assert hash_api_key("secret", SALT) != hash_api_key("secret", b"other-salt")
+    assert validator.validate_key("secret") == (False, None)
+
+def test_only_verified_keys_are_cached():
+    validator = APIKeyValidator(
+        [APIKey(name, hash_api_key(name, SALT)) for name in ("a", "b", "c")], SALT, cache_size=2
+    )
+    for name in ("a", "b", "unknown", "a", "c"):
+        validator.validate_key(name)
+    
+    assert list(validator._verified) == [hash_api_key("a", SALT), hash_api_key("c", SALT)]
+
+def test_keys_default_to_no_rate_limits_of_their_own():
+    key = APIKey("a", hash_api_key("a", SALT))
+    
+    assert key.rate_limits == {}
+    with pytest.raises(TypeError):
+        key.rate_limits["/events"] = RateLimitRule(1, 60)
+
+def test_file_without_keys_is_rejected(tmp_path):
+    path = tmp_path / "keys.yaml"
+    path.write_text("rules: []\n")
+    with pytest.raises(ValueError):
+        load_api_keys(str(path))
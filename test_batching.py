@@ -0,0 +1,86 @@
+"""
+Tests for size-aware Service Bus batch packing
+"""
+
+import asyncio
+
+from azure.servicebus import ServiceBusMessage
+from azure.servicebus.exceptions import MessageSizeExceededError, ServiceBusError
+
+from conftest import FakeServiceBusSender
+from messaging.batching import pack_messages, send_packed
+from messaging.pool import SenderPool
+
+def make_messages(count: int, size: int = 1024):
+    return [ServiceBusMessage(body=b"x" * size, message_id=f"evt_{i}") for i in range(count)]
+
+def test_large_batch_takes_a_handful_of_round_trips(fake_sender):
+    messages = make_messages(500)
+    
+    outcomes = asyncio.run(send_packed(SenderPool([fake_sender]), messages))
+    
+    assert outcomes == [None] * 500
+    assert 1 < len(fake_sender.sent_batches) <= 3
+    assert [m.message_id for m in fake_sender.sent_messages] == [m.message_id for m in messages]
+
+def test_oversized_message_is_reported_at_its_index(fake_sender):
+    messages = make_messages(3, size=100)
+    messages[1] = ServiceBusMessage(body=b"x" * 4096, message_id="too_big")
+    
+    batches, errors = asyncio.run(pack_messages(fake_sender, messages, max_batch_bytes=2048))
+    
+    assert list(errors) == [1]
+    assert isinstance(errors[1], MessageSizeExceededError)
+    assert [indices for _, indices in batches] == [[0, 2]]
+
+def test_send_failure_marks_only_that_batch(fake_sender):
+    messages = make_messages(6, size=600)
+    calls = 0
+    original_send = fake_sender.send_messages
+    
+    async def fail_second_batch(batch, timeout=None):
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise ServiceBusError("link detached")
+        await original_send(batch)
+    
+    fake_sender.send_messages = fail_second_batch
+    outcomes = asyncio.run(send_packed(SenderPool([fake_sender]), messages, max_batch_bytes=2048))
+    
+    failed = [i for i, outcome in enumerate(outcomes) if outcome is not None]
+    sent = [int(m.message_id.split("_")[1]) for m in fake_sender.sent_messages]
+    assert failed and sent
+    assert sorted(failed + sent) == list(range(6))
+    assert all(isinstance(outcomes[i], ServiceBusError) for i in failed)
+
+def test_batches_fan_out_across_the_pool_with_bounded_concurrency():
+    senders = [FakeServiceBusSender(send_delay=0.01) for _ in range(3)]
+    pool = SenderPool(senders, max_in_flight=2)
+    in_flight = 0
+    peak = 0
+    
+    def track(sender):
+        original_send = sender.send_messages
+        
+        async def send_messages(batch, timeout=None):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            try:
+                await original_send(batch)
+            finally:
+                in_flight -= 1
+        sender.send_messages = send_messages
+    
+    for sender in senders:
+        track(sender)
+    messages = make_messages(12, size=600)
+    
+    outcomes = asyncio.run(send_packed(pool, messages, max_batch_bytes=2048))
+    
+    assert outcomes == [None] * 12
+    assert peak == 2
+    assert all(sender.sent_batches for sender in senders)
+    sent_ids = sorted(m.message_id for sender in senders for m in sender.sent_messages)
+    assert sent_ids == sorted(m.message_id for m in messages)
@@ -0,0 +1,116 @@
+"""
+Tests for the Service Bus send circuit breaker
+"""
+
+import asyncio
+import time
+
+import pytest
+from azure.servicebus.exceptions import MessageSizeExceededError, ServiceBusServerBusyError
+
+from messaging.breaker import CircuitBreaker, CircuitOpenError
+from messaging.retry import RetryPolicy
+
+async def succeed():
+    return "sent"
+
+async def fail():
+    raise ServiceBusServerBusyError(message="server busy")
+
+async def run(breaker: CircuitBreaker, operation, times: int = 1):
+    for _ in range(times):
+        try:
+            await breaker.call(operation)
+        except (ServiceBusServerBusyError, CircuitOpenError):
+            pass
+
+def test_trips_once_error_rate_passes_threshold():
+    breaker = CircuitBreaker(failure_rate_threshold=0.5, min_calls=10)
+    
+    asyncio.run(run(breaker, succeed, 5))
+    asyncio.run(run(breaker, fail, 4))
+    assert breaker.state == CircuitBreaker.CLOSED
+    asyncio.run(run(breaker, fail, 1))
+    
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.trips == 1
+
+def test_open_breaker_fails_fast_without_calling_the_broker():
+    breaker = CircuitBreaker(min_calls=1, open_seconds=60)
+    asyncio.run(run(breaker, fail))
+    calls = []
+    
+    async def tracked():
+        calls.append(1)
+    
+    with pytest.raises(CircuitOpenError) as excinfo:
+        asyncio.run(breaker.call(tracked))
+    assert calls == []
+    assert 0 < excinfo.value.retry_after <= 60
+    assert breaker.rejected == 1
+
+def test_half_open_limits_probes_and_closes_after_they_succeed():
+    breaker = CircuitBreaker(min_calls=1, open_seconds=0.01, half_open_probes=2)
+    asyncio.run(run(breaker, fail))
+    time.sleep(0.02)
+    
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() and breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    breaker.record_success()
+    
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(min_calls=1, open_seconds=0.01)
+    asyncio.run(run(breaker, fail))
+    time.sleep(0.02)
+    
+    asyncio.run(run(breaker, fail))
+    
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.trips == 2
+
+def test_cancelled_probes_release_their_slots():
+    breaker = CircuitBreaker(min_calls=1, open_seconds=0.01, half_open_probes=2)
+    asyncio.run(run(breaker, fail))
+    time.sleep(0.02)
+    
+    async def cancelled_probes():
+        for _ in range(3):
+            probe = asyncio.create_task(breaker.call(lambda: asyncio.sleep(10)))
+            await asyncio.sleep(0)
+            probe.cancel()
+            await asyncio.gather(probe, return_exceptions=True)
+        await run(breaker, succeed, 2)
+    
+    asyncio.run(cancelled_probes())
+    
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_client_errors_do_not_trip_the_breaker():
+    breaker = CircuitBreaker(min_calls=1)
+    
+    async def too_large():
+        raise MessageSizeExceededError(message="too large")
+    
+    with pytest.raises(MessageSizeExceededError):
+        asyncio.run(breaker.call(too_large))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_retry_policy_counts_one_outcome_per_call_and_fails_fast_when_open():
+    breaker = CircuitBreaker(min_calls=2, open_seconds=60)
+    policy = RetryPolicy(max_attempts=3, base_delay_ms=0, breaker=breaker)
+    
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(ServiceBusServerBusyError):
+                await policy.call(fail)
+        with pytest.raises(CircuitOpenError):
+            await policy.call(fail)
+    
+    asyncio.run(scenario())
+    
+    assert breaker.state == CircuitBreaker.OPEN
+    assert policy.calls == 2
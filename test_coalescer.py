@@ -0,0 +1,88 @@
+"""
+Tests for the /events micro-batching coalescer
+"""
+
+import asyncio
+
+import pytest
+from azure.servicebus import ServiceBusMessage
+from azure.servicebus.exceptions import MessageSizeExceededError, ServiceBusError
+
+from messaging.coalescer import EventCoalescer
+
+def make_message(i: int, size: int = 16) -> ServiceBusMessage:
+    return ServiceBusMessage(body=b"x" * size, message_id=f"evt_{i}")
+
+def test_concurrent_submits_share_one_round_trip(fake_sender):
+    async def scenario():
+        coalescer = EventCoalescer(fake_sender, linger_ms=20)
+        await coalescer.start()
+        ids = await asyncio.gather(*(coalescer.submit(make_message(i)) for i in range(50)))
+        await coalescer.stop()
+        return ids
+    
+    ids = asyncio.run(scenario())
+    
+    assert ids == [f"evt_{i}" for i in range(50)]
+    assert len(fake_sender.sent_batches) == 1
+    assert len(fake_sender.sent_messages) == 50
+
+def test_full_batch_is_sent_without_waiting_for_linger(fake_sender):
+    async def scenario():
+        coalescer = EventCoalescer(fake_sender, linger_ms=10_000, max_batch_bytes=4096)
+        await coalescer.start()
+        pending = asyncio.gather(*(coalescer.submit(make_message(i, size=1000)) for i in range(10)))
+        await asyncio.sleep(0.2)
+        full_batches_sent = len(fake_sender.sent_batches)
+        await coalescer.stop()
+        await pending
+        return full_batches_sent
+    
+    full_batches_sent = asyncio.run(scenario())
+    
+    assert full_batches_sent >= 2
+    assert [m.message_id for m in fake_sender.sent_messages] == [f"evt_{i}" for i in range(10)]
+
+def test_send_error_is_delivered_to_every_caller_in_the_batch(fake_sender):
+    fake_sender.fail_with = ServiceBusError("namespace throttled")
+    
+    async def scenario():
+        coalescer = EventCoalescer(fake_sender, linger_ms=5)
+        await coalescer.start()
+        results = await asyncio.gather(
+            *(coalescer.submit(make_message(i)) for i in range(3)),
+            return_exceptions=True
+        )
+        await coalescer.stop()
+        return results
+    
+    results = asyncio.run(scenario())
+    
+    assert all(isinstance(r, ServiceBusError) for r in results)
+
+def test_oversized_message_fails_alone(fake_sender):
+    async def scenario():
+        coalescer = EventCoalescer(fake_sender, linger_ms=5, max_batch_bytes=1024)
+        await coalescer.start()
+        results = await asyncio.gather(
+            coalescer.submit(make_message(0)),
+            coalescer.submit(make_message(1, size=4096)),
+            return_exceptions=True
+        )
+        await coalescer.stop()
+        return results
+    
+    ok, too_big = asyncio.run(scenario())
+    
+    assert ok == "evt_0"
+    assert isinstance(too_big, MessageSizeExceededError)
+
+def test_submit_after_stop_is_rejected(fake_sender):
+    async def scenario():
+        coalescer = EventCoalescer(fake_sender, linger_ms=5)
+        await coalescer.start()
+        await coalescer.stop()
+        with pytest.raises(RuntimeError):
+            await coalescer.submit(make_message(0))
+    
+    asyncio.run(scenario())
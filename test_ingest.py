@@ -0,0 +1,59 @@
+"""
+Tests for the async-accept ingest queue
+"""
+
+import asyncio
+
+from azure.servicebus import ServiceBusMessage
+
+from messaging.batching import send_packed
+from messaging.ingest import IngestQueue
+from messaging.pool import SenderPool
+
+def make_message(i: int) -> ServiceBusMessage:
+    return ServiceBusMessage(body=b"{}", message_id=f"evt_{i}")
+
+def test_queued_messages_are_published_in_batches(fake_sender):
+    pool = SenderPool([fake_sender])
+    
+    async def scenario():
+        queue = IngestQueue(lambda messages: send_packed(pool, messages), maxsize=100, publishers=1)
+        for i in range(20):
+            assert queue.offer(make_message(i))
+        await queue.start()
+        await queue.stop()
+    
+    asyncio.run(scenario())
+    
+    assert [m.message_id for m in fake_sender.sent_messages] == [f"evt_{i}" for i in range(20)]
+    assert len(fake_sender.sent_batches) == 1
+
+def test_full_queue_rejects_without_waiting(fake_sender):
+    pool = SenderPool([fake_sender])
+    
+    async def scenario():
+        queue = IngestQueue(lambda messages: send_packed(pool, messages), maxsize=2)
+        return [queue.offer(make_message(i)) for i in range(3)]
+    
+    assert asyncio.run(scenario()) == [True, True, False]
+
+def test_publish_failure_does_not_stop_the_publisher(fake_sender):
+    calls = []
+    
+    async def flaky_publish(messages):
+        calls.append(len(messages))
+        if len(calls) == 1:
+            raise RuntimeError("broker unavailable")
+        return [None] * len(messages)
+    
+    async def scenario():
+        queue = IngestQueue(flaky_publish, maxsize=10, publishers=1)
+        await queue.start()
+        queue.offer(make_message(0))
+        await asyncio.sleep(0.01)
+        queue.offer(make_message(1))
+        await queue.stop()
+    
+    asyncio.run(scenario())
+    
+    assert calls == [1, 1]
@@ -0,0 +1,71 @@
+"""
+Tests for the CIDR allow and deny lists of the ip-filter policy
+"""
+
+import ipaddress
+import random
+
+from middleware.ipfilter import IPFilter, PrefixTrie, forwarded_client
+
+def test_most_specific_network_decides():
+    ip_filter = IPFilter(
+        allowed=["10.0.0.0/8", "10.1.2.0/24", "2001:db8::/32"],
+        blocked=["10.1.0.0/16", "10.0.0.9", "2001:db8:bad::/48"]
+    )
+    
+    assert ip_filter.is_allowed("10.200.0.1")
+    assert not ip_filter.is_allowed("10.1.7.7")
+    assert ip_filter.is_allowed("10.1.2.3")
+    assert not ip_filter.is_allowed("10.0.0.9")
+    assert not ip_filter.is_allowed("192.0.2.1")
+    assert ip_filter.is_allowed("2001:db8:1::1")
+    assert not ip_filter.is_allowed("2001:db8:bad::1")
+    assert ip_filter.is_allowed("::ffff:10.200.0.1")
+    assert not ip_filter.is_allowed("testclient")
+
+def test_unlisted_addresses_are_allowed_without_an_allow_list():
+    ip_filter = IPFilter(blocked=["192.0.2.0/24"])
+    
+    assert not ip_filter.is_allowed("192.0.2.10")
+    assert ip_filter.is_allowed("198.51.100.1")
+    assert ip_filter.is_allowed("2001:db8::1")
+    assert ip_filter.is_allowed("unknown")
+
+def test_allow_list_of_one_family_rejects_the_other():
+    ip_filter = IPFilter(allowed=["10.0.0.0/8"])
+    
+    assert ip_filter.is_allowed("10.1.2.3")
+    assert not ip_filter.is_allowed("203.0.113.1")
+    assert not ip_filter.is_allowed("2001:db8::1")
+    assert not IPFilter(allowed=["2001:db8::/32"]).is_allowed("203.0.113.1")
+
+def test_deny_wins_for_networks_listed_both_ways():
+    assert not IPFilter(allowed=["192.0.2.0/24"], blocked=["192.0.2.0/24"]).is_allowed("192.0.2.1")
+
+def test_trie_matches_a_linear_scan():
+    rng = random.Random(7)
+    networks = [
+        ipaddress.ip_network((rng.getrandbits(32), rng.randint(0, 32)), strict=False) for _ in range(2000)
+    ]
+    trie = PrefixTrie(32)
+    for index, network in enumerate(networks):
+        trie.insert(int(network.network_address) >> (32 - network.prefixlen), network.prefixlen, index % 2 == 0)
+    # Deny wins between duplicates
+    values = {}
+    for index, network in enumerate(networks):
+        values[network] = values.get(network, True) and index % 2 == 0
+    
+    for _ in range(2000):
+        address = ipaddress.ip_address(rng.getrandbits(32))
+        matches = [network for network in values if address in network]
+        expected = values[max(matches, key=lambda network: network.prefixlen)] if matches else None
+        assert trie.lookup(int(address)) == expected
+
+def test_forwarded_client_trusts_only_the_configured_hops():
+    chain = "198.51.100.1, 203.0.113.5, 10.0.0.2"
+    
+    assert forwarded_client("10.0.0.1", chain, 0) == "10.0.0.1"
+    assert forwarded_client("10.0.0.1", chain, 1) == "10.0.0.2"
+    assert forwarded_client("10.0.0.1", chain, 2) == "203.0.113.5"
+    assert forwarded_client("10.0.0.1", chain, 5) == "198.51.100.1"
+    assert forwarded_client("10.0.0.1", None, 1) == "10.0.0.1"
@@ -0,0 +1,77 @@
+"""
+Tests for the Redis rate limiter backend against an in-memory Redis
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("lupa")
+fakeredis = pytest.importorskip("fakeredis")
+
+from middleware.limiter import RedisRateLimitBackend
+
+def acquire_many(backend, count, **kwargs):
+    async def run():
+        return sum([await backend.acquire("10.0.0.1:/events", **kwargs) for _ in range(count)])
+    return asyncio.run(run())
+
+def test_replicas_share_one_limit():
+    server = fakeredis.FakeServer()
+    replicas = [
+        RedisRateLimitBackend(fakeredis.aioredis.FakeRedis(server=server), lease_size=1)
+        for _ in range(3)
+    ]
+    
+    allowed = sum(acquire_many(replica, 10, limit=100, window_seconds=60, burst=20) for replica in replicas)
+    
+    assert allowed == 20
+
+def test_permits_are_leased_in_batches():
+    backend = RedisRateLimitBackend(fakeredis.aioredis.FakeRedis(), lease_size=10)
+    
+    assert acquire_many(backend, 30, limit=100, window_seconds=60, burst=25) == 25
+    # Two full leases, one partial lease of 5, then one refused round trip per check
+    assert backend.round_trips == 3 + 5
+
+def test_concurrent_checks_share_a_round_trip():
+    backend = RedisRateLimitBackend(fakeredis.aioredis.FakeRedis(), lease_size=10)
+    
+    async def run():
+        return await asyncio.gather(*[backend.acquire("k", 100, 60, 20) for _ in range(10)])
+    
+    assert all(asyncio.run(run()))
+    assert backend.round_trips == 1
+
+def test_unreachable_redis_falls_back_to_local_limits():
+    client = fakeredis.aioredis.FakeRedis(connected=False)
+    backend = RedisRateLimitBackend(client, lease_size=10)
+    
+    assert acquire_many(backend, 30, limit=100, window_seconds=60, burst=20) == 20
+    assert backend.stats()["backend_errors"] == 30
+
+def test_costs_are_taken_from_leases_and_refunds_returned_to_them():
+    backend = RedisRateLimitBackend(fakeredis.aioredis.FakeRedis(), lease_size=10)
+    
+    assert acquire_many(backend, 3, limit=100, window_seconds=60, burst=20, cost=8) == 2
+    assert backend.round_trips == 3
+    
+    asyncio.run(backend.release("10.0.0.1:/events", 100, 60, cost=8))
+    assert acquire_many(backend, 1, limit=100, window_seconds=60, burst=20, cost=8) == 1
+    assert backend.round_trips == 3
+
+def test_permits_spent_during_a_round_trip_are_not_handed_out_again():
+    backend = RedisRateLimitBackend(fakeredis.aioredis.FakeRedis(), lease_size=10)
+    
+    async def run():
+        # Leases 10 and keeps 3
+        assert await backend.acquire("k", 100, 60, 20, cost=7)
+        # The first goes back to Redis for 2 more; the second spends the 3 held meanwhile
+        assert await asyncio.gather(
+            backend.acquire("k", 100, 60, 20, cost=5),
+            backend.acquire("k", 100, 60, 20, cost=3)
+        ) == [True, True]
+        return sum([await backend.acquire("k", 100, 60, 20) for _ in range(20)])
+    
+    # Redis granted the burst of 20 in all; 15 of it went to the first three checks
+    assert asyncio.run(run()) == 5
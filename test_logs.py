@@ -0,0 +1,186 @@
+"""
+Tests for queued structured logging
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+
+import pytest
+import structlog
+
+from middleware import logs
+from middleware.logs import LogQueueHandler, LogSampler
+
+class RecordingStream:
+    """Collects written lines and the threads that wrote them"""
+    
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.lines = []
+        self.threads = set()
+    
+    def write(self, text):
+        if self.delay:
+            threading.Event().wait(self.delay)
+        self.threads.add(threading.current_thread().name)
+        self.lines.extend(json.loads(line) for line in text.splitlines())
+    
+    def flush(self):
+        pass
+
+@pytest.fixture
+def stream():
+    stream = RecordingStream()
+    yield stream
+    logs.shutdown()
+    logs.configure()
+
+def test_records_are_rendered_and_written_by_the_logging_thread(stream):
+    logs.configure(stream=stream)
+    logger = structlog.get_logger("test")
+    
+    logger.info("Event sent", event_type="user_action", count=3)
+    logging.getLogger("azure").warning("Link %s detached", "sender-1")
+    logger.debug("Not written")
+    logs.shutdown()
+    
+    assert threading.current_thread().name not in stream.threads
+    event, foreign = stream.lines
+    assert event["event"] == "Event sent" and event["count"] == 3
+    assert event["level"] == "info" and event["logger"] == "test" and "timestamp" in event
+    assert foreign == {
+        "event": "Link sender-1 detached", "level": "warning", "logger": "azure",
+        "timestamp": foreign["timestamp"]
+    }
+
+def test_full_queue_drops_and_counts():
+    handler = LogQueueHandler(queue.Queue(2))
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "message", None, None)
+    for _ in range(5):
+        handler.handle(record)
+    
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+def test_full_queue_blocks_the_caller_with_the_block_policy(stream):
+    stream.delay = 0.001
+    logs.configure(queue_size=1, overflow="block", stream=stream)
+    logger = structlog.get_logger("test")
+    
+    for i in range(50):
+        logger.info("Event sent", i=i)
+    logs.shutdown()
+    
+    assert [line["i"] for line in stream.lines] == list(range(50))
+    assert logs.stats()["dropped"] == 0
+
+def test_records_logged_after_shutdown_are_written_directly(stream):
+    logs.configure(stream=stream)
+    logs.shutdown()
+    
+    structlog.get_logger("test").warning("Shutting down")
+    
+    assert stream.lines[0]["event"] == "Shutting down"
+    assert threading.current_thread().name in stream.threads
+
+def test_unbuffered_mode_and_policy_validation(stream):
+    logs.configure(queue_size=0, stream=stream)
+    structlog.get_logger("test").info("Written now")
+    
+    assert stream.lines[0]["event"] == "Written now"
+    with pytest.raises(ValueError):
+        logs.configure(overflow="spill")
+
+def test_values_orjson_cannot_encode_are_still_rendered(stream):
+    logs.configure(queue_size=0, stream=stream)
+    structlog.get_logger("test").info("Event sent", sequence=2 ** 70, data={"object": object})
+    
+    assert stream.lines[0]["sequence"] == 2 ** 70
+    assert stream.lines[0]["data"] == {"object": repr(object)}
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+def sample(sampler, event, method_name="info", **fields):
+    try:
+        return sampler(None, method_name, {"event": event, **fields})
+    except structlog.DropEvent:
+        return None
+
+def test_sampler_keeps_a_burst_per_message_then_samples():
+    clock = FakeClock()
+    draws = iter([0.5, 0.05, 0.9, 0.01])
+    sampler = LogSampler(0.1, burst=2, clock=clock, rng=lambda: next(draws))
+    
+    kept = [sample(sampler, "Event sent", i=i) for i in range(6)]
+    assert [line and line["i"] for line in kept] == [0, 1, None, 3, None, 5]
+    # Each message has its own budget, and warnings and errors are never sampled
+    assert sample(sampler, "Received event") is not None
+    assert all(sample(sampler, "Event sent", method_name=level) for level in ("warning", "error", "exception"))
+    
+    clock.now += 1
+    assert sample(sampler, "Event sent") is not None
+    assert sampler.dropped == 2
+
+def test_sampler_sums_up_dropped_lines_by_field():
+    clock = FakeClock()
+    sampler = LogSampler(0.0, burst=1, rollup_interval=10, clock=clock)
+    for event_type in ["user_action"] * 3 + ["system_event"] * 2:
+        sample(sampler, "Event sent", event_type=event_type)
+    sample(sampler, "Service Bus initialized")
+    clock.now += 4
+    
+    assert sampler.rollups() == [{
+        "key": "Event sent",
+        "count": 5,
+        "dropped": 4,
+        "seconds": 4.0,
+        "by_event_type": {"user_action": 3, "system_event": 2},
+    }]
+    assert sampler.rollups() == []
+
+def test_rollups_are_logged_on_shutdown(stream):
+    clock = FakeClock()
+    logs.configure(stream=stream, sampler=LogSampler(0.0, burst=1, rollup_interval=60, clock=clock))
+    logger = structlog.get_logger("test")
+    
+    for _ in range(3):
+        logger.info("Event sent", event_type="user_action")
+    logger.error("Send failed", event_type="user_action")
+    logs.shutdown()
+    
+    events = [(line["event"], line.get("count"), line.get("dropped")) for line in stream.lines]
+    assert events == [
+        ("Event sent", None, None),
+        ("Send failed", None, None),
+        ("Log rollup", 3, 2),
+    ]
+    assert logs.stats()["sampled_out"] == 2
+
+def test_rollups_are_logged_each_interval_without_further_lines(stream):
+    logs.configure(stream=stream, sampler=LogSampler(0.0, burst=1, rollup_interval=0.05))
+    logger = structlog.get_logger("test")
+    for _ in range(3):
+        logger.info("Event sent", event_type="user_action")
+    
+    deadline = time.monotonic() + 5
+    while not any(line["event"] == "Log rollup" for line in stream.lines) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    
+    rollup = next(line for line in stream.lines if line["event"] == "Log rollup")
+    assert (rollup["count"], rollup["dropped"]) == (3, 2)
+
+def test_unhashable_rollup_fields_are_counted_by_repr():
+    sampler = LogSampler(0.0, burst=0, rollup_fields=("tags",), clock=FakeClock())
+    sample(sampler, "Event sent", tags=["a", "b"])
+    sample(sampler, "Event sent", tags=["a", "b"])
+    sample(sampler, "Event sent", tags={"a": 1})
+    
+    assert sampler.rollups()[0]["by_tags"] == {"['a', 'b']": 2, "{'a': 1}": 1}
@@ -0,0 +1,91 @@
+"""
+Tests for the Prometheus instrumentation and the /metrics endpoint
+"""
+
+import asyncio
+
+import pytest
+from azure.servicebus import ServiceBusMessage, ServiceBusMessageBatch
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from middleware import metrics
+from middleware.metrics import InstrumentedSender, MetricsASGIMiddleware
+
+def sample(name, **labels):
+    return metrics.registry.get_sample_value(name, labels) or 0
+
+def test_sends_are_timed_and_sized(fake_sender):
+    sender = InstrumentedSender(fake_sender)
+    before = (
+        sample("servicebus_send_duration_seconds_count"),
+        sample("servicebus_batch_messages_sum"),
+        sample("servicebus_sent_bytes_total"),
+        sample("servicebus_send_errors_total", error="ConnectionError")
+    )
+    
+    async def run():
+        batch = ServiceBusMessageBatch(max_size_in_bytes=10000)
+        for _ in range(3):
+            batch.add_message(ServiceBusMessage(b"x" * 100))
+        await sender.send_messages(batch)
+        await sender.send_messages(ServiceBusMessage(b"y" * 10))
+        fake_sender.fail_with = ConnectionError("link detached")
+        with pytest.raises(ConnectionError):
+            await sender.send_messages(ServiceBusMessage(b"z"))
+        return batch.size_in_bytes
+    
+    batch_bytes = asyncio.run(run())
+    after = (
+        sample("servicebus_send_duration_seconds_count"),
+        sample("servicebus_batch_messages_sum"),
+        sample("servicebus_sent_bytes_total"),
+        sample("servicebus_send_errors_total", error="ConnectionError")
+    )
+    assert [b - a for a, b in zip(before, after)] == [3, 4, batch_bytes + 10, 1]
+    assert len(fake_sender.sent_messages) == 4
+
+def test_requests_are_counted_per_route_with_unknown_paths_folded():
+    async def hello(request):
+        return JSONResponse({"hello": "world"})
+    
+    inner = Starlette(routes=[Route("/hello", hello)])
+    client = TestClient(MetricsASGIMiddleware(inner, routes=inner.routes))
+    before = (
+        sample("http_requests_total", route="/hello", method="GET", status="200"),
+        sample("http_requests_total", route="other", method="GET", status="404"),
+        sample("http_request_duration_seconds_count", route="/hello", method="GET")
+    )
+    
+    client.get("/hello")
+    client.get("/hello")
+    client.get("/random-1")
+    client.get("/random-2")
+    
+    after = (
+        sample("http_requests_total", route="/hello", method="GET", status="200"),
+        sample("http_requests_total", route="other", method="GET", status="404"),
+        sample("http_request_duration_seconds_count", route="/hello", method="GET")
+    )
+    assert [b - a for a, b in zip(before, after)] == [2, 2, 2]
+    assert metrics.registry.get_sample_value("http_requests_total", {
+        "route": "/random-1", "method": "GET", "status": "404"
+    }) is None
+
+def test_metrics_endpoint_requires_the_metrics_permission():
+    import main
+    
+    client = TestClient(main.app)
+    
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"X-API-Key": "dev-api-key-123"}).status_code == 401
+    response = client.get("/metrics", headers={"X-API-Key": "monitoring-key-456"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "http_requests_total" in response.text
+    assert "rate_limiter_rejections_total" in response.text
+    assert "servicebus_retry_budget_rejections_total" in response.text
+    assert 'servicebus_circuit_breaker{stat="state"} 0.0' in response.text
+    assert "servicebus_circuit_breaker_trips_total" in response.text
@@ -0,0 +1,259 @@
+"""
+Tests for the durable local outbox, replayed against a fake sender
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from azure.servicebus import ServiceBusMessage
+from azure.servicebus.exceptions import ServiceBusError
+
+from conftest import FakeServiceBusSender
+from messaging.outbox import EventOutbox, OutboxFullError, SEGMENT_SUFFIX
+
+def make_message(i: int, size: int = 32) -> ServiceBusMessage:
+    return ServiceBusMessage(
+        body=b"x" * size,
+        content_type="application/json",
+        message_id=f"evt_{i}",
+        application_properties={"event_type": "test", "index": i}
+    )
+
+def segment_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+async def wait_for_sent(sender, count: int, timeout: float = 5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while len(sender.sent_messages) < count:
+        assert asyncio.get_running_loop().time() < deadline, "outbox was not drained in time"
+        await asyncio.sleep(0.01)
+
+def sent_ids(sender):
+    return [m.message_id for m in sender.sent_messages]
+
+def test_appended_events_are_replayed_in_order(tmp_path, fake_sender):
+    async def scenario():
+        outbox = EventOutbox(str(tmp_path), segment_max_bytes=1024)
+        await outbox.open()
+        await outbox.start_drainer(fake_sender)
+        await asyncio.gather(*(outbox.append(make_message(i)) for i in range(50)))
+        await wait_for_sent(fake_sender, 50)
+        # Lets the last cursor write finish, which is when its bytes leave the backlog
+        await outbox.stop_drainer()
+        backlog = outbox.backlog_bytes
+        await outbox.close()
+        return backlog
+    
+    backlog = asyncio.run(scenario())
+    
+    assert sent_ids(fake_sender) == [f"evt_{i}" for i in range(50)]
+    assert fake_sender.sent_messages[7].application_properties["index"] == 7
+    assert backlog == 0
+    # Fully drained segments are truncated; only the active one is left
+    assert len(segment_files(tmp_path)) == 1
+
+def test_unsent_events_survive_a_restart(tmp_path, fake_sender):
+    async def first_run():
+        outbox = EventOutbox(str(tmp_path), segment_max_bytes=512)
+        await outbox.open()
+        for i in range(20):
+            await outbox.append(make_message(i))
+        await outbox.close()
+    
+    async def second_run():
+        outbox = EventOutbox(str(tmp_path))
+        await outbox.open()
+        await outbox.start_drainer(fake_sender)
+        await wait_for_sent(fake_sender, 20)
+        await outbox.close()
+    
+    asyncio.run(first_run())
+    assert len(segment_files(tmp_path)) > 1
+    asyncio.run(second_run())
+    
+    assert sent_ids(fake_sender) == [f"evt_{i}" for i in range(20)]
+
+def test_acknowledged_events_are_not_replayed_again(tmp_path, fake_sender):
+    async def run(start: int, count: int):
+        outbox = EventOutbox(str(tmp_path))
+        await outbox.open()
+        await outbox.start_drainer(fake_sender)
+        for i in range(start, start + count):
+            await outbox.append(make_message(i))
+        await wait_for_sent(fake_sender, start + count)
+        await outbox.close()
+    
+    asyncio.run(run(0, 5))
+    asyncio.run(run(5, 5))
+    
+    assert sent_ids(fake_sender) == [f"evt_{i}" for i in range(10)]
+
+def test_torn_tail_is_ignored_on_recovery(tmp_path, fake_sender):
+    async def first_run():
+        outbox = EventOutbox(str(tmp_path))
+        await outbox.open()
+        for i in range(3):
+            await outbox.append(make_message(i))
+        await outbox.close()
+    
+    async def second_run():
+        outbox = EventOutbox(str(tmp_path))
+        await outbox.open()
+        await outbox.start_drainer(fake_sender)
+        await outbox.append(make_message(3))
+        await wait_for_sent(fake_sender, 3)
+        await outbox.close()
+    
+    asyncio.run(first_run())
+    # Simulate a crash halfway through writing the last record
+    path = os.path.join(tmp_path, segment_files(tmp_path)[-1])
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 10)
+    asyncio.run(second_run())
+    
+    assert sent_ids(fake_sender) == ["evt_0", "evt_1", "evt_3"]
+
+def test_failed_sends_are_retried_without_losing_order(tmp_path, fake_sender):
+    fake_sender.fail_with = ServiceBusError("namespace unavailable")
+    
+    async def scenario():
+        outbox = EventOutbox(str(tmp_path), fsync="never")
+        await outbox.open()
+        await outbox.start_drainer(fake_sender)
+        for i in range(5):
+            await outbox.append(make_message(i))
+        await asyncio.sleep(0.05)
+        assert outbox.backlog_bytes > 0
+        fake_sender.fail_with = None
+        await wait_for_sent(fake_sender, 5)
+        await outbox.close()
+    
+    asyncio.run(scenario())
+    
+    assert sent_ids(fake_sender) == [f"evt_{i}" for i in range(5)]
+
+def test_records_read_once_are_sent_over_several_batches(tmp_path, fake_sender, monkeypatch):
+    async def scenario():
+        outbox = EventOutbox(str(tmp_path), fsync="never")
+        await outbox.open()
+        for i in range(30):
+            await outbox.append(make_message(i, size=200))
+        read_records = outbox._read_records
+        read = []
+        
+        def counting_read(limit):
+            records = read_records(limit)
+            read.extend(message.message_id for message, _ in records)
+            return records
+        
+        monkeypatch.setattr(outbox, "_read_records", counting_read)
+        await outbox.start_drainer(fake_sender, max_batch_bytes=2048)
+        await wait_for_sent(fake_sender, 30)
+        await outbox.close()
+        return read, outbox.backlog_bytes
+    
+    read, backlog = asyncio.run(scenario())
+    
+    assert len(fake_sender.sent_batches) > 1
+    assert read == [f"evt_{i}" for i in range(30)]
+    assert backlog == 0
+
+def test_backlog_is_counted_while_cursor_writes_run(tmp_path, fake_sender, monkeypatch):
+    async def scenario():
+        outbox = EventOutbox(str(tmp_path), fsync="never")
+        await outbox.open()
+        advance_cursor = outbox._advance_cursor
+        
+        def slow_advance(position):
+            time.sleep(0.005)
+            return advance_cursor(position)
+        
+        monkeypatch.setattr(outbox, "_advance_cursor", slow_advance)
+        await outbox.start_drainer(fake_sender)
+        for i in range(100):
+            await outbox.append(make_message(i))
+        await wait_for_sent(fake_sender, 100)
+        await outbox.stop_drainer()
+        backlog = outbox.backlog_bytes
+        await outbox.close()
+        return backlog
+    
+    assert asyncio.run(scenario()) == 0
+
+def test_append_is_rejected_when_backlog_is_full(tmp_path):
+    async def scenario():
+        outbox = EventOutbox(str(tmp_path), max_backlog_bytes=100)
+        await outbox.open()
+        await outbox.append(make_message(0, size=200))
+        with pytest.raises(OutboxFullError):
+            await outbox.append(make_message(1))
+        await outbox.close()
+    
+    asyncio.run(scenario())
+
+def test_commit_during_an_empty_read_wakes_the_drainer(tmp_path, fake_sender, monkeypatch):
+    async def scenario():
+        outbox = EventOutbox(str(tmp_path), fsync="never")
+        await outbox.open()
+        read_records = outbox._read_records
+        
+        def slow_read(limit):
+            records = read_records(limit)
+            time.sleep(0.05)
+            return records
+        
+        monkeypatch.setattr(outbox, "_read_records", slow_read)
+        await outbox.start_drainer(fake_sender)
+        await asyncio.sleep(0.01)
+        # Committed while the drainer's first read, which found nothing, is still running
+        await outbox.append(make_message(0))
+        await wait_for_sent(fake_sender, 1, timeout=1)
+        await outbox.close()
+    
+    asyncio.run(scenario())
+
+def test_closing_during_a_send_keeps_the_acknowledged_cursor(tmp_path):
+    class BusyExecutorSender(FakeServiceBusSender):
+        """Occupies the only executor thread as the send completes, so the cursor write queues"""
+        
+        async def send_messages(self, message, timeout=None):
+            await super().send_messages(message, timeout)
+            asyncio.get_running_loop().run_in_executor(None, time.sleep, 0.1)
+    
+    sender = BusyExecutorSender()
+    
+    async def run(start: int, count: int):
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(1))
+        outbox = EventOutbox(str(tmp_path))
+        await outbox.open()
+        for i in range(start, start + count):
+            await outbox.append(make_message(i))
+        await outbox.start_drainer(sender)
+        await wait_for_sent(sender, start + count)
+        await outbox.close()
+    
+    asyncio.run(run(0, 3))
+    asyncio.run(run(3, 2))
+    
+    assert sent_ids(sender) == [f"evt_{i}" for i in range(5)]
+
+def test_interval_policy_syncs_a_log_that_goes_idle(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd) or fsync(fd))
+    
+    async def scenario():
+        outbox = EventOutbox(str(tmp_path), fsync="interval", fsync_interval_ms=20)
+        await outbox.open()
+        await outbox.append(make_message(0))
+        await outbox.append(make_message(1))
+        assert outbox._unsynced
+        synced.clear()
+        await asyncio.sleep(0.1)
+        assert synced and not outbox._unsynced
+        await outbox.close()
+    
+    asyncio.run(scenario())
@@ -0,0 +1,100 @@
+"""
+Tests for the event loop saturation monitor and load shedding
+"""
+
+import asyncio
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from middleware.overload import LoadSheddingASGIMiddleware, SaturationMonitor
+
+async def ok(request):
+    return JSONResponse({"ok": True})
+
+def build_app(monitor):
+    app = Starlette(routes=[
+        Route("/events", ok, methods=["POST"]),
+        Route("/health", ok),
+    ])
+    return LoadSheddingASGIMiddleware(app, monitor, paths=["/events"], retry_after_seconds=2)
+
+def test_monitor_measures_how_late_the_loop_runs():
+    monitor = SaturationMonitor(interval_ms=10, smoothing=1.0)
+    
+    async def run():
+        await monitor.start()
+        await asyncio.sleep(0.03)
+        assert monitor.lag_seconds < 0.05
+        # Block the loop; the overdue wake-up counts before the sample is taken
+        time.sleep(0.15)
+        overdue = monitor.lag()
+        await asyncio.sleep(0.02)
+        await monitor.stop()
+        return overdue
+    
+    overdue = asyncio.run(run())
+    assert overdue >= 0.1
+    assert monitor.max_lag_seen_seconds >= 0.1
+    assert monitor.stats()["max_lag_seconds"] == monitor.max_lag_seen_seconds
+
+def test_events_are_shed_while_the_loop_lags():
+    monitor = SaturationMonitor(max_lag_ms=100)
+    client = TestClient(build_app(monitor))
+    
+    assert client.post("/events").status_code == 200
+    monitor.sample(0.5)
+    response = client.post("/events")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
+    assert response.json()["error"] == "Service overloaded"
+    # Only events are shed; health checks still answer
+    assert client.get("/health").status_code == 200
+    
+    for _ in range(10):
+        monitor.sample(0.0)
+    assert client.post("/events").status_code == 200
+    assert monitor.stats()["shed"] == 1
+    assert monitor.in_flight == 0
+
+def test_events_are_shed_over_the_in_flight_limit():
+    monitor = SaturationMonitor(max_in_flight=2)
+    release = asyncio.Event()
+    
+    async def slow(request):
+        await release.wait()
+        return JSONResponse({"ok": True})
+    
+    app = LoadSheddingASGIMiddleware(
+        Starlette(routes=[Route("/events", slow, methods=["POST"])]), monitor, paths=["/events"]
+    )
+    
+    async def call():
+        scope = {"type": "http", "method": "POST", "path": "/events", "headers": [], "query_string": b""}
+        statuses = []
+        
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+        
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+        
+        await app(scope, receive, send)
+        return statuses[0]
+    
+    async def run():
+        waiting = [asyncio.create_task(call()) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert monitor.in_flight == 2
+        rejected = await call()
+        release.set()
+        return rejected, await asyncio.gather(*waiting)
+    
+    rejected, accepted = asyncio.run(run())
+    assert rejected == 503
+    assert accepted == [200, 200]
+    assert monitor.in_flight == 0
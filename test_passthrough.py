@@ -0,0 +1,51 @@
+"""
+Tests for the raw-body passthrough of /events
+"""
+
+import json
+
+import pytest
+
+pytest.importorskip("msgspec")
+
+from main import EventPayload, build_service_bus_message
+from messaging import passthrough
+
+BODY = {
+    "event_type": "sensor_batch",
+    "data": {"readings": [{"sensor": f"s-{i}", "value": i / 8, "unit": "°C"} for i in range(100)]},
+    "source": "edge",
+    "correlation_id": "req-1",
+    "timestamp": "2024-01-01T12:00:00"
+}
+
+def message_body(message):
+    return b"".join(message.body)
+
+def test_data_bytes_are_spliced_in_unchanged():
+    raw = json.dumps(BODY, indent=1, ensure_ascii=False).encode('utf-8')
+    data_span = json.dumps(BODY["data"], indent=1, ensure_ascii=False).replace("\n", "\n ").encode('utf-8')
+    
+    message = build_service_bus_message(passthrough.parse_event(raw))
+    
+    assert data_span in message_body(message)
+
+def test_passthrough_body_matches_the_standard_path():
+    raw = json.dumps(BODY).encode('utf-8')
+    
+    standard = json.loads(message_body(build_service_bus_message(EventPayload(**BODY))))
+    spliced = json.loads(message_body(build_service_bus_message(passthrough.parse_event(raw))))
+    
+    for body in (standard, spliced):
+        body.pop("message_id")
+    assert spliced == standard
+
+@pytest.mark.parametrize("body", [
+    b'{"event_type": "x"}',
+    b'{"event_type": "x", "data": [1, 2]}',
+    b'{"event_type": 5, "data": {}}',
+    b'{"event_type": "x", "data": {"unterminated": }',
+])
+def test_invalid_payloads_are_rejected(body):
+    with pytest.raises(passthrough.PayloadError):
+        passthrough.parse_event(body)
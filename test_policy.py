@@ -0,0 +1,140 @@
+"""
+Tests for compiling and looking up security policies
+"""
+
+import asyncio
+import os
+
+import pytest
+
+from middleware.policy import (
+    NO_POLICY, CompiledPolicy, PolicyWatcher, RateLimitRule, parse_duration, parse_size
+)
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dpar-config.yaml")
+
+def policy(*rules_by_type):
+    return CompiledPolicy({"policies": [
+        {"type": policy_type, "rules": rules} for policy_type, rules in rules_by_type
+    ]})
+
+def test_repository_config_compiles():
+    compiled = CompiledPolicy.from_file(CONFIG_PATH)
+    
+    events = compiled.lookup("POST", "/events")
+    assert events.rate_limit == RateLimitRule(100, 60, 20)
+    assert events.auth_required and events.permission == "events:create"
+    assert events.max_payload_size == 1024 * 1024
+    
+    batch = compiled.lookup("POST", "/events/batch")
+    assert batch.permission == "events:batch"
+    assert batch.request_cost.bytes_per_unit == 256 * 1024
+    
+    assert compiled.lookup("POST", "/events/other").auth_required
+    assert not compiled.lookup("OPTIONS", "/events").auth_required
+    assert compiled.lookup("GET", "/health").rate_limit.limit == 1000
+
+def test_most_specific_rule_wins_per_policy_type():
+    compiled = policy(
+        ("auth", [
+            {"path": "*", "required": False},
+            {"path": "/api/*", "required": True},
+            {"path": "/api/public", "required": False},
+        ]),
+        ("rate-limit", [{"path": "/api/*", "limit": 10, "window": "1m"}]),
+    )
+    
+    assert compiled.lookup("GET", "/api/private").auth_required
+    public = compiled.lookup("GET", "/api/public")
+    assert not public.auth_required
+    # Inherited from the prefix rule, which no exact rule overrides
+    assert public.rate_limit == RateLimitRule(10, 60)
+    assert compiled.lookup("GET", "/other") == NO_POLICY
+
+def test_exact_rate_limit_without_a_cost_is_not_weighted_by_a_prefix_rule():
+    compiled = policy(("rate-limit", [
+        {"path": "/events*", "limit": 10, "window": "1m",
+         "cost": {"events_per_unit": 100, "bytes_per_unit": "256KB"}},
+        {"path": "/events/ping", "limit": 50, "window": "1m"},
+    ]))
+    
+    assert compiled.lookup("POST", "/events/batch").request_cost.events_per_unit == 100
+    ping = compiled.lookup("POST", "/events/ping")
+    assert ping.rate_limit == RateLimitRule(50, 60)
+    assert ping.request_cost is None
+
+def test_method_specific_rules_override_any_method():
+    compiled = policy(("rate-limit", [
+        {"path": "/items", "limit": 100, "window": 60},
+        {"path": "/items", "method": "POST", "limit": 5, "window": 60},
+    ]))
+    
+    assert compiled.lookup("GET", "/items").rate_limit.limit == 100
+    assert compiled.lookup("POST", "/items").rate_limit.limit == 5
+    assert compiled.lookup("GET", "/items/1") == NO_POLICY
+
+def test_inner_policy_document_can_be_loaded_directly(tmp_path):
+    path = tmp_path / "security-policies.yaml"
+    path.write_text('policies:\n  - type: "auth"\n    rules:\n      - path: "/x"\n        required: true\n')
+    
+    assert CompiledPolicy.from_file(str(path)).lookup("GET", "/x").auth_required
+
+@pytest.mark.parametrize("value, expected", [(512, 512), ("256KB", 262144), ("1MB", 1048576), ("1.5kb", 1536)])
+def test_parse_size(value, expected):
+    assert parse_size(value) == expected
+
+@pytest.mark.parametrize("value, expected", [(60, 60), ("30s", 30), ("1m", 60), ("2h", 7200)])
+def test_parse_duration(value, expected):
+    assert parse_duration(value) == expected
+
+def test_invalid_quantities_are_rejected():
+    with pytest.raises(ValueError):
+        parse_duration("soon")
+
+def write_policy(path, limit, mtime):
+    path.write_text(
+        "policies:\n"
+        "  - type: rate-limit\n"
+        "    rules:\n"
+        f"      - {{path: /events, limit: {limit}, window: 1m}}\n"
+    )
+    os.utime(path, (mtime, mtime))
+
+def test_watcher_reloads_changed_files_and_keeps_the_last_good_policy(tmp_path):
+    path = tmp_path / "policies.yaml"
+    write_policy(path, 10, mtime=1000)
+    applied = []
+    watcher = PolicyWatcher(str(path), applied.append)
+    
+    async def run():
+        unchanged = await watcher.check()
+        write_policy(path, 20, mtime=2000)
+        changed = await watcher.check()
+        path.write_text("policies: [")
+        os.utime(path, (3000, 3000))
+        broken = await watcher.check()
+        path.unlink()
+        removed = await watcher.check()
+        return unchanged, changed, broken, removed
+    
+    assert asyncio.run(run()) == (False, True, False, False)
+    assert [p.lookup("POST", "/events").rate_limit.limit for p in applied] == [20]
+    assert (watcher.reloads, watcher.failures) == (1, 1)
+
+def test_watcher_polls_in_the_background(tmp_path):
+    path = tmp_path / "policies.yaml"
+    write_policy(path, 10, mtime=1000)
+    applied = []
+    watcher = PolicyWatcher(str(path), applied.append, interval_ms=10)
+    
+    async def run():
+        await watcher.start()
+        write_policy(path, 30, mtime=2000)
+        for _ in range(100):
+            if applied:
+                break
+            await asyncio.sleep(0.01)
+        await watcher.stop()
+    
+    asyncio.run(run())
+    assert applied[0].lookup("POST", "/events").rate_limit.limit == 30
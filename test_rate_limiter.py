@@ -0,0 +1,98 @@
+"""
+Tests for the GCRA rate limiter
+"""
+
+import asyncio
+
+import pytest
+
+from middleware import security
+from middleware.security import RateLimiter
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(security.time, "monotonic", lambda: now[0])
+    return now
+
+def allowed(limiter, count, **kwargs):
+    async def run():
+        return sum([await limiter.is_allowed("10.0.0.1", "/events", **kwargs) for _ in range(count)])
+    return asyncio.run(run())
+
+def test_burst_is_allowed_then_requests_are_spaced_at_the_rate(clock):
+    limiter = RateLimiter()
+    
+    assert allowed(limiter, 30, limit=100, window_seconds=60, burst=20) == 20
+    
+    clock[0] += 0.6
+    assert allowed(limiter, 5, limit=100, window_seconds=60, burst=20) == 1
+
+def test_without_burst_the_whole_limit_is_available_at_once(clock):
+    limiter = RateLimiter()
+    
+    assert allowed(limiter, 150, limit=100, window_seconds=60) == 100
+    
+    clock[0] += 60
+    assert allowed(limiter, 150, limit=100, window_seconds=60) == 100
+
+def test_state_is_one_timestamp_per_key(clock):
+    limiter = RateLimiter()
+    
+    allowed(limiter, 1000, limit=10000, window_seconds=60)
+    asyncio.run(limiter.is_allowed("10.0.0.2", "/events", 10000, 60))
+    
+    assert limiter.stats()["keys"] == 2
+    assert isinstance(limiter.backend.requests.get("10.0.0.1:/events", clock[0]), float)
+
+def test_idle_keys_expire_once_refilled(clock):
+    limiter = RateLimiter()
+    allowed(limiter, 5, limit=100, window_seconds=60, burst=20)
+    
+    clock[0] += 5
+    asyncio.run(limiter.is_allowed("10.0.0.2", "/health", 1000, 60))
+    
+    assert limiter.stats()["keys"] == 1
+    assert limiter.stats()["key_expirations"] == 1
+
+def test_least_recently_seen_clients_are_evicted(clock):
+    limiter = RateLimiter(max_keys=3)
+    
+    for i in range(5):
+        asyncio.run(limiter.is_allowed(f"10.0.0.{i}", "/events", 100, 60))
+    
+    assert limiter.stats()["keys"] == 3
+    assert limiter.stats()["key_evictions"] == 2
+
+def test_ip_blocks_lift_after_their_duration(clock):
+    limiter = RateLimiter()
+    limiter.block_ip("10.0.0.1", duration_minutes=1)
+    
+    assert limiter.is_ip_blocked("10.0.0.1")
+    clock[0] += 59
+    assert limiter.is_ip_blocked("10.0.0.1")
+    clock[0] += 1
+    assert not limiter.is_ip_blocked("10.0.0.1")
+    
+    clock[0] += 1
+    limiter.is_ip_blocked("10.0.0.2")
+    assert limiter.stats()["blocked_ips"] == 0
+
+def test_costly_requests_take_several_permits(clock):
+    limiter = RateLimiter()
+    
+    assert allowed(limiter, 3, limit=100, window_seconds=60, burst=20, cost=8) == 2
+    
+    asyncio.run(limiter.refund("10.0.0.1", "/events", 100, 60, cost=8))
+    assert allowed(limiter, 1, limit=100, window_seconds=60, burst=20, cost=8) == 1
+
+def test_requests_larger_than_the_burst_run_the_bucket_into_debt(clock):
+    limiter = RateLimiter()
+    
+    assert allowed(limiter, 1, limit=10, window_seconds=60, burst=5, cost=20) == 1
+    
+    # 20 units at 6 s each, minus the 4 the burst allows ahead
+    clock[0] += 95
+    assert allowed(limiter, 1, limit=10, window_seconds=60, burst=5) == 0
+    clock[0] += 1
+    assert allowed(limiter, 1, limit=10, window_seconds=60, burst=5) == 1
@@ -0,0 +1,69 @@
+"""
+Tests for the Service Bus send retry policy and retry budget
+"""
+
+import asyncio
+
+import pytest
+from azure.servicebus.exceptions import MessageSizeExceededError, ServiceBusServerBusyError
+
+from messaging.retry import RetryBudget, RetryPolicy
+
+def flaky(failures: int, error=None):
+    calls = []
+    
+    async def operation():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error or ServiceBusServerBusyError(message="server busy")
+        return "sent"
+    return operation, calls
+
+def test_transient_errors_are_retried_until_success():
+    policy = RetryPolicy(max_attempts=3, base_delay_ms=1)
+    operation, calls = flaky(2)
+    
+    assert asyncio.run(policy.call(operation)) == "sent"
+    assert len(calls) == 3
+    assert policy.retries == 2
+    assert policy.retry_seconds > 0
+
+def test_gives_up_after_max_attempts():
+    policy = RetryPolicy(max_attempts=2, base_delay_ms=1)
+    operation, calls = flaky(5)
+    
+    with pytest.raises(ServiceBusServerBusyError):
+        asyncio.run(policy.call(operation))
+    assert len(calls) == 2
+    assert policy.exhausted == 1
+
+def test_permanent_errors_are_not_retried():
+    policy = RetryPolicy(max_attempts=5, base_delay_ms=1)
+    operation, calls = flaky(1, MessageSizeExceededError(message="too large"))
+    
+    with pytest.raises(MessageSizeExceededError):
+        asyncio.run(policy.call(operation))
+    assert len(calls) == 1
+
+def test_budget_caps_retries_during_a_brownout():
+    budget = RetryBudget(ratio=0.1, min_per_second=0, max_tokens=2)
+    policy = RetryPolicy(max_attempts=5, base_delay_ms=0, budget=budget)
+    
+    async def brownout():
+        for _ in range(10):
+            operation, _ = flaky(100)
+            with pytest.raises(ServiceBusServerBusyError):
+                await policy.call(operation)
+    
+    asyncio.run(brownout())
+    
+    # Two stored tokens plus 0.1 per call: far fewer than the 40 retries max_attempts would allow
+    assert policy.retries <= 3
+    assert policy.budget_rejections >= 7
+
+def test_full_jitter_stays_within_the_capped_delay():
+    policy = RetryPolicy(base_delay_ms=100, max_delay_ms=300)
+    
+    delays = [policy.backoff(attempt) for attempt in range(6) for _ in range(50)]
+    
+    assert all(0 <= delay <= 0.3 for delay in delays)
@@ -0,0 +1,289 @@
+"""
+Tests for request validation in the security middleware
+"""
+
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from middleware.apikeys import APIKey, hash_api_key
+from middleware.policy import CompiledPolicy, RateLimitRule
+from middleware.security import API_KEY_SALT, SecurityASGIMiddleware, SecurityMiddleware
+
+def make_request(
+    path: str,
+    api_key: str = None,
+    client_ip: str = "203.0.113.7",
+    content_length: int = None,
+    forwarded_for: str = None
+) -> Request:
+    headers = [(b"content-type", b"application/json")]
+    if forwarded_for:
+        headers.append((b"x-forwarded-for", forwarded_for.encode()))
+    if api_key:
+        headers.append((b"x-api-key", api_key.encode()))
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "headers": headers,
+        "query_string": b"",
+        "client": (client_ip, 50000),
+        "server": ("testserver", 80),
+        "scheme": "http"
+    })
+
+def tenant_key(tenant: str, limit: int = 5) -> APIKey:
+    return APIKey(
+        tenant,
+        hash_api_key(tenant, API_KEY_SALT),
+        frozenset({"events:create"}),
+        {"/events": RateLimitRule(limit, 60)}
+    )
+
+def tenant_middleware() -> SecurityMiddleware:
+    middleware = SecurityMiddleware()
+    middleware.apply_api_keys(middleware.api_key_validator.keys + [tenant_key("tenant-a"), tenant_key("tenant-b")])
+    return middleware
+
+def with_client(app, client_ip: str = "203.0.113.7"):
+    """The test client has no IP address, which the ip-filter policy turns away"""
+    async def wrapped(scope, receive, send):
+        scope["client"] = (client_ip, 50000)
+        await app(scope, receive, send)
+    return wrapped
+
+def outcomes(middleware, count, **kwargs):
+    async def run():
+        return [(await middleware.validate_request(make_request("/events", **kwargs).scope))[1] for _ in range(count)]
+    return asyncio.run(run())
+
+def test_each_api_key_is_limited_by_its_own_config():
+    middleware = tenant_middleware()
+    
+    assert outcomes(middleware, 7, api_key="tenant-a") == [None] * 5 + ["Rate limit exceeded"] * 2
+
+def test_tenants_behind_one_ip_do_not_share_a_budget():
+    middleware = tenant_middleware()
+    outcomes(middleware, 10, api_key="tenant-a")
+    
+    assert outcomes(middleware, 5, api_key="tenant-b") == [None] * 5
+    assert not middleware.rate_limiter.is_ip_blocked("203.0.113.7")
+
+def test_requests_without_a_keyed_limit_use_the_ip_limit():
+    middleware = tenant_middleware()
+    
+    results = outcomes(middleware, 21, api_key="unknown-key")
+    
+    # /events allows bursts of 20 per IP
+    assert results == ["Invalid API key"] * 20 + ["Rate limit exceeded"]
+    assert middleware.rate_limiter.is_ip_blocked("203.0.113.7")
+
+def test_batches_are_charged_by_size_and_event_count():
+    middleware = SecurityMiddleware()
+    
+    async def run():
+        # The key allows 10 units a minute; 1 MB costs 4 of them up front
+        large = make_request("/events/batch", api_key="dev-api-key-123", content_length=1024 * 1024)
+        assert await middleware.validate_request(large.scope) == (True, None)
+        assert large.state.rate_limit["cost"] == 4
+        # 1000 events cost 10, so 6 more are charged once the body is parsed
+        assert await middleware.charge_events(large, 1000)
+        assert large.state.rate_limit["cost"] == 10
+        
+        small = make_request("/events/batch", api_key="dev-api-key-123", content_length=100)
+        return await middleware.validate_request(small.scope)
+    
+    assert asyncio.run(run()) == (False, "Rate limit exceeded")
+
+def test_rejected_batches_are_refunded():
+    middleware = SecurityMiddleware()
+    
+    async def run():
+        for _ in range(3):
+            request = make_request("/events/batch", api_key="dev-api-key-123", content_length=1024 * 1024)
+            assert await middleware.validate_request(request.scope) == (True, None)
+            await middleware.refund(request.scope)
+    
+    asyncio.run(run())
+
+def test_asgi_middleware_adds_headers_and_short_circuits_rejections():
+    calls = []
+    
+    async def health(request):
+        calls.append(request.url.path)
+        return JSONResponse({"status": "healthy"})
+    
+    app = SecurityASGIMiddleware(Starlette(routes=[Route("/health", health)]), SecurityMiddleware())
+    client = TestClient(with_client(app))
+    
+    response = client.get("/health")
+    assert response.headers["x-frame-options"] == "DENY"
+    assert response.headers["strict-transport-security"].startswith("max-age=")
+    
+    response = client.post("/events", headers={"Content-Type": "application/json"})
+    assert response.status_code == 401
+    assert response.json()["message"] == "API key required"
+    assert calls == ["/health"]
+
+def test_asgi_middleware_refunds_requests_the_app_turns_away():
+    async def unavailable(request):
+        return JSONResponse({"detail": "Service Bus connection not available"}, status_code=503)
+    
+    security = SecurityMiddleware()
+    app = SecurityASGIMiddleware(Starlette(routes=[Route("/events/batch", unavailable, methods=["POST"])]), security)
+    client = TestClient(with_client(app))
+    
+    # 4 MB costs 16 units against the key's 10 a minute; refunds keep the bucket full
+    statuses = [
+        client.post(
+            "/events/batch",
+            headers={"X-API-Key": "dev-api-key-123", "Content-Type": "application/json"},
+            content=b"x" * 4 * 1024 * 1024
+        ).status_code
+        for _ in range(3)
+    ]
+    
+    assert statuses == [503, 503, 503]
+
+def test_validation_rejections_use_matching_status_codes():
+    app = SecurityASGIMiddleware(Starlette(), SecurityMiddleware())
+    client = TestClient(with_client(app))
+    headers = {"X-API-Key": "dev-api-key-123"}
+    
+    assert client.post("/events", headers=headers, content=b"{}").status_code == 400
+    assert client.post("/events", headers={**headers, "Content-Type": "text/plain"}, content=b"{}").status_code == 415
+    assert client.post(
+        "/events", headers={**headers, "Content-Type": "application/json"}, content=b"x" * (2 * 1024 * 1024)
+    ).status_code == 413
+
+def rate_limit_policy(limits):
+    return CompiledPolicy({"policies": [{"type": "rate-limit", "rules": [
+        {"path": path, "limit": limit, "window": "1m"} for path, limit in limits.items()
+    ]}]})
+
+def test_reloads_keep_limiter_state_unless_the_limit_changed():
+    middleware = tenant_middleware()
+    middleware.policy = rate_limit_policy({"/a": 2, "/b": 2})
+    
+    async def run(path, count, **kwargs):
+        return [
+            (await middleware.validate_request(make_request(path, **kwargs).scope))[0]
+            for _ in range(count)
+        ]
+    
+    async def scenario():
+        await run("/a", 2)
+        await run("/b", 2)
+        await run("/events", 5, api_key="tenant-a")
+        middleware.apply_policy(rate_limit_policy({"/a": 3, "/b": 2}))
+        return await run("/a", 3), await run("/events", 1, api_key="tenant-a"), await run("/b", 1)
+    
+    changed, keyed, unchanged = asyncio.run(scenario())
+    assert changed == [True, True, True]
+    assert keyed == [False]
+    assert unchanged == [False]
+
+def test_ip_filter_uses_the_client_behind_trusted_proxies(monkeypatch):
+    middleware = SecurityMiddleware()
+    middleware.policy = CompiledPolicy({"policies": [{"type": "ip-filter", "rules": [
+        {"path": "/events*", "allowed_ips": ["198.51.100.0/24"], "blocked_ips": ["198.51.100.66"]}
+    ]}]})
+    monkeypatch.setattr("middleware.security.TRUSTED_PROXY_DEPTH", 1)
+    
+    def error(**kwargs):
+        return asyncio.run(middleware.validate_request(make_request("/events/batch", **kwargs).scope))[1]
+    
+    allowed = error(client_ip="10.0.0.1", forwarded_for="203.0.113.9, 198.51.100.7")
+    assert allowed != "IP address not allowed"
+    assert error(client_ip="10.0.0.1", forwarded_for="198.51.100.7, 203.0.113.9") == "IP address not allowed"
+    assert error(client_ip="10.0.0.1", forwarded_for="198.51.100.66") == "IP address not allowed"
+    assert error(client_ip="198.51.100.7") != "IP address not allowed"
+
+def test_verified_key_is_attached_to_the_request():
+    middleware = tenant_middleware()
+    request = make_request("/events", api_key="tenant-a")
+    
+    assert asyncio.run(middleware.validate_request(request.scope)) == (True, None)
+    assert request.state.api_key.key_id == "tenant-a"
+    assert "events:create" in request.state.api_key.permissions
+    
+    request = make_request("/events", api_key="tenant-c")
+    assert asyncio.run(middleware.validate_request(request.scope)) == (False, "Invalid API key")
+    assert request.state.api_key is None
+
+def test_key_reloads_reset_only_buckets_whose_limit_changed():
+    middleware = tenant_middleware()
+    outcomes(middleware, 5, api_key="tenant-a")
+    outcomes(middleware, 5, api_key="tenant-b")
+    
+    middleware.apply_api_keys([tenant_key("tenant-a"), tenant_key("tenant-b", limit=6)])
+    
+    assert outcomes(middleware, 1, api_key="tenant-a") == ["Rate limit exceeded"]
+    assert outcomes(middleware, 6, api_key="tenant-b") == [None] * 6
+    assert outcomes(middleware, 1, api_key="dev-api-key-123") == ["Invalid API key"]
+
+def test_development_keys_are_refused_outside_development(monkeypatch):
+    monkeypatch.setattr("middleware.security.ENVIRONMENT", "production")
+    
+    with pytest.raises(RuntimeError, match="API_KEYS_FILE must be set"):
+        SecurityMiddleware()
+
+def test_development_keys_are_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("API_KEY_DEV", "local-dev-key")
+    validator = SecurityMiddleware().api_key_validator
+    
+    assert validator.validate_key("local-dev-key")[1].key_id == "dev"
+    assert validator.validate_key("dev-api-key-123") == (False, None)
+    assert validator.validate_key("monitoring-key-456")[1].key_id == "monitoring"
+
+def test_requests_failing_validation_are_not_charged():
+    middleware = SecurityMiddleware()
+    
+    async def run():
+        # More than the key's 100 a minute
+        for _ in range(150):
+            request = make_request("/events", api_key="dev-api-key-123", content_length=10 * 1024 * 1024)
+            assert await middleware.validate_request(request.scope) == (False, "Payload too large")
+        request = make_request("/events", api_key="dev-api-key-123", content_length=100)
+        return await middleware.validate_request(request.scope)
+    
+    assert asyncio.run(run()) == (True, None)
+
+def test_invalid_content_length_is_a_bad_request():
+    app = SecurityASGIMiddleware(Starlette(), SecurityMiddleware())
+    request = make_request("/events", api_key="dev-api-key-123")
+    request.scope["headers"].append((b"content-length", b"12abc"))
+    
+    async def run():
+        sent = []
+        
+        async def send(message):
+            sent.append(message)
+        
+        await app(request.scope, None, send)
+        return sent[0]["status"]
+    
+    assert asyncio.run(run()) == 400
+
+def test_a_weighted_request_leaving_the_ip_bucket_in_debt_does_not_block_the_ip():
+    middleware = SecurityMiddleware()
+    
+    async def run():
+        # No key: charged to the IP, 4 MB is 16 units against a burst of 5
+        results = [
+            await middleware.validate_request(make_request("/events/batch", content_length=4 * 1024 * 1024).scope)
+            for _ in range(2)
+        ]
+        return results, middleware.rate_limiter.is_ip_blocked("203.0.113.7")
+    
+    results, blocked = asyncio.run(run())
+    assert results[1] == (False, "Rate limit exceeded")
+    assert not blocked
@@ -0,0 +1,54 @@
+"""
+Tests for the pluggable JSON serializer backends
+"""
+
+import json
+from datetime import datetime
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+from messaging import serialization
+
+EVENT = {
+    "event_type": "user_action",
+    "data": {"user_id": "user-123", "amount": 99.99, "tags": ["a", "b"], "nested": {"ok": True}},
+    "source": None,
+    "timestamp": datetime(2024, 1, 1, 12, 30, 45, 123456)
+}
+
+@pytest.mark.parametrize("backend", list(serialization.BACKENDS))
+def test_backends_write_bytes_with_iso_datetimes(backend):
+    encoded = serialization.BACKENDS[backend](EVENT)
+    
+    assert isinstance(encoded, bytes)
+    assert json.loads(encoded) == dict(EVENT, timestamp="2024-01-01T12:30:45.123456")
+
+def test_stdlib_fallback_is_always_available():
+    assert "json" in serialization.BACKENDS
+    assert serialization.loads(serialization.dumps(EVENT))["timestamp"] == "2024-01-01T12:30:45.123456"
+
+@pytest.mark.parametrize("backend", list(serialization.BACKENDS))
+def test_integers_beyond_64_bits_are_encoded(backend):
+    encoded = serialization.BACKENDS[backend]({"data": {"n": 2 ** 70, "m": -(2 ** 64)}})
+    
+    assert json.loads(encoded) == {"data": {"n": 2 ** 70, "m": -(2 ** 64)}}
+
+def test_event_with_a_large_integer_is_sent(monkeypatch, fake_sender):
+    monkeypatch.setattr(main, "service_bus_client", object())
+    monkeypatch.setattr(main, "service_bus_sender", fake_sender)
+    
+    async def app(scope, receive, send):
+        # The test client has no IP address, which the ip-filter policy turns away
+        scope["client"] = ("203.0.113.7", 50000)
+        await main.app(scope, receive, send)
+    
+    response = TestClient(app).post(
+        "/events",
+        content=b'{"event_type": "metric", "data": {"n": 1180591620717411303424}}',
+        headers={"X-API-Key": "dev-api-key-123", "Content-Type": "application/json"}
+    )
+    
+    assert response.status_code == 200
+    assert json.loads(b"".join(fake_sender.sent_messages[0].body))["data"]["n"] == 2 ** 70
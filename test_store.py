@@ -0,0 +1,61 @@
+"""
+Tests for the bounded expiring store behind the rate limiter
+"""
+
+from middleware.store import ExpiringLRU
+
+def test_expired_entries_are_not_returned():
+    store = ExpiringLRU(max_keys=10)
+    store.set("a", 1, expires_at=100.5)
+    
+    assert store.get("a", 100.0) == 1
+    assert store.get("a", 100.5) is None
+    assert store.get("a", 101.0) is None
+    assert store.stats() == {"live_keys": 0, "evictions": 0, "expirations": 1}
+
+def test_wheel_removes_entries_that_are_never_read_again():
+    store = ExpiringLRU(max_keys=1000, wheel_slots=8)
+    store.get("warmup", 0.0)
+    for i in range(100):
+        store.set(f"k{i}", i, expires_at=i / 10)
+    # Beyond the horizon: survives a full revolution and is swept on a later one
+    store.set("long", True, expires_at=20.5)
+    
+    store.get("other", 11.0)
+    assert store.live_keys == 1
+    
+    store.get("other", 21.0)
+    assert store.live_keys == 0
+    assert store.stats()["expirations"] == 101
+
+def test_updates_move_entries_between_slots():
+    store = ExpiringLRU(max_keys=10, wheel_slots=8)
+    store.get("warmup", 0.0)
+    store.set("a", 1, expires_at=1.5)
+    store.set("a", 2, expires_at=5.5)
+    
+    store.get("other", 3.0)
+    
+    assert store.get("a", 3.0) == 2
+
+def test_least_recently_used_key_is_evicted():
+    store = ExpiringLRU(max_keys=2)
+    store.set("a", 1, expires_at=100)
+    store.set("b", 2, expires_at=100)
+    store.get("a", 0)
+    store.set("c", 3, expires_at=100)
+    
+    assert store.get("b", 0) is None
+    assert store.get("a", 0) == 1
+    assert store.stats()["evictions"] == 1
+
+def test_discard_matching_removes_entries_and_their_slots():
+    store = ExpiringLRU(max_keys=10, wheel_slots=8)
+    for key in ("a:/x", "b:/x", "a:/y"):
+        store.set(key, 1, expires_at=5.0)
+    
+    assert store.discard_matching(lambda key: key.endswith(":/x")) == 2
+    assert store.get("a:/y", 0.0) == 1
+    assert store.get("a:/x", 0.0) is None
+    store.get("a:/y", 6.0)
+    assert store.stats() == {"live_keys": 0, "evictions": 0, "expirations": 1}
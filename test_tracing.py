@@ -0,0 +1,86 @@
+"""
+Tests for OpenTelemetry spans and trace context propagation to Service Bus
+"""
+
+import pytest
+
+pytest.importorskip("opentelemetry.sdk")
+
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor  # noqa: E402
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter  # noqa: E402
+from starlette.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from middleware import tracing  # noqa: E402
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+EVENT = {"event_type": "user_action", "data": {"user_id": "123"}}
+
+@pytest.fixture
+def traced_app(monkeypatch, fake_sender):
+    exporter = InMemorySpanExporter()
+    tracing.configure(span_processor=SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(main, "service_bus_client", object())
+    monkeypatch.setattr(main, "service_bus_sender", fake_sender)
+    
+    async def app(scope, receive, send):
+        # The test client has no IP address, which the ip-filter policy turns away
+        scope["client"] = ("203.0.113.7", 50000)
+        await main.app(scope, receive, send)
+    
+    yield TestClient(app), exporter, fake_sender
+    tracing.shutdown()
+
+def post_event(client, **headers):
+    return client.post("/events", json=EVENT, headers={"X-API-Key": "dev-api-key-123", **headers})
+
+def test_request_stages_are_traced_and_the_context_reaches_the_message(traced_app):
+    client, exporter, sender = traced_app
+    
+    response = post_event(client, traceparent=f"00-{TRACE_ID}-00f067aa0ba902b7-01")
+    assert response.status_code == 200
+    
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    server = spans["POST /events"]
+    assert format(server.context.trace_id, "032x") == TRACE_ID
+    assert server.attributes["http.status_code"] == 200
+    for stage in ("security_check", "validate_payload", "servicebus.send"):
+        assert spans[stage].parent.span_id == server.context.span_id
+    assert spans["security_check"].end_time <= spans["validate_payload"].start_time
+    
+    traceparent = sender.sent_messages[0].application_properties["traceparent"]
+    assert traceparent.startswith(f"00-{TRACE_ID}-")
+    assert traceparent.endswith("-01")
+
+def test_server_spans_are_named_by_route_not_raw_path(traced_app):
+    client, exporter, _ = traced_app
+    
+    post_event(client)
+    client.get("/wp-login.php")
+    
+    servers = [span for span in exporter.get_finished_spans() if span.attributes.get("http.target")]
+    assert [(span.name, span.attributes["http.target"]) for span in servers] == [
+        ("POST /events", "/events"),
+        ("GET", "/wp-login.php"),
+    ]
+    assert servers[0].attributes["http.route"] == "/events"
+
+def test_new_traces_are_sampled_by_ratio_but_callers_decisions_are_kept(traced_app):
+    client, exporter, sender = traced_app
+    tracing.configure(sample_ratio=0.0, span_processor=SimpleSpanProcessor(exporter))
+    
+    post_event(client)
+    assert exporter.get_finished_spans() == ()
+    # Unsampled context is still passed on, so consumers make the same decision
+    assert sender.sent_messages[0].application_properties["traceparent"].endswith("-00")
+    
+    post_event(client, traceparent=f"00-{TRACE_ID}-00f067aa0ba902b7-01")
+    assert "servicebus.send" in {span.name for span in exporter.get_finished_spans()}
+
+def test_tracing_is_off_until_configured(fake_sender):
+    tracing.shutdown()
+    message = main.build_service_bus_message(main.EventPayload(**EVENT))
+    
+    assert "traceparent" not in message.application_properties
+    with tracing.span("anything") as span:
+        assert span is None